@@ -0,0 +1 @@
+"""Benchmarks reproducibles del pipeline con datos sintéticos y backends en memoria."""
@@ -0,0 +1,263 @@
+"""
+Sustitutos en memoria de InfluxDB y PostgreSQL para los benchmarks.
+
+``InMemoryDataManager`` hereda de DataManager y sólo reemplaza la capa de
+conexión: las consultas Flux se responden con CSV anotado generado a partir
+de un SyntheticDataset (de modo que el decodificador real se incluye en las
+medidas) y las inserciones se guardan en listas en memoria con ids
+consecutivos. La validación, la construcción de filas y el resto de la
+lógica de DataManager son los de producción.
+"""
+import re
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from msTools.codeid_registry import CodeIDRegistry
+from msTools.data_manager import SEGMENT_COLUMNS, DataManager
+from msTools.timeutils import ensure_utc, to_naive_utc
+
+from benchmarks.synthetic import AXES, SyntheticDataset
+
+# Parámetros de detección del config.yaml del repositorio
+DEFAULT_CONFIG = {
+    "influxdb": {"org": "bench", "bucket": "bench/autogen", "measurement": "sensoria",
+                 "url": "memory://", "token": "", "timeout": 0},
+    "postgresql": {"host": "memory", "user": "", "password": "", "database": "bench"},
+    "movement": {
+        "accel_threshold": 0.2,
+        "gyro_threshold": 60,
+        "accel_power_threshold": 0.125,
+        "gyro_power_threshold": 1000,
+        "freq_band_min": 0.4,
+        "freq_band_max": 1.6,
+        "min_continuous_hits": 3,
+    },
+}
+
+_FLUX_TYPES = {"f": "double", "i": "long", "u": "unsignedLong", "b": "boolean"}
+
+
+def to_flux_csv(tables: Sequence[pd.DataFrame], group: Sequence[str]) -> bytes:
+    """
+    Serializa DataFrames (uno por tabla Flux) como el CSV anotado de query_raw.
+
+    :param tables: Tablas a serializar; las fechas deben tener zona horaria.
+    :param group: Columnas del group key.
+    :return: Respuesta CSV con anotaciones datatype, group y default.
+    :rtype: bytes
+    """
+    blocks = []
+    for k, df in enumerate(t for t in tables if not t.empty):
+        df = df.copy()
+        types = []
+        for c in df.columns:
+            if isinstance(df[c].dtype, pd.DatetimeTZDtype):
+                types.append("dateTime:RFC3339Nano")
+                df[c] = df[c].dt.tz_convert("UTC").dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            else:
+                types.append(_FLUX_TYPES.get(df[c].dtype.kind, "string"))
+        columns = list(df.columns)
+        lines = [
+            "#datatype,string,long," + ",".join(types),
+            "#group,false,false," + ",".join("true" if c in group else "false" for c in columns),
+            "#default,_result,," + "," * (len(columns) - 1),
+            ",result,table," + ",".join(columns),
+        ]
+        df.insert(0, "table", k)
+        df.insert(0, "result", "")
+        df.insert(0, "", "")
+        body = df.to_csv(index=False, header=False, lineterminator="\r\n")
+        blocks.append("\r\n".join(lines) + "\r\n" + body)
+    return "\r\n".join(blocks).encode("utf-8")
+
+
+class _Record:
+    """Registro con la interfaz mínima de FluxRecord (``values``)."""
+    __slots__ = ("values",)
+
+    def __init__(self, values: Dict) -> None:
+        self.values = values
+
+
+class InMemoryQueryApi:
+    """
+    Responde las consultas Flux de CodeIDProcessor y MovementDetector a partir
+    de un SyntheticDataset. Las respuestas se memorizan por consulta, de modo
+    que generar el CSV no cuenta en las repeticiones de un benchmark.
+    """
+
+    _RANGE = re.compile(r"range\(start:\s*([^,]+),\s*stop:\s*([^)]+)\)")
+    _TAG = re.compile(r'r\["(CodeID|Foot)"\]\s*==\s*"([^"]+)"')
+    _EVERY = re.compile(r"window\(every:\s*(\w+)\)")
+
+    def __init__(self, dataset: SyntheticDataset) -> None:
+        self.dataset = dataset
+        self._responses: Dict[str, bytes] = {}
+
+    def _frame(self, query: str) -> pd.DataFrame:
+        start, stop = (pd.Timestamp(v.strip()) for v in self._RANGE.search(query).groups())
+        tags = dict(self._TAG.findall(query))
+        if "aggregateWindow" in query:
+            codeids = [tags["CodeID"]] if "CodeID" in tags else None
+            counts = self.dataset.minute_counts(codeids, start, stop)
+            return counts[["_time", "CodeID", "_field", "_value", "Foot", "mac", "DeviceName"]]
+        leg = self.dataset.leg(tags["CodeID"], tags["Foot"], start, stop)
+        if "reduce(" in query:
+            # Pre-screen: window() + reduce() de n y extremos de |a| y |g|
+            every = pd.Timedelta(self._EVERY.search(query).group(1))
+            a = np.sqrt(leg["Ax"] * leg["Ax"] + leg["Ay"] * leg["Ay"] + leg["Az"] * leg["Az"])
+            g = np.sqrt(leg["Gx"] * leg["Gx"] + leg["Gy"] * leg["Gy"] + leg["Gz"] * leg["Gz"])
+            bucket = leg["_time"].dt.floor(every)
+            agg = pd.DataFrame({"a": a, "g": g}).groupby(bucket.to_numpy()).agg(
+                n=("a", "size"), a_max=("a", "max"), a_min=("a", "min"), g_max=("g", "max"))
+            starts = pd.DatetimeIndex(agg.index)
+            return pd.DataFrame({
+                "_start": starts.where(starts > start, start),
+                "_stop": (starts + every).where(starts + every < stop, stop),
+                "n": agg["n"].to_numpy(), "a_max": agg["a_max"].to_numpy(),
+                "a_min": agg["a_min"].to_numpy(), "g_max": agg["g_max"].to_numpy(),
+            })
+        if "math.sqrt" in query:
+            # map() + keep() de server_magnitude
+            return pd.DataFrame({
+                "_time": leg["_time"],
+                "a_mag": np.sqrt(leg["Ax"] * leg["Ax"] + leg["Ay"] * leg["Ay"] + leg["Az"] * leg["Az"]),
+                "g_mag": np.sqrt(leg["Gx"] * leg["Gx"] + leg["Gy"] * leg["Gy"] + leg["Gz"] * leg["Gz"]),
+            })
+        leg.insert(0, "_start", start)
+        leg.insert(1, "_stop", stop)
+        return leg[["_start", "_stop", "_time", "CodeID", "Foot", *AXES]]
+
+    def query_raw(self, query: str, org: Optional[str] = None, dialect=None) -> bytes:
+        if query not in self._responses:
+            df = self._frame(query)
+            if "aggregateWindow" in query:
+                tables = [g for _, g in df.groupby(["CodeID", "Foot", "DeviceName"], sort=True)]
+                group = ["CodeID", "Foot", "DeviceName", "_field"]
+            else:
+                tables = [df]
+                # Tras group() (pre-screen) o keep() (magnitudes) no queda group key
+                group = [] if "reduce(" in query else \
+                    [c for c in ("_start", "_stop", "CodeID", "Foot") if c in df.columns]
+            self._responses[query] = to_flux_csv(tables, group)
+        return self._responses[query]
+
+    def query_stream(self, query: str, org: Optional[str] = None) -> Iterator[_Record]:
+        df = self._frame(query)
+        for values in df.to_dict("records"):
+            yield _Record(values)
+
+
+class InMemoryInfluxClient:
+    """Cliente de InfluxDB en memoria (sólo query_api)."""
+
+    def __init__(self, dataset: SyntheticDataset) -> None:
+        self._query_api = InMemoryQueryApi(dataset)
+
+    def query_api(self) -> InMemoryQueryApi:
+        return self._query_api
+
+    def close(self) -> None:
+        pass
+
+
+class _NullConnection:
+    """Conexión sin base de datos: commit y rollback no hacen nada."""
+    closed = 0
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+    def cursor(self):
+        raise NotImplementedError("InMemoryDataManager no ejecuta SQL")
+
+
+class _InMemoryRegistry(CodeIDRegistry):
+    """Registro de CodeIDs respaldado por la tabla codeids en memoria."""
+
+    def _select(self, column: str, values: List) -> List[tuple]:
+        rows = self.data_manager.tables.get("codeids", [])
+        key = "id" if column == "id" else "codeid"
+        wanted = set(values)
+        return [(r["id"], r["codeid"]) for r in rows if r[key] in wanted]
+
+    def register(self, codeids) -> Dict[str, tuple]:
+        result = {}
+        for codeid in dict.fromkeys(codeids):
+            known = self.resolve_codeids([codeid])
+            if codeid in known:
+                result[codeid] = (known[codeid], False)
+            else:
+                codeid_id = self.data_manager._insert_rows("codeids", ["codeid"], [(codeid,)])[0]
+                self._remember([(codeid_id, codeid)])
+                result[codeid] = (codeid_id, True)
+        return result
+
+
+class InMemoryDataManager(DataManager):
+    """
+    DataManager sin conexiones: InfluxDB se sirve desde un SyntheticDataset y
+    las tablas de PostgreSQL son listas de diccionarios en ``tables``.
+    """
+
+    def __init__(self, dataset: SyntheticDataset, config: Optional[Dict] = None) -> None:
+        """
+        :param dataset: Datos sintéticos que responden a las consultas Flux.
+        :param config: Configuración (por defecto DEFAULT_CONFIG).
+        """
+        self.dataset = dataset
+        self.tables: Dict[str, List[Dict]] = {}
+        super().__init__(config or DEFAULT_CONFIG)
+        self.codeids = _InMemoryRegistry(self)
+        self._influxdb_client = InMemoryInfluxClient(dataset)
+        self._null_conn = _NullConnection()
+
+    def load_config(self, config: Dict) -> Dict:
+        return config
+
+    @property
+    def pg_conn(self) -> _NullConnection:
+        return self._null_conn
+
+    def release_pg(self) -> None:
+        pass
+
+    def close_all(self) -> None:
+        pass
+
+    def _insert_rows(self, table_name: str, columns: List[str], rows: List[tuple],
+                     batch_size: int = 1000, commit: bool = True) -> List[int]:
+        table = self.tables.setdefault(table_name, [])
+        first = len(table) + 1
+        table.extend(dict(zip(columns, row), id=first + i) for i, row in enumerate(rows))
+        return list(range(first, first + len(rows)))
+
+    def get_codeids_in_range(self, start_datetime: str, end_datetime: str) -> List[str]:
+        return sorted(self.dataset.codeids)
+
+    def iter_segments(self, fstart: Optional[str] = None, fend: Optional[str] = None,
+                      ids: Optional[List[int]] = None, itersize: int = 1000,
+                      verbose: int = 0) -> Iterator[pd.DataFrame]:
+        if ids is None and (not fstart or not fend):
+            raise ValueError("Debe especificar `ids` o la ventana `fstart`/`fend`.")
+        df = pd.DataFrame(self.tables.get("activity_all", []), columns=SEGMENT_COLUMNS)
+        for c in ("start_time", "end_time"):
+            df[c] = to_naive_utc(df[c])
+        if ids is not None:
+            df = df[df["id"].isin(ids)]
+        else:
+            # Mismo criterio que la consulta de DataManager (sin zona: Europe/Madrid)
+            end, start = (ensure_utc(t).tz_localize(None) for t in (fend, fstart))
+            df = df[(df["start_time"] <= end) & (df["end_time"] >= start)]
+        df = df.assign(_key=df["codeid_ids"].map(tuple)).sort_values(["_key", "id"])
+        df = df.drop(columns="_key").reset_index(drop=True)
+        return (df.iloc[k:k + itersize].reset_index(drop=True) for k in range(0, len(df), itersize))
+
+    def table(self, table_name: str) -> pd.DataFrame:
+        """Contenido de una tabla en memoria como DataFrame."""
+        return pd.DataFrame(self.tables.get(table_name, []))
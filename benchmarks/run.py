@@ -0,0 +1,181 @@
+"""
+Benchmarks de las etapas del pipeline sobre datos sintéticos, sin InfluxDB
+ni PostgreSQL.
+
+Para cada tamaño (horas de grabación por CodeID) se mide::
+
+    identify_activity_segments  inter_segs  merge_activity_legs_to_all
+    store_data (activity_leg, activity_all)
+    detect_effective_movement   detect_effective_gait
+
+y se escribe un JSON con el mejor tiempo de `--repeat` ejecuciones::
+
+    python -m benchmarks.run --hours 0.5 2 8 --codeids 4 -o results.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import scipy
+
+from benchmarks.backends import InMemoryDataManager
+from benchmarks.synthetic import SyntheticDataset
+from msCodeID.codeid_processor import CodeIDProcessor
+from msGait.movement_detector import MovementDetector
+
+SAMPLING_RATE = 50
+
+
+def _best_of(repeat: int, setup: Callable[[], tuple], fn: Callable) -> tuple:
+    """
+    Ejecuta `fn(*setup())` una vez de calentamiento y `repeat` veces medidas.
+    `setup` no se mide (p. ej. copias de los DataFrames que `fn` modifica).
+
+    :return: (mejor tiempo en segundos, resultado de la última ejecución)
+    """
+    result = fn(*setup())
+    best = float("inf")
+    for _ in range(repeat):
+        args = setup()
+        t0 = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(hours: float, n_codeids: int, repeat: int, seed: int = 0,
+             workers: int = 1) -> List[Dict]:
+    """
+    Mide todas las etapas para un tamaño de datos.
+
+    :param hours: Horas de grabación por CodeID.
+    :param n_codeids: Número de CodeIDs sintéticos.
+    :param repeat: Repeticiones medidas de cada etapa.
+    :param seed: Semilla de los datos sintéticos.
+    :param workers: Procesos de detect_effective_movement (1 = en serie).
+    :return: Un registro por etapa.
+    :rtype: List[Dict]
+    """
+    codeids = [f"SYN{i:05d}" for i in range(n_codeids)]
+    dataset = SyntheticDataset(codeids, hours=hours, sampling_rate=SAMPLING_RATE, seed=seed)
+    dm = InMemoryDataManager(dataset)
+    processor = CodeIDProcessor(dm)
+    dm.store_codeids(codeids)
+    results = []
+
+    def record(stage: str, seconds: float, rows: int) -> None:
+        results.append({"stage": stage, "hours": hours, "codeids": n_codeids,
+                        "rows": int(rows), "seconds": seconds,
+                        "rows_per_s": rows / seconds if seconds > 0 else None})
+
+    counts = {c: processor.fetch_codeid_data(c, dataset.start, dataset.end) for c in codeids}
+    n_counts = sum(len(c) for c in counts.values())
+
+    def segments():
+        return {(c, foot): processor.identify_activity_segments(df, 80, foot)
+                for c, df in counts.items() for foot in ("Left", "Right")}
+    seconds, segs = _best_of(repeat, tuple, segments)
+    record("identify_activity_segments", seconds, n_counts)
+
+    # activity_leg: transform + store_data (validado), como find_mscodeids
+    legs = {k: dm.transform_activityleg(v.copy()) for k, v in segs.items() if not v.empty}
+    ref = pd.concat(legs.values(), ignore_index=True)
+    seconds, _ = _best_of(repeat, lambda: (ref.copy(),),
+                          lambda df: dm.store_data("activity_leg", df, verbose=0))
+    record("store_data[activity_leg]", seconds, len(ref))
+    for v in segs.values():
+        if not v.empty:
+            v["codeleg_id"] = dm.store_data("activity_leg", dm.transform_activityleg(v), verbose=0)
+
+    pairs = [(segs[(c, "Right")], segs[(c, "Left")]) for c in codeids]
+    seconds, inters = _best_of(repeat, tuple,
+                               lambda: [processor.inter_segs(r, l) for r, l in pairs])
+    record("inter_segs", seconds, sum(len(r) + len(l) for r, l in pairs))
+
+    seconds, merged = _best_of(
+        repeat, tuple,
+        lambda: [processor.merge_activity_legs_to_all(r, l, i)
+                 for (r, l), i in zip(pairs, inters) if not i.empty])
+    record("merge_activity_legs_to_all", seconds, sum(len(i) for i in inters))
+
+    dbrg = pd.concat(merged, ignore_index=True) if merged else pd.DataFrame()
+    for validate in (True, False):
+        seconds, _ = _best_of(repeat, lambda: (dbrg.copy(),),
+                              lambda df: dm.store_data("activity_all", df, verbose=0,
+                                                       validate=validate))
+        record(f"store_data[activity_all,validate={validate}]", seconds, len(dbrg))
+    dm.tables["activity_all"] = []
+    dm.store_data("activity_all", dbrg.copy(), verbose=0, validate=False)
+
+    # Con zona horaria: las fechas sin zona de -f/-u se leen como Europe/Madrid
+    detector = MovementDetector(None, SAMPLING_RATE, fstart=dataset.start.isoformat(),
+                                fend=dataset.end.isoformat(), verbose=0,
+                                data_manager=dm)
+    seconds, effective = _best_of(
+        repeat, tuple, lambda: detector.detect_effective_movement(detector.df_legs, workers=workers))
+    record("detect_effective_movement", seconds, len(dataset))
+
+    seconds, gait = _best_of(repeat, tuple, lambda: detector.detect_effective_gait(effective))
+    record("detect_effective_gait", seconds, len(effective))
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline con datos sintéticos")
+    parser.add_argument("--hours", type=float, nargs="+", default=[0.5, 2.0],
+                        help="Horas de grabación por CodeID (un benchmark por valor)")
+    parser.add_argument("--codeids", type=int, default=2, help="Número de CodeIDs sintéticos")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los datos")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos de detect_effective_movement (1 = en serie)")
+    parser.add_argument("-o", "--output", default=None, help="Fichero JSON de resultados")
+    args = parser.parse_args(argv)
+
+    results = []
+    for hours in args.hours:
+        for r in run_size(hours, args.codeids, args.repeat, args.seed, args.workers):
+            results.append(r)
+            print(f"{r['hours']:>6} h  {r['stage']:<42} {r['seconds']:9.4f} s  "
+                  f"{r['rows']:>10} filas", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "scipy": scipy.__version__,
+            "sampling_rate": SAMPLING_RATE,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Generador sintético de datos IMU de 6 ejes (Ax, Ay, Az en g; Gx, Gy, Gz en º/s).
+
+Cada CodeID alterna episodios de marcha, reposo, ruido y sensor apagado (sin
+muestras). Los dos pies comparten la secuencia de episodios y, durante la
+marcha, el pie derecho va en contrafase respecto al izquierdo. Los datos son
+deterministas para una misma semilla.
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+FEET = ("Left", "Right")
+AXES = ("Ax", "Ay", "Az", "Gx", "Gy", "Gz")
+
+# Duración (s) mínima y máxima de cada tipo de episodio
+BOUTS = {
+    "walking": (5, 120),
+    "idle": (10, 300),
+    "noise": (5, 60),
+    "off": (120, 600),
+}
+
+
+class SyntheticDataset:
+    """
+    Conjunto sintético de muestras brutas, con la misma forma que las de
+    InfluxDB tras el pivot (una fila por muestra y pie).
+    """
+
+    def __init__(self, codeids: Sequence[str] = ("SYN00001",), hours: float = 1.0,
+                 sampling_rate: float = 50, start: str = "2024-01-01 08:00:00",
+                 weights: Optional[Dict[str, float]] = None, seed: int = 0) -> None:
+        """
+        Genera las muestras de todos los CodeIDs.
+
+        :param codeids: CodeIDs a generar.
+        :param hours: Duración de la grabación de cada CodeID (horas).
+        :param sampling_rate: Frecuencia de muestreo (Hz).
+        :param start: Inicio de la grabación (UTC).
+        :param weights: Fracción aproximada del tiempo en cada tipo de
+                        episodio (claves de BOUTS); por defecto 0.4 marcha,
+                        0.3 reposo, 0.15 ruido y 0.15 apagado.
+        :param seed: Semilla del generador aleatorio.
+        """
+        self.codeids = list(codeids)
+        self.sampling_rate = sampling_rate
+        self.start = pd.Timestamp(start, tz="UTC")
+        self.end = self.start + pd.Timedelta(hours=hours)
+        self.weights = weights or {"walking": 0.4, "idle": 0.3, "noise": 0.15, "off": 0.15}
+        rng = np.random.default_rng(seed)
+        frames = [self._generate(codeid, hours, rng) for codeid in self.codeids]
+        self.raw = pd.concat(frames, ignore_index=True)
+
+    def _schedule(self, n: int, rng: np.random.Generator) -> np.ndarray:
+        """Tipo de episodio de cada una de las n muestras."""
+        kinds = list(self.weights)
+        # Probabilidad de cada episodio según su fracción de tiempo y duración media
+        p = np.array([self.weights[k] / np.mean(BOUTS[k]) for k in kinds], dtype=float)
+        states, total = [], 0
+        while total < n:
+            kind = rng.choice(len(kinds), p=p / p.sum())
+            lo, hi = BOUTS[kinds[kind]]
+            length = int(rng.uniform(lo, hi) * self.sampling_rate)
+            states.append(np.full(length, kind))
+            total += length
+        names = np.array(kinds)
+        return names[np.concatenate(states)[:n]]
+
+    def _generate(self, codeid: str, hours: float, rng: np.random.Generator) -> pd.DataFrame:
+        n = int(hours * 3600 * self.sampling_rate)
+        state = self._schedule(n, rng)
+        keep = state != "off"
+        t = np.arange(n) / self.sampling_rate
+        walking = state == "walking"
+        noisy = state == "noise"
+        # Cadencia propia de cada CodeID (zancadas por segundo)
+        cadence = rng.uniform(0.8, 1.2)
+
+        frames = []
+        for k, foot in enumerate(FEET):
+            phase = 2 * np.pi * cadence * t + k * np.pi
+            values = {
+                "Ax": rng.normal(0, 0.005, n),
+                "Ay": rng.normal(0, 0.005, n),
+                "Az": 1 + rng.normal(0, 0.005, n),
+                "Gx": rng.normal(0, 0.5, n),
+                "Gy": rng.normal(0, 0.5, n),
+                "Gz": rng.normal(0, 0.5, n),
+            }
+            values["Ax"] += walking * (0.5 * np.sin(phase) + 0.2 * np.sin(2 * phase)) \
+                + noisy * rng.normal(0, 0.3, n)
+            values["Az"] += walking * 0.3 * np.cos(phase)
+            values["Gy"] += walking * 150 * np.sin(phase) + noisy * rng.normal(0, 40, n)
+            values["Gx"] += walking * 30 * np.sin(2 * phase)
+            frame = pd.DataFrame({c: values[c][keep] for c in AXES})
+            frame.insert(0, "_time", self.start + pd.to_timedelta(t[keep], unit="s"))
+            frame["CodeID"] = codeid
+            frame["Foot"] = foot
+            frame["DeviceName"] = f"{codeid}-{foot[0]}"
+            frame["mac"] = "Sensoria-" + "".join(f"{b:02X}" for b in rng.integers(0, 256, 6))
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True)
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def leg(self, codeid: str, foot: str, start=None, stop=None) -> pd.DataFrame:
+        """
+        Muestras de un (CodeID, pie) en [start, stop), ordenadas por tiempo.
+        """
+        raw = self.raw
+        mask = (raw["CodeID"] == codeid) & (raw["Foot"] == foot)
+        if start is not None:
+            mask &= raw["_time"] >= start
+        if stop is not None:
+            mask &= raw["_time"] < stop
+        return raw[mask].sort_values("_time", ignore_index=True)
+
+    def minute_counts(self, codeids: Optional[List[str]] = None, start=None,
+                      stop=None) -> pd.DataFrame:
+        """
+        Conteo de muestras por minuto, como el aggregateWindow(every: 1m, fn: count)
+        de CodeIDProcessor (el _time de cada ventana es su final).
+        """
+        raw = self.raw
+        mask = np.ones(len(raw), dtype=bool)
+        if codeids is not None:
+            mask &= raw["CodeID"].isin(codeids).to_numpy()
+        if start is not None:
+            mask &= (raw["_time"] >= start).to_numpy()
+        if stop is not None:
+            mask &= (raw["_time"] < stop).to_numpy()
+        raw = raw[mask]
+        counts = raw.groupby([raw["_time"].dt.floor("1min"), "CodeID", "Foot",
+                              "DeviceName", "mac"]).size().rename("_value").reset_index()
+        counts["_time"] += pd.Timedelta(minutes=1)
+        counts["_field"] = "Ax"
+        return counts.sort_values(["CodeID", "Foot", "_time"], ignore_index=True)
@@ -1,10 +1,16 @@
+import asyncio
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from typing import Dict
 from pydantic import ValidationError
 from msTools.data_manager import DataManager
 from msTools.models import ActivityLeg, ActivityAll
 from msGait.models import ActivitySegment
-from msTools.timeutils import ensure_utc
+from msTools.timeutils import ensure_utc, ensure_utc_array
+from msTools.flux_csv import DIALECT, parse_flux_csv
+from msTools.intervals import overlap_pairs, to_ns
+from msTools.metrics import METRICS
 
 class CodeIDProcessor:
     def __init__(self, data_manager: DataManager):
@@ -18,6 +24,28 @@ class CodeIDProcessor:
         self.influx_client = data_manager.get_influx_client()
         self.bucket = data_manager.bucket
 
+    def _codeid_query(self, codeid: str, start_datetime: datetime, end_datetime: datetime) -> str:
+        """Consulta Flux con los conteos por minuto de un CodeID."""
+        # Estandarizamos a UTC con ensure_utc()
+        start_datetime = ensure_utc(start_datetime).isoformat().replace("+00:00", "Z")
+        end_datetime   = ensure_utc(end_datetime)  .isoformat().replace("+00:00", "Z")
+
+        return f'''
+        from(bucket: "{self.bucket}")
+            |> range(start: {start_datetime}, stop: {end_datetime})
+            |> filter(fn: (r) => r["CodeID"] == "{codeid}" and r["_field"] == "Ax")
+            |> aggregateWindow(every: 1m, fn: count, createEmpty: false)
+            |> keep(columns: ["_time", "CodeID", "_field", "_value", "Foot", "lat", "lng", "mac", "DeviceName"])
+        '''
+
+    @staticmethod
+    def _columns_frame(columns: Dict) -> pd.DataFrame:
+        """DataFrame a partir de las columnas de parse_flux_csv (_time en UTC)."""
+        df = pd.DataFrame(columns)
+        if not df.empty:
+            df["_time"] = pd.to_datetime(df["_time"], utc=True)
+        return df
+
     def fetch_codeid_data(self, codeid: str, start_datetime: datetime, end_datetime: datetime) -> pd.DataFrame:
         """
         Obtiene datos de InfluxDB asociados a un CodeID específico.
@@ -31,33 +59,100 @@ class CodeIDProcessor:
         :return: DataFrame con los datos asociados.
         :rtype: pd.DataFrame
         """
-        # Estandarizamos a UTC con ensure_utc()
+        query = self._codeid_query(codeid, start_datetime, end_datetime)
+
+        try:
+            # Lectura por bloques: no se acumula un diccionario por registro
+            chunks = list(self.data_manager.stream_query(query))
+            df = pd.concat(chunks, ignore_index=True).sort_values('_time') if chunks else pd.DataFrame()
+            if df.empty:
+                print(f"No se encontraron datos para CodeID {codeid}.")
+            else:
+                print(f"Datos recuperados para CodeID {codeid}: {len(df)} filas.")
+            return df
+        except Exception as e:
+            print(f"Error al consultar datos de InfluxDB para CodeID {codeid}: {e}")
+            return pd.DataFrame()
+
+    async def fetch_codeid_data_async(self, codeid: str, start_datetime: datetime,
+                                      end_datetime: datetime, client=None) -> pd.DataFrame:
+        """
+        Versión asíncrona de fetch_codeid_data. Con un cliente InfluxDBClientAsync
+        la consulta no bloquea el bucle de eventos; sin él, fetch_codeid_data se
+        ejecuta en el executor por defecto del bucle.
+
+        :param codeid: Identificador único del CodeID.
+        :type codeid: str
+        :param start_datetime: Inicio del rango de tiempo.
+        :param end_datetime: Fin del rango de tiempo.
+        :param client: Cliente InfluxDBClientAsync (opcional).
+        :return: DataFrame con los datos asociados.
+        :rtype: pd.DataFrame
+        """
+        if client is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None, self.fetch_codeid_data, codeid, start_datetime, end_datetime)
+
+        query = self._codeid_query(codeid, start_datetime, end_datetime)
+        try:
+            raw = await client.query_api().query_raw(query, dialect=DIALECT)
+            if isinstance(raw, str):
+                raw = raw.encode("utf-8")
+            df = self._columns_frame(parse_flux_csv(raw))
+            if df.empty:
+                print(f"No se encontraron datos para CodeID {codeid}.")
+            else:
+                df = df.sort_values('_time')
+                print(f"Datos recuperados para CodeID {codeid}: {len(df)} filas.")
+            return df
+        except Exception as e:
+            print(f"Error al consultar datos de InfluxDB para CodeID {codeid}: {e}")
+            return pd.DataFrame()
+
+    def fetch_all_codeid_data(self, start_datetime: datetime, end_datetime: datetime) -> Dict[str, pd.DataFrame]:
+        """
+        Obtiene con una única consulta a InfluxDB los conteos por minuto de todos
+        los CodeIDs del rango y los separa por CodeID. Sustituye al escaneo
+        distinct() de get_codeids_in_range más una llamada a fetch_codeid_data
+        por cada CodeID.
+
+        :param start_datetime: Inicio del rango de tiempo.
+        :type start_datetime: datetime
+        :param end_datetime: Fin del rango de tiempo.
+        :type end_datetime: datetime
+        :return: Diccionario CodeID -> DataFrame (mismas columnas que fetch_codeid_data),
+                 ordenado por CodeID.
+        :rtype: Dict[str, pd.DataFrame]
+        """
         start_datetime = ensure_utc(start_datetime).isoformat().replace("+00:00", "Z")
         end_datetime   = ensure_utc(end_datetime)  .isoformat().replace("+00:00", "Z")
 
         query = f'''
         from(bucket: "{self.bucket}")
             |> range(start: {start_datetime}, stop: {end_datetime})
-            |> filter(fn: (r) => r["CodeID"] == "{codeid}" and r["_field"] == "Ax")
+            |> filter(fn: (r) => r._measurement == "{self.data_manager.measurement}" and r["_field"] == "Ax")
             |> aggregateWindow(every: 1m, fn: count, createEmpty: false)
             |> keep(columns: ["_time", "CodeID", "_field", "_value", "Foot", "lat", "lng", "mac", "DeviceName"])
+            |> group(columns: ["CodeID", "Foot", "DeviceName"])
         '''
 
         try:
-            result = self.influx_client.query_api().query(
-                org=self.data_manager.config['influxdb']['org'], query=query
-            )
-            data = [record.values for table in result for record in table.records]
-            df = pd.DataFrame(data).sort_values('_time')
-            if df.empty:
-                print(f"No se encontraron datos para CodeID {codeid}.")
-            else:
-                print(f"Datos recuperados para CodeID {codeid}: {len(df)} filas.")
-            return df
+            columns = self.data_manager.query_columns(query)
         except Exception as e:
-            print(f"Error al consultar datos de InfluxDB para CodeID {codeid}: {e}")
-            return pd.DataFrame()
+            print(f"Error al consultar datos de InfluxDB: {e}")
+            return {}
+        if not columns:
+            print("No se encontraron datos en el rango.")
+            return {}
+
+        df = self._columns_frame(columns)
+        data = {codeid: group.sort_values('_time')
+                for codeid, group in df.groupby('CodeID', sort=True)}
+        print(f"Datos recuperados para {len(data)} CodeIDs: {len(df)} filas.")
+        return data
 
+    @METRICS.timed("segments.identify")
     def identify_activity_segments(self, df: pd.DataFrame, threshold_seconds: float = 70, foot:str = 'Left') -> pd.DataFrame:
         """
         Identifica segmentos contiguos de datos basados en un umbral de tiempo.
@@ -107,13 +202,11 @@ class CodeIDProcessor:
             print("No se encontraron datos en el DataFrame proporcionado.")
             return pd.DataFrame(columns=['time_from','time_until','CodeID','DeviceName','Foot','total_value','mac'])
 
-        # Verificar si '_time' ya tiene zona horaria antes de localización
+        # Cadenas (o fechas sin zona, asumidas en Europe/Madrid) a UTC de una vez
         if not pd.api.types.is_datetime64_any_dtype(df["_time"]):
-            df["_time"] = pd.to_datetime(df["_time"])
-            if df["_time"].dt.tz is None:
-                df["_time"] = df["_time"].dt.tz_localize("Europe/Madrid")
+            df["_time"] = ensure_utc_array(df["_time"])
 
-        clean = df.drop(columns=['result','table','_field','lng','lat']) \
+        clean = df.drop(columns=['result','table','_field','lng','lat'], errors='ignore') \
                   .sort_values("_time")
         filtered = clean[clean['Foot']==foot]
         grouped  = grouping(filtered, threshold_seconds)
@@ -122,6 +215,7 @@ class CodeIDProcessor:
             'time_from','time_until','CodeID','DeviceName','Foot','total_value','mac'
         ])
     
+    @METRICS.timed("segments.intersect")
     def inter_segs(self,sg1:pd.DataFrame,sg2:pd.DataFrame)->pd.DataFrame:
         """
         Calcula la intersección de registros from/until
@@ -133,45 +227,34 @@ class CodeIDProcessor:
         Returns:
             pd.DataFrame: DataFrame con las intersecciones
         """
-        def is_intersection(row):
-            return (
-                row['time_from_1'] <= row['time_until_2'] and
-                row['time_from_2'] <= row['time_until_1']
-            )
-        # Calcular los límites reales de la intersección
-        def calculate_intersection(row):
-            return pd.Series({
-                'time_from': max(row['time_from_1'], row['time_from_2']),
-                'time_until': min(row['time_until_1'], row['time_until_2'])
-            })        
-        
+        empty = pd.DataFrame(columns=[
+            'time_from','time_until',
+            'R1_id','R2_id','codeid_id_1','codeid_id_2'
+        ])
         if sg1.empty or sg2.empty:
-            return pd.DataFrame(columns=[
-                'time_from','time_until',
-                'R1_id','R2_id','codeid_id_1','codeid_id_2'
-            ])
-        
-        sg1 = sg1.reset_index().rename(columns={'index':'R1_id'})
-        sg2 = sg2.reset_index().rename(columns={'index':'R2_id'})
-        # Realizar un producto cartesiano entre los DataFrames
-        cross_join = sg1.merge(sg2, how='cross', suffixes=('_1', '_2'))        
-        # Filtrar las filas donde los segmentos de tiempo se solapan
-        cross_join['intersects'] = cross_join.apply(is_intersection, axis=1)
-        # Filtrar solo las filas con intersección
-        intersections = cross_join[cross_join['intersects']]
-        if intersections.empty:
-            return pd.DataFrame(columns=[
-                'time_from','time_until',
-                'R1_id','R2_id','codeid_id_1','codeid_id_2'
-            ])
-        # Calcular los valores de la intersección para las columnas time_from y time_until
-        intersections.loc[:,['time_from', 'time_until']] = intersections.apply(calculate_intersection, axis=1)
-        # Crear el DataFrame con las columnas solicitadas
-        result_df = intersections[['time_from', 'time_until', 'R1_id', 'R2_id', \
-                'codeid_id_1','codeid_id_2']]
-        result_df = result_df.reset_index(drop=True)
-        return result_df
+            return empty
+
+        # Barrido ordenado sobre int64 en lugar de producto cartesiano
+        ia, ib = overlap_pairs(to_ns(sg1['time_from']), to_ns(sg1['time_until']),
+                               to_ns(sg2['time_from']), to_ns(sg2['time_until']),
+                               closed=True)
+        if len(ia) == 0:
+            return empty
+
+        from_1 = sg1['time_from'].iloc[ia].reset_index(drop=True)
+        from_2 = sg2['time_from'].iloc[ib].reset_index(drop=True)
+        until_1 = sg1['time_until'].iloc[ia].reset_index(drop=True)
+        until_2 = sg2['time_until'].iloc[ib].reset_index(drop=True)
+        return pd.DataFrame({
+            'time_from': from_1.where(from_1 >= from_2, from_2),
+            'time_until': until_1.where(until_1 <= until_2, until_2),
+            'R1_id': sg1.index[ia],
+            'R2_id': sg2.index[ib],
+            'codeid_id_1': sg1['codeid_id'].to_numpy()[ia],
+            'codeid_id_2': sg2['codeid_id'].to_numpy()[ib],
+        })
 
+    @METRICS.timed("segments.merge")
     def merge_activity_legs_to_all(self, act_segR: pd.DataFrame, act_segL: pd.DataFrame, \
                                     inter: pd.DataFrame) -> pd.DataFrame:
         """
@@ -187,61 +270,182 @@ class CodeIDProcessor:
         :return: DataFrame con toda la información integrada para inyectar en PostGresQL
         :rtype: pd.DataFrame
         """
-        # Función para convertir el campo mac al formato deseado
-        def format_mac(address):
-            # Extraer el texto después del último '-'
-            hex_part = address.split('-')[-1]
-            # Insertar ':' cada dos caracteres
-            formatted_mac = ':'.join(hex_part[i:i+2] for i in range(0, len(hex_part), 2))
-            return formatted_mac
-        # Combinar res con activity_segR y activity_segL usando los IDs R1_id y R2_id
-        result = inter.merge(act_segR[['CodeID', 'device_name', 'foot', \
-                                'mac','codeleg_id']],
-                        left_on='R1_id',
-                        right_index=True,
-                        suffixes=('', '_R'))
-
-        result = result.merge(act_segL[['CodeID', 'device_name', 'foot', \
-                                'mac','codeleg_id']],
-                            left_on='R2_id',
-                            right_index=True,
-                            suffixes=('_R', '_L'))
-
-        # Seleccionamos las columnas relevantes
-        final_result = result[[
-            'time_from', 'time_until',
-            'CodeID_R', 'device_name_R', 'foot_R', 'mac_R',
-            'CodeID_L', 'device_name_L', 'foot_L', 'mac_L',
-            'codeid_id_1','codeid_id_2', 'codeleg_id_R','codeleg_id_L'
-        ]]
-        # Aplicar la función a los campos de mac en el DataFrame
-        if sum(final_result['mac_R'].str.contains(':', na=False)) == 0:
-            final_result = final_result.copy()
-            final_result.loc[:,'mac_R'] = final_result['mac_R'].apply(format_mac)
-        if sum(final_result['mac_L'].str.contains(':', na=False)) == 0:
-            final_result = final_result.copy()
-            final_result.loc[:,'mac_L'] = final_result['mac_L'].apply(format_mac)
-        final_result = final_result.copy()
-        final_result.loc[:,'is_effective'] = False
-        final_result['duration'] = (final_result['time_until'] - \
-                                    final_result['time_from']).dt.total_seconds()
-        # Crear la nueva columna 'macs' como una lista con los valores de 'mac_L' y 'mac_R'
-        final_result['macs'] = final_result.apply(lambda row: [row['mac_L'], \
-                                row['mac_R']], axis=1)
-        final_result['codeid_ids'] = final_result.apply(lambda row: [row['codeid_id_2'], \
-                                row['codeid_id_1']], axis=1)
-        final_result['codeleg_ids'] = final_result.apply(lambda row: [row['codeleg_id_L'], \
-                                row['codeleg_id_R']], axis=1)
-        final_result['device_names'] = final_result.apply(lambda row: [ \
-                                row['device_name_L'], row['device_name_R']], axis=1)
-        final_result['active_legs'] = final_result.apply(lambda row: [row['foot_L'], \
-                                row['foot_R']], axis=1)
-        final_result.rename(columns={'time_from': 'start_time', \
-                                     'time_until': 'end_time'}, inplace=True)
-        final_result.drop(columns=['CodeID_R', 'device_name_R', 'foot_R', \
-                'mac_R', 'CodeID_L', 'device_name_L', 'foot_L', 'mac_L', \
-                'codeleg_id_L','codeleg_id_R'],inplace=True)
-        return(final_result)
+        # Posiciones de R1_id / R2_id en cada pierna (equivale a los dos merge internos)
+        pos_R = act_segR.index.get_indexer(inter['R1_id'])
+        pos_L = act_segL.index.get_indexer(inter['R2_id'])
+        keep = (pos_R >= 0) & (pos_L >= 0)
+        if not keep.all():
+            inter = inter[keep]
+            pos_R, pos_L = pos_R[keep], pos_L[keep]
+
+        def leg_values(seg: pd.DataFrame, column: str, pos: np.ndarray) -> np.ndarray:
+            return seg[column].to_numpy()[pos]
+
+        def format_macs(macs: np.ndarray) -> np.ndarray:
+            # Texto tras el último '-' con ':' cada dos caracteres, sólo si
+            # ninguna MAC de la columna viene ya formateada
+            macs = pd.Series(macs, dtype=object)
+            if macs.str.contains(':', na=False).any():
+                return macs.to_numpy()
+            return macs.str.split('-').str[-1] \
+                       .str.replace(r'(..)(?=.)', r'\1:', regex=True).to_numpy()
+
+        def pairs(left: np.ndarray, right: np.ndarray) -> pd.Series:
+            return pd.Series(np.column_stack((left, right)).tolist(), index=inter.index)
+
+        mac_R = format_macs(leg_values(act_segR, 'mac', pos_R))
+        mac_L = format_macs(leg_values(act_segL, 'mac', pos_L))
+        time_from = inter['time_from']
+        time_until = inter['time_until']
+        codeid_id_1 = inter['codeid_id_1'].to_numpy()
+        codeid_id_2 = inter['codeid_id_2'].to_numpy()
+
+        return pd.DataFrame({
+            'start_time': time_from,
+            'end_time': time_until,
+            'codeid_id_1': codeid_id_1,
+            'codeid_id_2': codeid_id_2,
+            'is_effective': False,
+            'duration': (time_until - time_from).dt.total_seconds(),
+            'macs': pairs(mac_L, mac_R),
+            'codeid_ids': pairs(codeid_id_2, codeid_id_1),
+            'codeleg_ids': pairs(leg_values(act_segL, 'codeleg_id', pos_L),
+                                 leg_values(act_segR, 'codeleg_id', pos_R)),
+            'device_names': pairs(leg_values(act_segL, 'device_name', pos_L),
+                                  leg_values(act_segR, 'device_name', pos_R)),
+            'active_legs': pairs(leg_values(act_segL, 'foot', pos_L),
+                                 leg_values(act_segR, 'foot', pos_R)),
+        }, index=inter.index)
+
+    @staticmethod
+    def _incremental_starts(marks: Dict[str, Dict], start_datetime: datetime) -> Dict[str, pd.Timestamp]:
+        """Inicio de lectura de cada pierna: su marca de agua o, si no tiene, `start_datetime`."""
+        start = ensure_utc(start_datetime)
+        return {f: ensure_utc(marks[f]['last_time']) if f in marks else start
+                for f in ('Left', 'Right')}
+
+    def incremental_start(self, codeid_id: int, start_datetime: datetime) -> pd.Timestamp:
+        """
+        Primer instante que hay que leer de un CodeID en la ingesta
+        incremental: la marca de agua más antigua de sus piernas (las
+        piernas sin marca empiezan en `start_datetime`).
+
+        :param codeid_id: ID del CodeID en la tabla codeids.
+        :param start_datetime: Inicio por defecto para las piernas sin marca.
+        :return: Inicio de la consulta (UTC).
+        :rtype: pd.Timestamp
+        """
+        marks = self.data_manager.get_watermarks(codeid_id)
+        return min(self._incremental_starts(marks, start_datetime).values())
+
+    def ingest_incremental(self, codeid: str, codeid_id: int, start_datetime: datetime,
+                           end_datetime: datetime, sensor_data: pd.DataFrame = None,
+                           threshold_seconds: float = 80, verbose: int = 0) -> Dict[str, int]:
+        """
+        Ingesta incremental de un CodeID a partir de sus marcas de agua.
+
+        Sólo se consultan los datos posteriores a la marca de cada pierna (o
+        desde `start_datetime` si aún no tiene). La nueva marca es el último
+        `_time` ingerido de la pierna, no el fin del rango, de modo que los
+        datos que llegan tarde a InfluxDB (con fechas anteriores a la
+        ejecución) se leen en la siguiente; una pierna sin datos nuevos
+        conserva su marca. Si el primer segmento nuevo está a
+        menos de `threshold_seconds` del último segmento guardado y es del
+        mismo dispositivo, se prolonga ese segmento en lugar de crear otro.
+        activity_all se actualiza por pareja codeleg_ids, y todo (segmentos,
+        intersecciones y marcas) se confirma en una única transacción, de
+        modo que repetir una ejecución fallida no duplica filas.
+
+        :param codeid: CodeID a procesar.
+        :param codeid_id: ID del CodeID en la tabla codeids.
+        :param start_datetime: Inicio por defecto para las piernas sin marca.
+        :param end_datetime: Fin del rango de lectura.
+        :param sensor_data: Datos ya consultados (p. ej. en modo --batch); si es
+                            None se consultan desde la marca más antigua.
+        :param threshold_seconds: Umbral de agrupación de segmentos.
+        :param verbose: Nivel de verbosidad.
+        :return: Resumen con 'new_legs', 'extended' y 'activity_all'.
+        :rtype: Dict[str, int]
+        :raises Exception: Si falla cualquier escritura (la transacción se deshace).
+        """
+        dm = self.data_manager
+        marks = dm.get_watermarks(codeid_id)
+        starts = self._incremental_starts(marks, start_datetime)
+        if sensor_data is None:
+            sensor_data = self.fetch_codeid_data(codeid, min(starts.values()), end_datetime)
+
+        summary = {'new_legs': 0, 'extended': 0, 'activity_all': 0}
+        legs = {}
+        last_ids = {}
+        last_times = {}
+        try:
+            for foot in ('Left', 'Right'):
+                mark = marks.get(foot)
+                data = sensor_data
+                if not data.empty:
+                    # La marca es el último _time ya ingerido; sin marca se lee desde start_datetime
+                    since = starts[foot]
+                    data = data[data['_time'] > since] if mark is not None else data[data['_time'] >= since]
+                    if 'Foot' in data.columns and (data['Foot'] == foot).any():
+                        last_times[foot] = data.loc[data['Foot'] == foot, '_time'].max()
+                segs = self.identify_activity_segments(data, threshold_seconds, foot) \
+                    if not data.empty and 'Foot' in data.columns else pd.DataFrame()
+
+                # Segmento anterior de la pierna, prolongado si el nuevo lo continúa
+                prev = None
+                if mark is not None and mark['codeleg_id'] is not None and mark['end_time'] is not None:
+                    prev = {
+                        'time_from': ensure_utc(mark['start_time']),
+                        'time_until': ensure_utc(mark['end_time']),
+                        'CodeID': codeid,
+                        'device_name': mark['device_name'],
+                        'foot': foot,
+                        'mac': mark['mac'],
+                        'codeid_id': codeid_id,
+                        'codeleg_id': mark['codeleg_id'],
+                    }
+                    if not segs.empty:
+                        first = segs.iloc[0]
+                        gap = (first['time_from'] - prev['time_until']).total_seconds()
+                        if gap <= threshold_seconds and first['DeviceName'] == prev['device_name']:
+                            prev['time_until'] = first['time_until']
+                            dm.extend_activity_leg(
+                                prev['codeleg_id'], prev['time_until'],
+                                (prev['time_until'] - prev['time_from']).total_seconds(),
+                                float(mark['total_value'] or 0) + float(first['total_value']))
+                            segs = segs.iloc[1:]
+                            summary['extended'] += 1
+
+                if not segs.empty:
+                    segs = segs.loc[(segs['time_until'] - segs['time_from']).dt.total_seconds() > 0]
+                frames = [pd.DataFrame([prev])] if prev is not None else []
+                last_ids[foot] = prev['codeleg_id'] if prev is not None else None
+                if not segs.empty:
+                    segs = segs.copy()
+                    ids = dm.store_data("activity_leg", dm.transform_activityleg(segs),
+                                        verbose=verbose, commit=False)
+                    if ids is None:
+                        raise RuntimeError(f"activity_leg no guardado para CodeID {codeid}, {foot}")
+                    segs['codeleg_id'] = ids
+                    frames.append(segs[['time_from', 'time_until', 'CodeID', 'device_name',
+                                        'foot', 'mac', 'codeid_id', 'codeleg_id']])
+                    last_ids[foot] = ids[-1]
+                    summary['new_legs'] += len(ids)
+                legs[foot] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+            # Sólo el último segmento previo y los nuevos pueden solaparse más allá de la marca
+            res = self.inter_segs(legs['Right'], legs['Left'])
+            if not res.empty:
+                dbrg = self.merge_activity_legs_to_all(legs['Right'], legs['Left'], res)
+                summary['activity_all'] = len(dm.upsert_activity_all(dbrg))
+
+            for foot, last_time in last_times.items():
+                dm.set_watermark(codeid_id, foot, last_time, last_ids[foot])
+            dm.pg_conn.commit()
+        except Exception:
+            dm.pg_conn.rollback()
+            raise
+        return summary
 
     def save_to_postgresql(self, table_name: str, df: pd.DataFrame)->None:
         """
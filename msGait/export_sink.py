@@ -0,0 +1,199 @@
+import os
+import queue
+import threading
+import uuid
+from typing import Optional
+
+import pandas as pd
+
+from msTools import i18n
+from msTools.metrics import METRICS
+
+
+class RawExportSink:
+    """Writes the raw sensor data of the analysed legs from a background thread.
+
+    ``submit`` only enqueues the DataFrame, so the detection loop only waits
+    for serialization when ``max_pending`` legs are already queued.
+    Subclasses implement ``_write`` (called in the writer thread, in
+    submission order) and optionally ``_finish``. The first error
+    raised by the writer is re-raised by ``close``.
+    """
+
+    def __init__(self, path: str, max_pending: int = 8, vb: int = 0) -> None:
+        """Starts the writer thread.
+
+        Args:
+            path (str): Output file or directory.
+            max_pending (int): Maximum number of legs waiting to be written
+                (default 8). ``submit`` blocks while the queue is full, so a
+                slow writer bounds memory instead of accumulating raw legs;
+                0 means unbounded.
+            vb (int): Verbosity level (0 = silent, 1 = info, 2 = debug).
+        """
+        self.path = path
+        self.vb = vb
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="raw-export", daemon=True)
+        self._thread.start()
+
+    def submit(self, raw: pd.DataFrame, codeid_id: int, foot: str, start: pd.Timestamp) -> None:
+        """Queues the raw data of one leg for writing.
+
+        Args:
+            raw (pd.DataFrame): Raw samples of the leg (_time in naive UTC, or
+                int64 ns in compact frames).
+            codeid_id (int): ID of the CodeID in the codeids table.
+            foot (str): 'Left' or 'Right'.
+            start (pd.Timestamp): Start of the activity window.
+        """
+        if raw is None or raw.empty or self._error is not None:
+            return
+        self._queue.put((raw, codeid_id, foot, start))
+
+    def close(self) -> None:
+        """Writes the pending legs, closes the output and waits for the thread."""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> "RawExportSink":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                continue
+            try:
+                with METRICS.span("export.write"):
+                    self._write(*item)
+                METRICS.count("export.rows", len(item[0]))
+            except Exception as e:
+                self._error = e
+        try:
+            self._finish()
+        except Exception as e:
+            self._error = self._error or e
+
+    def _write(self, raw: pd.DataFrame, codeid_id: int, foot: str, start: pd.Timestamp) -> None:
+        raise NotImplementedError
+
+    def _finish(self) -> None:
+        pass
+
+
+class ParquetSink(RawExportSink):
+    """Exports the raw data to Parquet (requires pyarrow).
+
+    When ``path`` ends in ``.parquet`` every leg is appended to that single
+    file. Otherwise ``path`` is the root of a dataset partitioned by CodeID,
+    foot and date (``codeid_id=7/foot=Left/date=2024-05-01/...parquet``) that
+    pandas, pyarrow or DuckDB can read with partition pruning.
+    """
+
+    def __init__(self, path: str, max_pending: int = 8, vb: int = 0) -> None:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("ParquetSink needs pyarrow (pip install pyarrow).") from e
+        self.partitioned = not path.endswith(".parquet")
+        self._writer = None
+        self._schema = None
+        self._prefix = uuid.uuid4().hex[:12]  # Unique file names for this run
+        self._parts = 0
+        super().__init__(path, max_pending, vb)
+
+    def _write(self, raw: pd.DataFrame, codeid_id: int, foot: str, start: pd.Timestamp) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        df = raw.drop(columns=["|a|", "|g|"], errors="ignore")
+        if not isinstance(df["_time"].dtype, pd.DatetimeTZDtype):
+            df = df.assign(_time=pd.to_datetime(df["_time"]).dt.tz_localize("UTC"))
+
+        if self.partitioned:
+            # Hive layout: the partition values live in the directory names
+            days = df["_time"].dt.floor("D")
+            for day, part in df.groupby(days, sort=True):
+                folder = os.path.join(self.path, f"codeid_id={codeid_id}", f"foot={foot}",
+                                      f"date={day:%Y-%m-%d}")
+                os.makedirs(folder, exist_ok=True)
+                self._parts += 1
+                pq.write_table(pa.Table.from_pandas(part, preserve_index=False),
+                               os.path.join(folder, f"{self._prefix}-{self._parts:05d}.parquet"))
+        else:
+            table = pa.Table.from_pandas(df.assign(codeid_id=codeid_id, foot=foot),
+                                         preserve_index=False)
+            if self._writer is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._schema = table.schema.remove_metadata()
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            self._writer.write_table(table.select(self._schema.names).cast(self._schema))
+        if self.vb > 0:
+            print(i18n._("MVNT-EXP-DAT").format(cid=codeid_id, foot=foot, n=len(df), file=self.path))
+
+    def _finish(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+class ExcelSink(RawExportSink):
+    """Exports the raw data to an xlsx workbook, one sheet per leg.
+
+    Much slower than Parquet, and sheets are split every 1M rows; kept for
+    users who open the data directly in a spreadsheet.
+    """
+
+    MAX_ROWS = 1_000_000
+
+    def __init__(self, path: str, max_pending: int = 8, vb: int = 0) -> None:
+        self._writer = pd.ExcelWriter(path, engine="xlsxwriter")
+        super().__init__(path, max_pending, vb)
+
+    def _write(self, raw: pd.DataFrame, codeid_id: int, foot: str, start: pd.Timestamp) -> None:
+        sheet_base = f"{codeid_id}_{foot}_{start.strftime('%H%M%S')}"[:25]
+        if raw["_time"].dtype.kind in "iu":  # Compact frame
+            raw = raw.assign(_time=pd.to_datetime(raw["_time"]))
+        tz_cols = raw.select_dtypes(["datetimetz"]).columns
+        if len(tz_cols):
+            raw = raw.assign(**{c: raw[c].dt.tz_convert("UTC").dt.tz_localize(None)
+                                for c in tz_cols})
+        for i in range((len(raw) - 1) // self.MAX_ROWS + 1):
+            sheet = f"{sheet_base}_{i+1}"
+            raw.iloc[i*self.MAX_ROWS:(i+1)*self.MAX_ROWS].to_excel(
+                self._writer, sheet_name=sheet, index=False)
+            if self.vb > 0:
+                print(i18n._("MVNT-XLSX-DAT").format(shn=sheet, file=self.path))
+
+    def _finish(self) -> None:
+        self._writer.close()
+
+
+def open_export_sink(path: str, fmt: Optional[str] = None, vb: int = 0) -> RawExportSink:
+    """Creates the export sink for a path.
+
+    Args:
+        path (str): Output file (``.parquet`` or ``.xlsx``) or dataset directory.
+        fmt (Optional[str]): 'parquet' or 'xlsx'. By default it is inferred
+            from the extension: ``.xlsx``/``.xls`` selects Excel, anything else
+            Parquet.
+        vb (int): Verbosity level (0 = silent, 1 = info, 2 = debug).
+
+    Returns:
+        RawExportSink: Sink with its writer thread running.
+    """
+    if fmt is None:
+        fmt = "xlsx" if path.lower().endswith((".xlsx", ".xls")) else "parquet"
+    if fmt == "xlsx":
+        return ExcelSink(path, vb=vb)
+    if fmt == "parquet":
+        return ParquetSink(path, vb=vb)
+    raise ValueError(f"Unknown export format: {fmt}")
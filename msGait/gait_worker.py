@@ -0,0 +1,153 @@
+import os
+import socket
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from msTools import i18n
+from msTools.data_manager import DataManager
+from msTools.job_queue import GaitJobQueue, LeaseLostError
+from msTools.metrics import METRICS
+from msGait.movement_detector import MovementDetector
+
+
+class GaitWorker:
+    """Processes the find_gait job queue (gait_jobs table).
+
+    Each batch of claimed activity_all ids goes through the same steps as
+    ``find_gait --save``: effective movement per leg, effective gait for both
+    feet, and both result tables. The results and the "done" mark are
+    committed in a single transaction, so a job that is retried after a crash
+    never leaves duplicated rows. While a batch is running, a background
+    thread renews its lease.
+    """
+
+    def __init__(self, config_file: str, sampling_rate: float = 50, batch_size: int = 1,
+                 lease_seconds: int = 600, max_attempts: int = 3, workers: int = 1,
+                 worker_id: Optional[str] = None, verbose: int = 0,
+                 data_manager: Optional[DataManager] = None) -> None:
+        """Creates the detector (without loading segments) and the queue.
+
+        Args:
+            config_file (str): Path to the YAML configuration file.
+            sampling_rate (float): Sampling rate of the sensor data (in Hz).
+            batch_size (int): activity_all ids claimed at a time.
+            lease_seconds (int): Lease of a claimed batch; it is renewed every
+                third of this time while the batch runs.
+            max_attempts (int): Attempts per job before it is marked failed.
+            workers (int): Processes used to analyse the legs of each batch
+                (as ``find_gait -j``).
+            worker_id (Optional[str]): Name stored in gait_jobs.worker
+                (default ``host:pid``).
+            verbose (int): Verbosity level (0 = silent, 1 = info, 2 = debug).
+            data_manager (Optional[DataManager]): Data manager to use instead of
+                creating one from config_file (see MovementDetector).
+        """
+        # Fetch errors must fail the job (and retry it), not complete it empty
+        self.detector = MovementDetector(config_file, sampling_rate, verbose=verbose,
+                                         load_segments=False, data_manager=data_manager,
+                                         raise_errors=True)
+        self.data_manager = self.detector.data_manager
+        self.queue = GaitJobQueue(self.data_manager, lease_seconds, max_attempts)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.verbose = verbose
+
+    def close(self) -> None:
+        """Closes the connections of the detector."""
+        self.detector.close()
+
+    def run(self, max_jobs: Optional[int] = None, poll_seconds: float = 0) -> int:
+        """Claims and processes batches until the queue is empty.
+
+        Args:
+            max_jobs (Optional[int]): Stop after this many jobs (None = no limit).
+            poll_seconds (float): When the queue is empty, wait this long and
+                look again instead of returning (0 = return).
+
+        Returns:
+            int: Number of jobs completed by this worker.
+        """
+        done = 0
+        while max_jobs is None or done < max_jobs:
+            size = self.batch_size if max_jobs is None else min(self.batch_size, max_jobs - done)
+            ids = self.queue.claim(self.worker_id, size)
+            if not ids:
+                if poll_seconds <= 0:
+                    break
+                time.sleep(poll_seconds)
+                continue
+            if self.verbose >= 1:
+                print(i18n._("JOBS-CLAIM").format(worker=self.worker_id, ids=ids))
+            try:
+                n_eff, n_gait = self._run_batch(ids)
+            except LeaseLostError as e:
+                # Another worker owns the jobs now: nothing was committed
+                print(i18n._("JOBS-LEASE-LOST").format(e=e))
+                continue
+            except Exception as e:
+                self.data_manager.pg_conn.rollback()
+                self.queue.fail(self.worker_id, ids, repr(e))
+                print(i18n._("JOBS-FAIL").format(ids=ids, e=e))
+                continue
+            done += len(ids)
+            if self.verbose >= 1:
+                print(i18n._("JOBS-DONE").format(ids=ids, n_eff=n_eff, n_gait=n_gait))
+        return done
+
+    def _run_batch(self, ids: List[int]) -> Tuple[int, int]:
+        stop = threading.Event()
+        renewer = threading.Thread(target=self._renew_lease, args=(ids, stop),
+                                   name="lease-renewal", daemon=True)
+        renewer.start()
+        try:
+            return self.process(ids)
+        finally:
+            stop.set()
+            renewer.join()
+
+    def _renew_lease(self, ids: List[int], stop: threading.Event) -> None:
+        # Runs in its own thread, hence with its own pooled connection
+        try:
+            while not stop.wait(self.queue.lease_seconds / 3):
+                if self.queue.renew(self.worker_id, ids) < len(ids):
+                    break
+        except Exception as e:
+            print(i18n._("JOBS-RENEW-ERR").format(e=e))
+        finally:
+            self.data_manager.release_pg()
+
+    def process(self, ids: List[int]) -> Tuple[int, int]:
+        """Runs the detection for some claimed jobs and completes them.
+
+        Args:
+            ids (List[int]): activity_all ids claimed by this worker.
+
+        Returns:
+            Tuple[int, int]: Rows stored in effective_movement and effective_gait.
+
+        Raises:
+            LeaseLostError: If the lease of some job expired and another
+                worker claimed it; nothing is committed.
+        """
+        activity = self.data_manager.segments_retrieval(ids=ids, verbose=self.verbose)
+        legs = self.data_manager.recover_activity_all(activity, vb=self.verbose)
+        df_effective = pd.DataFrame()
+        if not legs.empty:
+            df_effective = self.detector.detect_effective_movement(
+                legs, vb=self.verbose, workers=self.workers)
+        df_gait = self.detector.detect_effective_gait(df_effective, self.verbose)
+
+        # Results and job state in one transaction
+        for table_name, df in (("effective_movement", df_effective), ("effective_gait", df_gait)):
+            if df.empty:
+                continue
+            with METRICS.span("jobs.store"):
+                stored = self.data_manager.store_data(table_name, df, self.verbose, commit=False)
+            if stored is None:
+                raise RuntimeError(i18n._("JOBS-STORE-ERR").format(table_name=table_name))
+        self.queue.complete(self.worker_id, ids)
+        return len(df_effective), len(df_gait)
@@ -1,11 +1,12 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
 from typing import Optional, List
 
 
 class EffectiveMovement(BaseModel):
     codeid_id: int  # Relación con la tabla codeids
-    start_time: str  # ISO 8601 timestamp
-    end_time: str  # ISO 8601 timestamp
+    start_time: datetime  # UTC (also accepts ISO 8601)
+    end_time: datetime  # UTC (also accepts ISO 8601)
     duration: float
     leg: str  # "Left" o "Right"
 
@@ -15,5 +16,5 @@ class ActivitySegment(BaseModel):
     foot: str  # "Left" o "Right"
     device_name: Optional[str] = None
     mac: Optional[str] = None
-    start_time: str  # ISO 8601 timestamp
-    end_time: str  # ISO 8601 timestamp
+    start_time: datetime  # UTC (also accepts ISO 8601)
+    end_time: datetime  # UTC (also accepts ISO 8601)
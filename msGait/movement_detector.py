@@ -1,17 +1,55 @@
 import pandas as pd
 import numpy as np
-from pandas import ExcelWriter
-from typing import List, Optional, Tuple
-from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from msTools.data_manager import DataManager
 from msTools import i18n
-from msTools.timeutils import ensure_utc
+from msTools.timeutils import ensure_utc, time_slices, to_epoch_ns, to_naive_utc
+from msTools.sensor_cache import SensorCache
+from msTools.intervals import overlap_pairs, to_ns
+from msTools.metrics import METRICS
 from msGait.models import EffectiveMovement
+from msGait.export_sink import RawExportSink, open_export_sink
+from msGait.window_engine import WindowEngine, WindowScanner
 
 from scipy.signal import welch
 from pydantic import ValidationError
 
+AXES = ["Ax", "Ay", "Az", "Gx", "Gy", "Gz"]
+# Magnitudes computed by InfluxDB (server_magnitude): Flux column -> detector column
+SERVER_MAGNITUDES = {"a_mag": "|a|", "g_mag": "|g|"}
+# Relative slack of the pre-screen thresholds (float32 vs float64 magnitudes)
+PRESCREEN_MARGIN = 1e-4
+
+
+def compact_sensor_frame(df: pd.DataFrame, tags: Optional[dict] = None) -> pd.DataFrame:
+    """Converts raw sensor data to the compact representation.
+
+    The compact frame holds _time as int64 nanoseconds since epoch (UTC) and
+    the Ax..Gz signals (or the |a| and |g| magnitudes) as float32; the tag columns (CodeID, Foot, ...), which
+    are constant within a leg, are dropped and kept as scalars in ``df.attrs``.
+    This takes less than half the memory of the float64/datetime/object frame.
+
+    Args:
+        df (pd.DataFrame): Raw sensor data, compact or not.
+        tags (Optional[dict]): Tags to store in ``attrs`` (e.g. CodeID and Foot).
+
+    Returns:
+        pd.DataFrame: Compact frame with _time and the available signals.
+    """
+    if df.empty:
+        return df
+    out = pd.DataFrame({"_time": to_epoch_ns(df["_time"])})
+    for c in (*AXES, "|a|", "|g|"):
+        if c in df.columns:
+            out[c] = df[c].to_numpy(dtype=np.float32)
+    out.attrs = {**df.attrs, **(tags or {})}
+    return out
+
 
 class MovementDetector:
     """Detects effective movement and gait periods using raw sensor data from a data manager."""
@@ -24,7 +62,10 @@ class MovementDetector:
         fstart: Optional[str] = None,
         fend: Optional[str] = None,
         ids: Optional[List[int]] = None,
-        verbose: int = 1
+        verbose: int = 1,
+        load_segments: bool = True,
+        data_manager: Optional[DataManager] = None,
+        raise_errors: bool = False
     ) -> None:
         """Initializes the movement detector, loads configurations and activity data.
 
@@ -35,25 +76,39 @@ class MovementDetector:
             fstart (Optional[str]): Optional start timestamp for activity query.
             fend (Optional[str]): Optional end timestamp for activity query.
             ids (Optional[List[int]]): Optional list of segment IDs to retrieve.
+                The selection (ids, or fstart and fend) is read lazily, page
+                by page, by iter_legs.
             verbose (int): Verbosity level for logging (0 = silent, 1 = info, 2 = debug).
+            load_segments (bool): If False, there is no activity_all selection
+                                  (used by the worker processes, which only
+                                  analyse legs).
+            data_manager (Optional[DataManager]): Data manager to use instead of
+                                  creating one from config_file (e.g. the in-memory
+                                  stand-in of the benchmarks). The parallel mode
+                                  still builds its workers from config_file.
+            raise_errors (bool): If True, InfluxDB and CodeID lookup errors are
+                                  raised instead of leaving the leg empty (used
+                                  by GaitWorker, so that the job is retried
+                                  rather than completed without results).
         """
         self.verbose = verbose
         self.sampling_rate = sampling_rate
+        self.config_file = config_file
+        self.sect = sect
+        self.raise_errors = raise_errors
+        # Worker processes of the parallel mode (see _process_pool)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_workers = 0
 
         # Initialize DataManager
-        self.data_manager = DataManager(config_path=config_file)
-
-        # Retrieve activity segments based on IDs or time range from activity_all table
-        self.activity_all = self.data_manager.segments_retrieval(
-            fstart=fstart, fend=fend, ids=ids, verbose=verbose
-        )
-        if self.activity_all.empty and verbose >= 1:
-            print(i18n._("FGAIT_NO_WINS"))
+        self.data_manager = data_manager or DataManager(config_path=config_file)
 
-        # Retrieve full sensor-linked activity
-        self.df_legs = self.data_manager.recover_activity_all(
-            self.activity_all, vb=verbose
-        )
+        # activity_all rows to analyse (IDs or time range), consumed by iter_legs
+        self.selection = None
+        if load_segments:
+            if ids is None and not (fstart and fend):
+                raise ValueError("Debe especificar `ids` o la ventana `fstart`/`fend`.")
+            self.selection = {"fstart": fstart, "fend": fend, "ids": ids}
 
         # Load detection parameters from config
         params = self.data_manager.get_config(sect)
@@ -63,13 +118,92 @@ class MovementDetector:
         self.gyro_threshold = params.get("gyro_threshold", 50)
         self.accel_power_threshold = params.get("accel_power_threshold",0.1)
         self.gyro_power_threshold = params.get("gyro_power_threshold",1000)
+        # Rows per block when the legs are streamed (None = whole leg at once)
+        self.chunk_rows = params.get("chunk_rows")
+        # float32 signals, int64 ns times and tags in attrs (see compact_sensor_frame)
+        self.compact = bool(params.get("compact", False))
+        # InfluxDB computes |a| and |g| and only returns them (not when exporting)
+        self.server_magnitude = bool(params.get("server_magnitude", False))
+        # Bucket of the activity pre-screen (Flux duration, e.g. "5s"; None = off)
+        self.prescreen_every = params.get("prescreen_every")
+        # Long legs are fetched as concurrent time slices, each retried on error
+        self.fetch_slice = params.get("fetch_slice", "30min")
+        self.fetch_workers = params.get("fetch_workers", 4)
+        self.fetch_retries = params.get("fetch_retries", 2)
+        # activity_all rows per page of the selection (server-side cursor)
+        self.segment_batch = params.get("segment_batch", 1000)
+        # Optional on-disk cache of the raw InfluxDB pulls
+        self.cache = SensorCache.from_config(self.data_manager.get_config("cache"))
+        self.engine = WindowEngine.from_params(
+            params, self.sampling_rate,
+            window_size=256  # Welch requiere 256 puntos
+        )
 
     def close(self):
-        """Closing all the opened connections"""
+        """Closing all the opened connections and the worker processes"""
+        self._shutdown_pool()
         self.data_manager.close_all()
+
+    def _process_pool(self, workers: int) -> ProcessPoolExecutor:
+        """Pool of the parallel mode, created on first use and kept until close().
+
+        The worker processes (and their DB connections) are reused by every
+        call of detect_effective_movement, e.g. once per page in find_gait or
+        per claimed batch in GaitWorker; it is only rebuilt if the number of
+        workers changes.
+        """
+        if self._pool is None or self._pool_workers != workers:
+            self._shutdown_pool()
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.config_file, self.sampling_rate, self.sect, self.verbose,
+                          self.raise_errors))
+            self._pool_workers = workers
+        return self._pool
+
+    def _shutdown_pool(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def iter_legs(self, batch_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """Yields the legs of the selected activity_all rows, one page at a time.
+
+        The rows are read with a server-side cursor (DataManager.iter_segments),
+        so memory depends on the page size and not on the length of the
+        selected range. Both legs of a row are always in the same page.
+
+        Args:
+            batch_size (Optional[int]): activity_all rows per page (default
+                ``segment_batch`` of the config, 1000).
+
+        Yields:
+            pd.DataFrame: Legs of one page (start_time, end_time, codeid_id,
+                CodeID, foot), as expected by detect_effective_movement.
+        """
+        if self.selection is None:
+            return
+        found = False
+        for act in self.data_manager.iter_segments(**self.selection,
+                                                   itersize=batch_size or self.segment_batch,
+                                                   verbose=self.verbose):
+            found = True
+            legs = self.data_manager.recover_activity_all(act, vb=self.verbose)
+            if not legs.empty:
+                yield legs
+        if not found and self.verbose >= 1:
+            print(i18n._("FGAIT_NO_WINS"))
+
+    @property
+    def df_legs(self) -> pd.DataFrame:
+        """All the legs of the selection in one DataFrame (see iter_legs)."""
+        pages = list(self.iter_legs())
+        return pd.concat(pages, ignore_index=True) if pages else pd.DataFrame()
         
     def fetch_sensor_data(self, start_time: str, end_time: str,
-                          codeid_id: int, foot: str) -> pd.DataFrame:
+                          codeid_id: int, foot: str, magnitudes: bool = False) -> pd.DataFrame:
         """Fetches raw sensor data from InfluxDB for a specific time interval and limb.
 
         Args:
@@ -77,46 +211,246 @@ class MovementDetector:
             end_time (str): End time in ISO format.
             codeid_id (int): Identifier to map to real CodeID.
             foot (str): 'Left' or 'Right'.
+            magnitudes (bool): If True, InfluxDB computes |a| and |g| and only
+                those two columns (plus _time) are transferred. Ignored when
+                the cache is enabled, since it stores the raw axes.
 
         Returns:
-            pd.DataFrame: Sensor data with fields Ax, Ay, Az, Gx, Gy, Gz, and timestamps.
+            pd.DataFrame: Sensor data with fields Ax, Ay, Az, Gx, Gy, Gz (or
+                |a| and |g|), and timestamps (compact frame, see
+                compact_sensor_frame, when ``compact`` is set).
         """
         try:
             codeid = self.data_manager.get_real_codeid(codeid_id)
         except ValueError as e:
+            if self.raise_errors:
+                raise
             if self.verbose >= 1:
                 print(i18n._("PGSQL-QRY-GEN-ERR").format(e=e))
             return pd.DataFrame()
 
-        start_time = ensure_utc(start_time).isoformat().replace("+00:00", "Z")
-        end_time = ensure_utc(end_time).isoformat().replace("+00:00", "Z")
+        start_time = ensure_utc(start_time)
+        end_time = ensure_utc(end_time)
+        try:
+            if self.cache is not None:
+                # The cache stores (and merges) full frames
+                data = self.cache.get(
+                    codeid, foot, start_time, end_time,
+                    lambda s, e: self._fetch_slices(codeid, foot, s, e, compact=False))
+                if self.compact:
+                    data = compact_sensor_frame(data, {"CodeID": codeid, "Foot": foot})
+                return data
+            return self._fetch_slices(codeid, foot, start_time, end_time,
+                                      magnitudes=magnitudes)
+        except Exception as e:
+            if self.raise_errors:
+                raise
+            if self.verbose >= 1:
+                print(i18n._("INFL-QRY-DATA-ERR").format(e=e))
+            return pd.DataFrame()
+
+    def _leg_query(self, codeid: str, foot: str, start_time: pd.Timestamp,
+                   end_time: pd.Timestamp, magnitudes: bool = False,
+                   sort: bool = False) -> str:
+        """Builds the pivot Flux query of one limb for [start_time, end_time).
 
+        Args:
+            codeid (str): Real CodeID of the sensor.
+            foot (str): 'Left' or 'Right'.
+            start_time (pd.Timestamp): Start time (UTC), included.
+            end_time (pd.Timestamp): End time (UTC), excluded.
+            magnitudes (bool): Compute |a| and |g| in InfluxDB with ``map()``
+                and ``keep()`` only _time and those two columns (named as the
+                keys of SERVER_MAGNITUDES).
+            sort (bool): Merge the result into a single table sorted by time.
+
+        Returns:
+            str: Flux query.
+        """
+        start_time = start_time.isoformat().replace("+00:00", "Z")
+        end_time = end_time.isoformat().replace("+00:00", "Z")
         query = f'''
+        {'import "math"' if magnitudes else ''}
         from(bucket: "{self.data_manager.bucket}")
             |> range(start: {start_time}, stop: {end_time})
             |> filter(fn: (r) => r["CodeID"] == "{codeid}" and r["Foot"] == "{foot}")
             |> filter(fn: (r) => r["_field"] == "Ax" or r["_field"] == "Ay" or r["_field"] == "Az" 
                               or r["_field"] == "Gx" or r["_field"] == "Gy" or r["_field"] == "Gz")
-            |> pivot(rowKey:["_time"], columnKey:["_field"], valueColumn:"_value")
-        '''
+            |> pivot(rowKey:["_time"], columnKey:["_field"], valueColumn:"_value")'''
+        if magnitudes:
+            query += '''
+            |> map(fn: (r) => ({r with
+                a_mag: math.sqrt(x: r.Ax * r.Ax + r.Ay * r.Ay + r.Az * r.Az),
+                g_mag: math.sqrt(x: r.Gx * r.Gx + r.Gy * r.Gy + r.Gz * r.Gz)}))
+            |> keep(columns: ["_time", "a_mag", "g_mag"])'''
+        if sort:
+            query += '''
+            |> group()
+            |> sort(columns: ["_time"])'''
+        return query + "\n"
+
+    def _fetch_slices(self, codeid: str, foot: str, start_time: pd.Timestamp,
+                      end_time: pd.Timestamp, compact: Optional[bool] = None,
+                      magnitudes: bool = False) -> pd.DataFrame:
+        """Fetches [start_time, end_time) of one limb as consecutive time slices.
+
+        Ranges longer than ``fetch_slice`` are split into half-open slices
+        that are queried concurrently (``fetch_workers`` threads), each one
+        retried up to ``fetch_retries`` times, so a slow or failed response
+        only costs its own slice instead of the whole leg. The slices are
+        concatenated in time order before any window is evaluated, hence
+        the 256-sample windows are the same as with a single query.
+
+        Args:
+            codeid (str): Real CodeID of the sensor.
+            foot (str): 'Left' or 'Right'.
+            start_time (pd.Timestamp): Start time (UTC), included.
+            end_time (pd.Timestamp): End time (UTC), excluded.
+            compact (Optional[bool]): See _query_sensor_data.
+            magnitudes (bool): See _query_sensor_data.
+
+        Returns:
+            pd.DataFrame: Sensor data of the whole range; empty if it holds no data.
 
+        Raises:
+            Exception: The error of a slice that still fails after its retries.
+        """
+        slices = time_slices(start_time, end_time, self.fetch_slice)
+        if len(slices) == 1:
+            return self._query_with_retry(codeid, foot, start_time, end_time, compact, magnitudes)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.fetch_workers, len(slices))),
+                                thread_name_prefix="influx-slice") as pool:
+            parts = list(pool.map(
+                lambda bounds: self._query_with_retry(codeid, foot, *bounds, compact, magnitudes),
+                slices))
+        METRICS.count("influx.slices", len(slices))
+        parts = [p for p in parts if not p.empty]
+        if not parts:
+            return pd.DataFrame()
+        data = pd.concat(parts, ignore_index=True)
+        data.attrs = dict(parts[0].attrs)
+        return data
+
+    def _query_with_retry(self, codeid: str, foot: str, start_time: pd.Timestamp,
+                          end_time: pd.Timestamp, compact: Optional[bool] = None,
+                          magnitudes: bool = False) -> pd.DataFrame:
+        """Runs _query_sensor_data, retrying with exponential backoff on errors."""
+        for attempt in range(self.fetch_retries + 1):
+            try:
+                return self._query_sensor_data(codeid, foot, start_time, end_time,
+                                               compact, magnitudes)
+            except Exception as e:
+                if attempt == self.fetch_retries:
+                    raise
+                METRICS.count("influx.retries")
+                if self.verbose >= 1:
+                    print(i18n._("INFL-QRY-RETRY").format(
+                        cid=codeid, foot=foot, frm=start_time, to=end_time, e=e))
+                time.sleep(min(2 ** attempt, 30))
+
+    def _query_sensor_data(self, codeid: str, foot: str, start_time: pd.Timestamp,
+                           end_time: pd.Timestamp, compact: Optional[bool] = None,
+                           magnitudes: bool = False) -> pd.DataFrame:
+        """Runs the pivot Flux query for [start_time, end_time) of one limb.
+
+        Args:
+            codeid (str): Real CodeID of the sensor.
+            foot (str): 'Left' or 'Right'.
+            start_time (pd.Timestamp): Start time (UTC), included.
+            end_time (pd.Timestamp): End time (UTC), excluded.
+            compact (Optional[bool]): Return a compact frame; by default the
+                ``compact`` setting of the detector.
+            magnitudes (bool): Fetch only _time, |a| and |g|, computed by InfluxDB.
+
+        Returns:
+            pd.DataFrame: Sensor data; empty if the range holds no data.
+
+        Raises:
+            Exception: Any InfluxDB error other than an empty range.
+        """
+        query = self._leg_query(codeid, foot, start_time, end_time, magnitudes)
+
+        if compact is None:
+            compact = self.compact
+        signals = list(SERVER_MAGNITUDES) if magnitudes else AXES
         try:
-            result = self.data_manager.influxdb_client.query_api().query(
-                query=query,
-                org=self.data_manager.config['influxdb']['org']
-            )
-            data = [record.values for table in result for record in table.records]
-            return pd.DataFrame(data)
+            # Typed columns straight from the CSV response (no FluxRecord dicts)
+            if compact:
+                # Only _time and the signals, parsed straight into float32
+                columns = self.data_manager.query_columns(
+                    query, columns=["_time", *signals], dtypes={c: "float32" for c in signals})
+            elif magnitudes:
+                columns = self.data_manager.query_columns(query, columns=["_time", *signals])
+            else:
+                columns = self.data_manager.query_columns(query)
         except Exception as e:
-            msg = str(e)
-            if "cannot query an empty range" in msg:
+            if "cannot query an empty range" in str(e):
                 if self.verbose >= 2:
                     print(f"[MovementDetector] empty range for CodeID {codeid}, foot {foot}")
                 return pd.DataFrame()
+            raise
+        columns.pop("_start", None)
+        columns.pop("_stop", None)
+        data = pd.DataFrame(columns).rename(columns=SERVER_MAGNITUDES)
+        if compact:
+            data.attrs = {"CodeID": codeid, "Foot": foot}
+        elif not data.empty:
+            data["_time"] = pd.to_datetime(data["_time"], utc=True)
+        return data
+
+    def iter_sensor_chunks(self, start_time: str, end_time: str, codeid_id: int,
+                           foot: str, chunk_rows: int = 100_000,
+                           magnitudes: bool = False) -> Iterator[pd.DataFrame]:
+        """Streams raw sensor data from InfluxDB in blocks of chunk_rows samples.
+
+        The blocks are sorted by time across the whole interval, so memory
+        is bounded by the block size instead of the leg duration. The
+        on-disk cache is not used in this mode.
+
+        Args:
+            start_time (str): Start time in ISO format.
+            end_time (str): End time in ISO format.
+            codeid_id (int): Identifier to map to real CodeID.
+            foot (str): 'Left' or 'Right'.
+            chunk_rows (int): Maximum number of samples per block.
+            magnitudes (bool): Fetch only _time, |a| and |g|, computed by InfluxDB.
+
+        Yields:
+            pd.DataFrame: Blocks with _time and the Ax, Ay, Az, Gx, Gy, Gz fields
+                (or |a| and |g|).
+        """
+        try:
+            codeid = self.data_manager.get_real_codeid(codeid_id)
+        except ValueError as e:
+            if self.raise_errors:
+                raise
             if self.verbose >= 1:
+                print(i18n._("PGSQL-QRY-GEN-ERR").format(e=e))
+            return
+
+        query = self._leg_query(codeid, foot, ensure_utc(start_time), ensure_utc(end_time),
+                                magnitudes, sort=True)
+        try:
+            chunks = self.data_manager.stream_query(
+                query, chunk_rows=chunk_rows,
+                columns=["_time", *(SERVER_MAGNITUDES if magnitudes else AXES)])
+            if magnitudes:
+                chunks = (c.rename(columns=SERVER_MAGNITUDES) for c in chunks)
+            if self.compact:
+                tags = {"CodeID": codeid, "Foot": foot}
+                chunks = (compact_sensor_frame(c, tags) for c in chunks)
+            yield from chunks
+        except Exception as e:
+            if "cannot query an empty range" in str(e):
+                if self.verbose >= 2:
+                    print(f"[MovementDetector] empty range for CodeID {codeid}, foot {foot}")
+            elif self.raise_errors:
+                raise
+            elif self.verbose >= 1:
                 print(i18n._("INFL-QRY-DATA-ERR").format(e=e))
-            return pd.DataFrame()
 
+    @METRICS.timed("compute.magnitude")
     def calculate_magnitude(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calculates signal magnitudes for acceleration and gyroscope data.
 
@@ -124,9 +458,13 @@ class MovementDetector:
             df (pd.DataFrame): DataFrame containing raw sensor values.
 
         Returns:
-            pd.DataFrame: Same DataFrame with added '|a|' and '|g|' columns.
+            pd.DataFrame: Same DataFrame with added '|a|' and '|g|' columns
+                (float32 when the signals are float32). Magnitudes already
+                computed by InfluxDB are kept.
         """
-        if {"Ax", "Ay", "Az", "Gx", "Gy", "Gz"}.issubset(df.columns):
+        if "|a|" in df.columns and "|g|" in df.columns:
+            return df
+        if set(AXES).issubset(df.columns):
             df["|a|"] = np.sqrt(df["Ax"]**2 + df["Ay"]**2 + df["Az"]**2)
             df["|g|"] = np.sqrt(df["Gx"]**2 + df["Gy"]**2 + df["Gz"]**2)
         else:
@@ -180,189 +518,380 @@ class MovementDetector:
         """
         return signal > threshold
     
-    def detect_effective_movement(self,activity_windows: pd.DataFrame,
-                                  nomf: str = None,vb: int = 0) -> pd.DataFrame:
-        """Detects intervals of effective movement from sensor data.
+    @staticmethod
+    def merge_connected_segments(segments: List[Tuple[pd.Timestamp, pd.Timestamp]],
+                                 max_gap_sec: float = 5.) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """Merges temporally close segments into a single one.
 
         Args:
-            activity_windows (pd.DataFrame): DataFrame containing rows with start_time, 
-                                             end_time, codeid_id, and foot.
-            nomf (str, optional): Path to an Excel file for exporting raw data 
-                                  (default is None).
-            vb (int): Verbosity level (0 = silent, 1 = info, 2 = debug).
+            segments (List[Tuple[pd.Timestamp, pd.Timestamp]]): List of segment start and end times.
+            max_gap_sec (float): Maximum allowed gap for merging segments.
 
         Returns:
-            pd.DataFrame: Validated segments with effective movement data.
+            List[Tuple[pd.Timestamp, pd.Timestamp]]: Merged list of segments.
         """
+        if not segments:
+            return []
 
-        def segment_fixed_windows(df: pd.DataFrame, window_size: int = 256) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
-            """
-            Divide los datos en ventanas consecutivas de tamaño fijo (por número de muestras).
-
-            Args:
-                df (pd.DataFrame): DataFrame con una columna '_time' ordenada.
-                window_size (int): Número de muestras por ventana.
-
-            Returns:
-                List[Tuple[pd.Timestamp, pd.Timestamp]]: Lista de (start_time, end_time) por segmento.
-            """
-            if "_time" not in df.columns:
-                raise ValueError("DataFrame must contain a '_time' column.")
-            
-            df = df.sort_values("_time").reset_index(drop=True)
+        segments = sorted(segments, key=lambda x: x[0])
+        merged = []
+        current_start, current_end = segments[0]
 
-            segments = []
-            total_rows = len(df)
+        for start, end in segments[1:]:
+            gap = (start - current_end).total_seconds()
+            if gap <= max_gap_sec:
+                current_end = max(current_end, end)
+            else:
+                merged.append((current_start, current_end))
+                current_start, current_end = start, end
 
-            for i in range(0, total_rows - window_size + 1, window_size):
-                start_time = df.loc[i, "_time"]
-                end_time = df.loc[i + window_size - 1, "_time"]
-                segments.append((start_time, end_time))
+        merged.append((current_start, current_end))
+        return merged
 
-            return segments
+    def prescreen_buckets(self, codeid: str, foot: str, start_time: pd.Timestamp,
+                          end_time: pd.Timestamp) -> pd.DataFrame:
+        """Per-bucket aggregates of |a| and |g| computed by InfluxDB.
 
-        def merge_connected_segments(segments: list[tuple[pd.Timestamp, pd.Timestamp]], 
-                                     max_gap_sec=5.):
-            """Merges temporally close segments into a single one.
+        The leg is split into ``prescreen_every`` buckets and only the sample
+        count and the extremes of the magnitudes of each bucket are
+        transferred. Samples with a missing axis get a huge magnitude, so
+        their bucket is never skipped.
 
-            Args:
-                segments (List[Tuple[pd.Timestamp, pd.Timestamp]]): List of segment start and end times.
-                max_gap_sec (float): Maximum allowed gap for merging segments.
-
-            Returns:
-                List[Tuple[pd.Timestamp, pd.Timestamp]]: Merged list of segments.
-            """
-            if not segments:
-                return []
-
-            segments = sorted(segments, key=lambda x: x[0])
-            merged = []
-            current_start, current_end = segments[0]
+        Args:
+            codeid (str): Real CodeID of the sensor.
+            foot (str): 'Left' or 'Right'.
+            start_time (pd.Timestamp): Start time (UTC), included.
+            end_time (pd.Timestamp): End time (UTC), excluded.
 
-            for start, end in segments[1:]:
-                gap = (start - current_end).total_seconds()
-                if gap <= max_gap_sec:
-                    current_end = max(current_end, end)
-                else:
-                    merged.append((current_start, current_end))
-                    current_start, current_end = start, end
+        Returns:
+            pd.DataFrame: One row per non-empty bucket, sorted by time, with
+                _start and _stop (int64 ns), n, a_max, a_min and g_max.
+        """
+        query = 'import "math"\n' + self._leg_query(codeid, foot, start_time, end_time)
+        query += f'''
+            |> map(fn: (r) => ({{_time: r._time,
+                a: if exists r.Ax and exists r.Ay and exists r.Az
+                   then math.sqrt(x: r.Ax * r.Ax + r.Ay * r.Ay + r.Az * r.Az) else 1.0e9,
+                g: if exists r.Gx and exists r.Gy and exists r.Gz
+                   then math.sqrt(x: r.Gx * r.Gx + r.Gy * r.Gy + r.Gz * r.Gz) else 1.0e9}}))
+            |> window(every: {self.prescreen_every})
+            |> reduce(identity: {{n: 0, a_max: 0.0, a_min: 1.0e9, g_max: 0.0}},
+                      fn: (r, accumulator) => ({{
+                          n: accumulator.n + 1,
+                          a_max: if r.a > accumulator.a_max then r.a else accumulator.a_max,
+                          a_min: if r.a < accumulator.a_min then r.a else accumulator.a_min,
+                          g_max: if r.g > accumulator.g_max then r.g else accumulator.g_max}}))
+            |> group()
+            |> sort(columns: ["_start"])
+        '''
+        try:
+            columns = self.data_manager.query_columns(
+                query, columns=["_start", "_stop", "n", "a_max", "a_min", "g_max"])
+        except Exception as e:
+            if "cannot query an empty range" in str(e):
+                return pd.DataFrame()
+            raise
+        return pd.DataFrame(columns)
 
-            merged.append((current_start, current_end))
-            return merged
-        #
-        # End of aux fucntion. 
-        # Starting point for function detect_effective_movement()
+    def _scan_leg_prescreened(self, start: pd.Timestamp, end: pd.Timestamp, codeid_id: int,
+                              foot: str, vb: int = 0) -> Optional[List[Tuple[pd.Timestamp, pd.Timestamp]]]:
+        """Finds the valid windows of one leg reading only its active stretches.
 
-        if "foot" not in activity_windows.columns:
-            raise ValueError(i18n._("MVNT-ROOT-MISS"))
+        The buckets of prescreen_buckets() where no sample can exceed the
+        |a| or |g| activity threshold cannot contribute to a valid window
+        (the continuous-hits test needs at least one), so only the buckets
+        covering the remaining windows are read. The windows keep their
+        alignment to the whole leg, hence the result is the same as reading
+        the leg in full.
 
-        results = []
-        writer = ExcelWriter(nomf, engine="xlsxwriter") if nomf else None
+        Args:
+            start (pd.Timestamp): Start time (UTC).
+            end (pd.Timestamp): End time (UTC).
+            codeid_id (int): Identifier to map to real CodeID.
+            foot (str): 'Left' or 'Right'.
+            vb (int): Verbosity level (0 = silent, 1 = info, 2 = debug).
 
-        for row in activity_windows.itertuples(index=False):
-            segments = []
-            valid_segments = []
-            try:
-                start = row.start_time.tz_localize('UTC') # ensure_utc(row.start_time)
-                end = row.end_time.tz_localize('UTC')     # ensure_utc(row.end_time)
-            except Exception:
-                if self.verbose:
-                    print(i18n._("MVNT-TS-NOV").format(row=row))
-                continue
+        Returns:
+            Optional[List[Tuple[pd.Timestamp, pd.Timestamp]]]: Start and end
+                time of the valid windows, or None if the leg has to be read
+                in full (pre-screen not applicable, or the data changed
+                between the queries).
+        """
+        if self.min_continuous_hits < 1:
+            return None
+        try:
+            codeid = self.data_manager.get_real_codeid(codeid_id)
+            with METRICS.span("influx.prescreen"):
+                buckets = self.prescreen_buckets(codeid, foot, start, end)
+        except Exception as e:
+            if self.raise_errors:
+                raise
+            if self.verbose >= 1:
+                print(i18n._("INFL-QRY-DATA-ERR").format(e=e))
+            return None
+        if buckets.empty:
+            return []
+
+        engine = self.engine
+        slack = 1 - PRESCREEN_MARGIN
+        acc_thr = engine.accel_threshold * slack
+        hot = (buckets["a_max"] - 1 > acc_thr) | (1 - buckets["a_min"] > acc_thr) | \
+            (buckets["g_max"] > engine.gyro_threshold * slack)
+        counts = buckets["n"].to_numpy(dtype=np.int64)
+        cum = np.concatenate(([0], np.cumsum(counts)))
+        bucket_start = pd.to_datetime(buckets["_start"].to_numpy(), utc=True)
+        bucket_stop = pd.to_datetime(buckets["_stop"].to_numpy(), utc=True)
+
+        starts, ends = [], []
+        fetched = 0
+        for b0, b1, k0, k1 in engine.candidate_spans(counts, hot.to_numpy()):
+            data = self.fetch_sensor_data(bucket_start[b0], bucket_stop[b1], codeid_id, foot,
+                                          magnitudes=self.server_magnitude)
+            expected = int(cum[b1 + 1] - cum[b0])
+            if len(data) != expected:
+                # New samples arrived between the queries: read the whole leg
+                if vb > 1:
+                    print(i18n._("MVNT-PRESCREEN-MISMATCH").format(got=len(data), expected=expected))
+                return None
+            data = self.calculate_magnitude(data)
+            if "|a|" not in data.columns or "|g|" not in data.columns:
+                return []
+            data = data.sort_values("_time", ignore_index=True)
+            # Samples of windows k0..k1, counted from the first sample of bucket b0
+            lo = k0 * engine.hop - int(cum[b0])
+            hi = k1 * engine.hop + engine.window_size - int(cum[b0])
+            with METRICS.span("compute.windows"):
+                first, last = engine.valid_window_bounds(data["|a|"].to_numpy()[lo:hi],
+                                                         data["|g|"].to_numpy()[lo:hi])
+            times = to_epoch_ns(data["_time"]).view("datetime64[ns]")
+            starts.append(times[first + lo])
+            ends.append(times[last + lo])
+            fetched += expected
+
+        METRICS.count("compute.samples", fetched)
+        METRICS.count("prescreen.samples_skipped", int(cum[-1]) - fetched)
+        if vb > 1:
+            print(i18n._("MVNT-QRY-REC").format(ns=fetched))
+        if not starts:
+            return []
+        return list(zip(pd.to_datetime(np.concatenate(starts)).tolist(),
+                        pd.to_datetime(np.concatenate(ends)).tolist()))
+
+    def _scan_leg_chunks(self, start: pd.Timestamp, end: pd.Timestamp, codeid_id: int,
+                         foot: str, vb: int = 0) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """Finds the valid windows of one leg reading it block by block.
 
-            if pd.isnull(start) or pd.isnull(end):
-                if self.verbose:
-                    print(i18n._("MVNT-TS-NOV").format(row=row))
-                continue
+        Args:
+            start (pd.Timestamp): Start time (UTC).
+            end (pd.Timestamp): End time (UTC).
+            codeid_id (int): Identifier to map to real CodeID.
+            foot (str): 'Left' or 'Right'.
+            vb (int): Verbosity level (0 = silent, 1 = info, 2 = debug).
 
-            codeid_id = row.codeid_id
-            foot = row.foot
-            cid = getattr(row, "CodeID", codeid_id)
+        Returns:
+            List[Tuple[pd.Timestamp, pd.Timestamp]]: Start and end time of the valid windows.
+        """
+        scanner = WindowScanner(self.engine)
+        starts, ends = [], []
+        n = 0
+        for chunk in self.iter_sensor_chunks(start, end, codeid_id, foot, self.chunk_rows,
+                                             magnitudes=self.server_magnitude):
+            chunk = self.calculate_magnitude(chunk)
+            if "|a|" not in chunk.columns or "|g|" not in chunk.columns:
+                return []
+            times = to_epoch_ns(chunk["_time"]).view("datetime64[ns]")
+            with METRICS.span("compute.windows"):
+                first, last = scanner.feed(times, chunk["|a|"].to_numpy(), chunk["|g|"].to_numpy())
+            starts.append(first)
+            ends.append(last)
+            n += len(chunk)
+
+        METRICS.count("compute.samples", n)
+        if vb > 1 and n:
+            print(i18n._("MVNT-QRY-REC").format(ns=n))
+        if not starts:
+            return []
+        return list(zip(pd.to_datetime(np.concatenate(starts)).tolist(),
+                        pd.to_datetime(np.concatenate(ends)).tolist()))
+
+    def _detect_leg(self, row: dict, export: bool = False,
+                    vb: int = 0) -> Tuple[List[dict], Optional[pd.DataFrame]]:
+        """Detects effective movement for a single (codeid_id, foot, window) row.
 
-            if vb > 1:
-                print(i18n._("MVNT-QRY-DAT").format(
-                    cid=cid, frm=start, dur=(end - start).total_seconds()
-                ))
+        Args:
+            row (dict): Activity window with start_time, end_time, codeid_id and foot.
+            export (bool): If True, the raw sensor data is returned for exporting.
+            vb (int): Verbosity level (0 = silent, 1 = info, 2 = debug).
 
-            sensor_data = self.fetch_sensor_data(start, end, codeid_id, foot)
+        Returns:
+            Tuple[List[dict], Optional[pd.DataFrame]]: Effective movement records
+                and, when requested, the raw sensor data of the window.
+        """
+        try:
+            start = row["start_time"].tz_localize('UTC') # ensure_utc(row.start_time)
+            end = row["end_time"].tz_localize('UTC')     # ensure_utc(row.end_time)
+        except Exception:
+            if self.verbose:
+                print(i18n._("MVNT-TS-NOV").format(row=row))
+            return [], None
+
+        if pd.isnull(start) or pd.isnull(end):
+            if self.verbose:
+                print(i18n._("MVNT-TS-NOV").format(row=row))
+            return [], None
+
+        codeid_id = row["codeid_id"]
+        foot = row["foot"]
+        cid = row.get("CodeID", codeid_id)
+
+        if vb > 1:
+            print(i18n._("MVNT-QRY-DAT").format(
+                cid=cid, frm=start, dur=(end - start).total_seconds()
+            ))
+
+        valid_segments = None
+        if self.prescreen_every and not export:
+            # Only the stretches with some activity are read
+            valid_segments = self._scan_leg_prescreened(start, end, codeid_id, foot, vb)
+
+        if valid_segments is not None:
+            raw = None
+        elif self.chunk_rows and not export:
+            # Bounded memory: the leg is read and evaluated block by block
+            raw = None
+            valid_segments = self._scan_leg_chunks(start, end, codeid_id, foot, vb)
+        else:
+            # The export needs the raw axes
+            sensor_data = self.fetch_sensor_data(start, end, codeid_id, foot,
+                                                 magnitudes=self.server_magnitude and not export)
             sensor_data.drop(columns=['result', 'table', '_start', '_stop'],
                              inplace=True, errors='ignore')
-            for col in sensor_data.columns:
-                if pd.api.types.is_datetime64tz_dtype(sensor_data[col]):
-                    sensor_data[col] = sensor_data[col].dt.tz_localize(None)
             if sensor_data.empty:
-                continue
+                return [], None
+            if isinstance(sensor_data["_time"].dtype, pd.DatetimeTZDtype):
+                sensor_data["_time"] = to_naive_utc(sensor_data["_time"])
 
-            # Export to Excel if requested
-            if writer:
-                sheet_base = f"{codeid_id}_{foot}_{start.strftime('%H%M%S')}"[:25]
-                max_rows = 1_000_000
-                for i in range((len(sensor_data) - 1) // max_rows + 1):
-                    part = sensor_data.iloc[i*max_rows:(i+1)*max_rows].copy()
-                    for col in part.select_dtypes(['datetimetz']).columns:
-                        part[col] = pd.to_datetime(part[col], utc=True).dt.tz_localize(None)
-                    sheet = f"{sheet_base}_{i+1}"
-                    part.to_excel(writer, sheet_name=sheet, index=False)
-                    if vb > 0:
-                        print(i18n._("MVNT-XLSX-DAT").format(shn=sheet, file=nomf))
+            # Shallow copy: the export thread reads it while the magnitudes are added
+            raw = sensor_data.copy(deep=False) if export else None
 
             if vb > 1:
                 print(i18n._("MVNT-QRY-REC").format(ns=sensor_data.shape[0]))
 
             sensor_data = self.calculate_magnitude(sensor_data)
             if "|a|" not in sensor_data.columns or "|g|" not in sensor_data.columns:
-                continue
+                return [], raw
 
             sensor_data = sensor_data.sort_values("_time").reset_index(drop=True)
             acc = sensor_data["|a|"].to_numpy()
             gyro = sensor_data["|g|"].to_numpy()
 
-            segments = segment_fixed_windows(sensor_data, 256) # Welch requiere 256 puntos
-
-            for seg_start, seg_end in segments:
-                seg_data = sensor_data[(sensor_data["_time"] >= seg_start) &
-                                       (sensor_data["_time"] <= seg_end)]
-
-                acc_seg = seg_data["|a|"].to_numpy()
-                gyro_seg = seg_data["|g|"].to_numpy()
-
-                acc_ok = self.is_effective_by_welch(acc_seg,self.accel_power_threshold) and \
-                         self.is_effective_by_time(acc_seg-1, self.accel_threshold)
-                gyro_ok = self.is_effective_by_welch(gyro_seg, self.gyro_power_threshold) and \
-                          self.is_effective_by_time(gyro_seg, self.gyro_threshold)
-
-                if acc_ok or gyro_ok:
-                    valid_segments.append((seg_start, seg_end))
-
-            merged_segments = merge_connected_segments(valid_segments, max_gap_sec=10)
-            for mstart, mend in merged_segments:
-                results.append({
-                    "codeid_id": codeid_id,
-                    "start_time": mstart.isoformat(),
-                    "end_time": mend.isoformat(),
-                    "duration": (mend - mstart).total_seconds(),
-                    "leg": foot
-                })
-
-            if vb >= 3:
-                print(i18n._("LST-SEGS").format(results=pd.DataFrame(results)))
-                
-            if vb >= 2:
-                print(i18n._("MVNT-WLK-FOOT").format(
-                    codeid_id=codeid_id, foot=foot,
-                    dur=(end - start).total_seconds()
-                ))
-
-        if writer:
-            writer.close()
+            # All the 256-sample windows are evaluated in a single batch
+            with METRICS.span("compute.windows"):
+                first, last = self.engine.valid_window_bounds(acc, gyro)
+            METRICS.count("compute.samples", len(acc))
+            # Naive UTC timestamps (compact frames hold int64 ns)
+            times = pd.to_datetime(sensor_data["_time"])
+            valid_segments = list(zip(times.iloc[first].tolist(),
+                                      times.iloc[last].tolist()))
+
+        results = []
+        merged_segments = self.merge_connected_segments(valid_segments, max_gap_sec=10)
+        for mstart, mend in merged_segments:
+            results.append({
+                "codeid_id": codeid_id,
+                "start_time": mstart,
+                "end_time": mend,
+                "duration": (mend - mstart).total_seconds(),
+                "leg": foot
+            })
+
+        if vb >= 3:
+            print(i18n._("LST-SEGS").format(results=pd.DataFrame(results)))
+
+        if vb >= 2:
+            print(i18n._("MVNT-WLK-FOOT").format(
+                cid=codeid_id, codeid_id=codeid_id, foot=foot,
+                dur=(end - start).total_seconds()
+            ))
+        return results, raw
+
+    def detect_effective_movement(self,activity_windows: pd.DataFrame,
+                                  nomf: str = None,vb: int = 0,
+                                  workers: int = 1,
+                                  export_format: Optional[str] = None,
+                                  sink: Optional[RawExportSink] = None) -> pd.DataFrame:
+        """Detects intervals of effective movement from sensor data.
+
+        Args:
+            activity_windows (pd.DataFrame): DataFrame containing rows with start_time, 
+                                             end_time, codeid_id, and foot.
+            nomf (str, optional): Destination of the raw sensor data (default
+                                  is None, no export): a ``.parquet`` file, a
+                                  directory for a Parquet dataset partitioned
+                                  by CodeID/foot/date, or a ``.xlsx`` file.
+                                  It is written by a background thread.
+            vb (int): Verbosity level (0 = silent, 1 = info, 2 = debug).
+            workers (int): Number of processes used to analyse the legs. With
+                           1 (default) the rows are processed serially. The
+                           processes are kept for later calls until close().
+            export_format (str, optional): 'parquet' or 'xlsx'; inferred from
+                           nomf when None.
+            sink (RawExportSink, optional): Open export sink to use instead of
+                           nomf; it is left open, so several calls (e.g. one
+                           per page of iter_legs) write to the same output.
+
+        Returns:
+            pd.DataFrame: Validated segments with effective movement data.
+        """
+        if "foot" not in activity_windows.columns:
+            raise ValueError(i18n._("MVNT-ROOT-MISS"))
+
+        results = []
+        writer = sink or (open_export_sink(nomf, export_format, vb) if nomf else None)
+        rows = activity_windows.to_dict("records")
+
+        try:
+            if workers > 1 and len(rows) > 1:
+                # Each process owns its DataManager; map() keeps the serial order
+                pool = self._process_pool(workers)
+                try:
+                    outputs = pool.map(_detect_leg_task, rows,
+                                       [writer is not None] * len(rows), [vb] * len(rows))
+                    for row, (leg_results, raw, metrics) in zip(rows, outputs):
+                        METRICS.merge(metrics)
+                        results.extend(leg_results)
+                        if writer and raw is not None:
+                            writer.submit(raw, row["codeid_id"], row["foot"], row["start_time"])
+                except BrokenProcessPool:
+                    # A worker died: the next call starts a new pool
+                    self._pool = None
+                    raise
+            else:
+                for row in rows:
+                    leg_results, raw = self._detect_leg(row, writer is not None, vb)
+                    results.extend(leg_results)
+                    if writer and raw is not None:
+                        writer.submit(raw, row["codeid_id"], row["foot"], row["start_time"])
+        finally:
+            # A sink opened here is closed even if a leg raises, so that the
+            # output gets its footer
+            if writer is not None and writer is not sink:
+                writer.close()
 
         try:
-            validated = [EffectiveMovement(**r).model_dump() for r in results]
-            return pd.DataFrame(validated)
+            with METRICS.span("pydantic.validate"):
+                validated = [EffectiveMovement(**r).model_dump() for r in results]
+            df = pd.DataFrame(validated)
+            if not df.empty:
+                # Canonical naive UTC datetime64[ns] (pydantic returns datetime objects)
+                df["start_time"] = to_naive_utc(df["start_time"])
+                df["end_time"] = to_naive_utc(df["end_time"])
+            return df
         except ValidationError as e:
             print(i18n._("MVNT-VAL-EFF-ERR").format(e=e))
             return pd.DataFrame()
 
+    @METRICS.timed("compute.gait")
     def detect_effective_gait(self, df_effective: pd.DataFrame,vb: int = 0) -> pd.DataFrame:
         """Detects overlapping periods of effective movement for both feet.
 
@@ -380,38 +909,36 @@ class MovementDetector:
         if df_effective.empty:
             return pd.DataFrame(columns=['codeid_id', 'start_time', 'end_time', 'duration'])
 
-        # Coerce the datetime format.
-        df = df_effective.copy()
-        df['start_time'] = df['start_time'].apply(lambda x: x if '.' in x else x + '.000000')
-        df['start_time'] = pd.to_datetime(df['start_time'], format="%Y-%m-%dT%H:%M:%S.%f")
-        df['end_time'] = df['end_time'].apply(lambda x: x if '.' in x else x + '.000000')
-        df['end_time'] = pd.to_datetime(df['end_time'], format="%Y-%m-%dT%H:%M:%S.%f")
+        # Naive UTC datetime64[ns]; a no-op for the output of detect_effective_movement
+        df = df_effective.assign(start_time=to_naive_utc(df_effective['start_time']),
+                                 end_time=to_naive_utc(df_effective['end_time']))
 
-        gait_rows = []
+        gait = []
 
         for codeid, grp in df.groupby('codeid_id'):
-            left = grp[grp['leg'] == 'Left'][['start_time', 'end_time']]
-            right = grp[grp['leg'] == 'Right'][['start_time', 'end_time']]
+            left = grp[grp['leg'] == 'Left']
+            right = grp[grp['leg'] == 'Right']
             if left.empty or right.empty:
                 continue
 
-            # Cartesian product to find overlapping intervals
-            left = left.assign(_key=1)
-            right = right.assign(_key=1)
-            merged = left.merge(right, on='_key', suffixes=('_L', '_R')).drop(columns='_key')
-
-            for _, r in merged.iterrows():
-                st = max(r['start_time_L'], r['start_time_R'])
-                en = min(r['end_time_L'], r['end_time_R'])
-                if st < en:
-                    gait_rows.append({
-                        'codeid_id': codeid,
-                        'start_time': st,
-                        'end_time': en,
-                        'duration': (en - st).total_seconds()
-                    })
-
-        return pd.DataFrame(gait_rows)
+            # Sorted sweep over both feet (strict overlap: st < en)
+            ia, ib = overlap_pairs(to_ns(left['start_time']), to_ns(left['end_time']),
+                                   to_ns(right['start_time']), to_ns(right['end_time']),
+                                   closed=False)
+            if len(ia) == 0:
+                continue
+            st = np.maximum(left['start_time'].to_numpy()[ia], right['start_time'].to_numpy()[ib])
+            en = np.minimum(left['end_time'].to_numpy()[ia], right['end_time'].to_numpy()[ib])
+            gait.append(pd.DataFrame({
+                'codeid_id': codeid,
+                'start_time': st,
+                'end_time': en,
+                'duration': (en - st) / np.timedelta64(1, 's')
+            }))
+
+        if not gait:
+            return pd.DataFrame()
+        return pd.concat(gait, ignore_index=True)
 
     def save_to_postgresql(self, table_name: str, df: pd.DataFrame, verbose: int = 0) -> None:
         """Saves the given DataFrame to a PostgreSQL table using the DataManager.
@@ -429,4 +956,27 @@ class MovementDetector:
         try:
             self.data_manager.store_data(table_name, df, verbose)
         except Exception as e:
-            print(i18n._("PGSQL-INS-TAB-ERR").format(fable_name=table_name, e=e))
\ No newline at end of file
+            print(i18n._("PGSQL-INS-TAB-ERR").format(fable_name=table_name, e=e))
+
+
+# Detector owned by each worker process of the parallel mode
+_worker_detector: Optional[MovementDetector] = None
+
+
+def _init_worker(config_file: str, sampling_rate: float, sect: str, verbose: int,
+                 raise_errors: bool = False) -> None:
+    """Creates the per-process detector (and its own DB connections)."""
+    global _worker_detector
+    _worker_detector = MovementDetector(config_file, sampling_rate, sect=sect,
+                                        verbose=verbose, load_segments=False,
+                                        raise_errors=raise_errors)
+
+
+def _detect_leg_task(row: dict, export: bool, vb: int) -> Tuple[List[dict], Optional[pd.DataFrame], dict]:
+    """Runs MovementDetector._detect_leg inside a worker process.
+
+    The metrics recorded by the worker for this row are returned along with
+    the results, so the parent process can merge them.
+    """
+    results, raw = _worker_detector._detect_leg(row, export, vb)
+    return results, raw, METRICS.drain()
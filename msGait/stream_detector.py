@@ -0,0 +1,215 @@
+import json
+import queue
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from pydantic import ValidationError
+
+from msTools import i18n
+from msTools.data_manager import DataManager
+from msTools.timeutils import to_epoch_ns
+from msGait.models import EffectiveMovement
+from msGait.window_engine import WindowEngine, WindowScanner
+
+
+class StreamingMovementDetector:
+    """Online effective-movement detector for a single (CodeID, foot).
+
+    Sample blocks are fed as they arrive. The samples of the last incomplete
+    256-sample window are kept for the next block, so every window (Welch
+    band power and continuous hits) is evaluated exactly as in the batch
+    MovementDetector. Valid windows are merged on the fly with the same
+    max_gap_sec rule as merge_connected_segments, and a segment is emitted
+    as soon as no later window can still be merged into it. The emission
+    latency is therefore bounded by max_gap_sec plus one window.
+    """
+
+    def __init__(self, engine: WindowEngine, codeid_id: int, foot: str,
+                 max_gap_sec: float = 10.) -> None:
+        """Creates a detector with no samples.
+
+        Args:
+            engine (WindowEngine): Engine with the detection thresholds.
+            codeid_id (int): ID of the CodeID in the codeids table.
+            foot (str): 'Left' or 'Right'.
+            max_gap_sec (float): Maximum gap for merging consecutive windows.
+        """
+        self.codeid_id = codeid_id
+        self.foot = foot
+        self.max_gap = np.timedelta64(int(max_gap_sec * 1e9), "ns")
+        self.scanner = WindowScanner(engine)
+        self._start = None      # Open segment (datetime64[ns], UTC)
+        self._end = None
+        self._last_time = None  # Last sample accepted
+
+    @classmethod
+    def from_config(cls, config_file: str, sampling_rate: float, codeid_id: int,
+                    foot: str, sect: str = "movement") -> "StreamingMovementDetector":
+        """Builds the detector from the same YAML section as MovementDetector.
+
+        Args:
+            config_file (str): Path to the YAML configuration file.
+            sampling_rate (float): Sampling rate of the sensor data (in Hz).
+            codeid_id (int): ID of the CodeID in the codeids table.
+            foot (str): 'Left' or 'Right'.
+            sect (str): Section in the YAML config with the detection parameters.
+
+        Returns:
+            StreamingMovementDetector: Detector with no samples.
+        """
+        params = DataManager(config_path=config_file).get_config(sect)
+        return cls(WindowEngine.from_params(params, sampling_rate), codeid_id, foot)
+
+    @property
+    def open_segment(self) -> Optional[tuple]:
+        """(start, end) of the segment still growing, or None."""
+        if self._start is None:
+            return None
+        return pd.Timestamp(self._start), pd.Timestamp(self._end)
+
+    def _record(self, start: np.datetime64, end: np.datetime64) -> dict:
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        return {
+            "codeid_id": self.codeid_id,
+            "start_time": start,
+            "end_time": end,
+            "duration": (end - start).total_seconds(),
+            "leg": self.foot
+        }
+
+    def feed(self, block: pd.DataFrame) -> List[dict]:
+        """Adds a block of samples and returns the segments it closes.
+
+        Args:
+            block (pd.DataFrame): Samples with _time and the Ax, Ay, Az, Gx,
+                Gy, Gz fields. Samples not newer than the previous block are
+                discarded.
+
+        Returns:
+            List[dict]: Closed segments, as EffectiveMovement records.
+        """
+        if block.empty:
+            return []
+        times = to_epoch_ns(block["_time"]).view("datetime64[ns]")
+        order = np.argsort(times, kind="stable")
+        if self._last_time is not None:
+            order = order[times[order] > self._last_time]
+        if len(order) == 0:
+            return []
+        times = times[order]
+        axes = {c: block[c].to_numpy(dtype=np.float64)[order]
+                for c in ("Ax", "Ay", "Az", "Gx", "Gy", "Gz")}
+        acc = np.sqrt(axes["Ax"]**2 + axes["Ay"]**2 + axes["Az"]**2)
+        gyro = np.sqrt(axes["Gx"]**2 + axes["Gy"]**2 + axes["Gz"]**2)
+        self._last_time = times[-1]
+
+        closed = []
+        first, last = self.scanner.feed(times, acc, gyro)
+        for start, end in zip(first, last):
+            if self._start is not None and start - self._end <= self.max_gap:
+                self._end = max(self._end, end)
+            else:
+                if self._start is not None:
+                    closed.append(self._record(self._start, self._end))
+                self._start, self._end = start, end
+
+        # Later windows start at the first pending sample (or after the last one)
+        if self._start is not None:
+            since = self.scanner.pending_since
+            if (since - self._end > self.max_gap) if since is not None \
+                    else (self._last_time - self._end >= self.max_gap):
+                closed.append(self._record(self._start, self._end))
+                self._start = self._end = None
+        return self._validate(closed)
+
+    def flush(self) -> List[dict]:
+        """Ends the stream: closes the open segment, if any.
+
+        Returns:
+            List[dict]: The last segment (or an empty list).
+        """
+        closed = []
+        if self._start is not None:
+            closed.append(self._record(self._start, self._end))
+            self._start = self._end = None
+        return self._validate(closed)
+
+    def run(self, source: Iterable[pd.DataFrame]) -> Iterator[dict]:
+        """Feeds every block of a source and yields the segments as they close.
+
+        Args:
+            source (Iterable[pd.DataFrame]): Time-ordered sample blocks.
+
+        Yields:
+            dict: Closed EffectiveMovement records.
+        """
+        for block in source:
+            yield from self.feed(block)
+        yield from self.flush()
+
+    @staticmethod
+    def _validate(records: List[dict]) -> List[dict]:
+        try:
+            return [EffectiveMovement(**r).model_dump() for r in records]
+        except ValidationError as e:
+            print(i18n._("MVNT-VAL-EFF-ERR").format(e=e))
+            return []
+
+
+def file_source(path: str, chunk_rows: int = 10_000) -> Iterator[pd.DataFrame]:
+    """Replays a CSV or Parquet file of raw samples in blocks.
+
+    Args:
+        path (str): File with _time and the Ax, Ay, Az, Gx, Gy, Gz columns.
+        chunk_rows (int): Number of samples per block.
+
+    Yields:
+        pd.DataFrame: Blocks of at most chunk_rows samples.
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def queue_source(q: queue.Queue, timeout: Optional[float] = None) -> Iterator[pd.DataFrame]:
+    """Yields the blocks put in a queue until a None sentinel arrives.
+
+    Args:
+        q (queue.Queue): Queue filled by the producer (e.g. a receiver thread).
+        timeout (Optional[float]): Seconds to wait for each block; queue.Empty
+            is raised when it expires.
+
+    Yields:
+        pd.DataFrame: Blocks in arrival order.
+    """
+    while True:
+        block = q.get(timeout=timeout)
+        if block is None:
+            return
+        yield block
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replays a raw sample file through the streaming detector.")
+    parser.add_argument("file", help="CSV or Parquet file with _time, Ax, Ay, Az, Gx, Gy, Gz")
+    parser.add_argument("-c", "--config", required=True, help="Path to config.yaml")
+    parser.add_argument("--codeid-id", type=int, required=True, help="ID in the codeids table")
+    parser.add_argument("--foot", choices=["Left", "Right"], required=True)
+    parser.add_argument("--sampling-rate", type=float, default=50, help="Sampling rate (Hz)")
+    parser.add_argument("--chunk-rows", type=int, default=10_000, help="Samples per block")
+    args = parser.parse_args(argv)
+
+    detector = StreamingMovementDetector.from_config(
+        args.config, args.sampling_rate, args.codeid_id, args.foot)
+    for segment in detector.run(file_source(args.file, args.chunk_rows)):
+        print(json.dumps(segment, default=lambda t: t.isoformat()))
+
+
+if __name__ == "__main__":
+    main()
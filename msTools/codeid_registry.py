@@ -0,0 +1,135 @@
+from typing import Dict, Iterable, List, Tuple
+
+from msTools.metrics import METRICS
+from msTools.models import CodeID
+
+
+class CodeIDRegistry:
+    """
+    Registro bidireccional CodeID <-> id de la tabla codeids.
+
+    Resuelve en bloque con una única consulta `= ANY(%s)` y sirve desde
+    memoria las búsquedas repetidas, evitando una ida y vuelta por fila.
+    """
+
+    def __init__(self, data_manager) -> None:
+        """
+        Inicializa el registro vacío.
+
+        :param data_manager: DataManager que aporta la conexión a PostgreSQL.
+        :type data_manager: DataManager
+        """
+        self.data_manager = data_manager
+        self._by_id: Dict[int, str] = {}
+        self._by_codeid: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def _remember(self, pairs: Iterable[Tuple[int, str]]) -> None:
+        for codeid_id, codeid in pairs:
+            self._by_id[int(codeid_id)] = codeid
+            self._by_codeid[codeid] = int(codeid_id)
+
+    def _select(self, column: str, values: List) -> List[Tuple[int, str]]:
+        cast = "int[]" if column == "id" else "text[]"
+        METRICS.count("codeid.lookups", len(values))
+        with METRICS.span("pg.codeid_lookup"), self.data_manager.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, codeid FROM codeids WHERE {column} = ANY(%s::{cast});",
+                (values,)
+            )
+            return cursor.fetchall()
+
+    def load(self) -> int:
+        """
+        Carga en memoria la tabla codeids completa.
+
+        :return: Número de CodeIDs registrados.
+        :rtype: int
+        """
+        with self.data_manager.pg_conn.cursor() as cursor:
+            cursor.execute("SELECT id, codeid FROM codeids;")
+            self._remember(cursor.fetchall())
+        return len(self)
+
+    def resolve_ids(self, ids: Iterable[int]) -> Dict[int, str]:
+        """
+        Devuelve el CodeID de cada id, consultando sólo los que no están en memoria.
+
+        :param ids: ids de la tabla codeids.
+        :return: Diccionario id -> CodeID (los ids inexistentes no aparecen).
+        :rtype: dict
+        """
+        ids = {int(i) for i in ids}
+        missing = [i for i in ids if i not in self._by_id]
+        if missing:
+            self._remember(self._select("id", missing))
+        return {i: self._by_id[i] for i in ids if i in self._by_id}
+
+    def resolve_codeids(self, codeids: Iterable[str]) -> Dict[str, int]:
+        """
+        Devuelve el id de cada CodeID, consultando sólo los que no están en memoria.
+
+        :param codeids: CodeIDs a resolver.
+        :return: Diccionario CodeID -> id (los CodeIDs inexistentes no aparecen).
+        :rtype: dict
+        """
+        codeids = set(codeids)
+        missing = [c for c in codeids if c not in self._by_codeid]
+        if missing:
+            self._remember(self._select("codeid", missing))
+        return {c: self._by_codeid[c] for c in codeids if c in self._by_codeid}
+
+    def get_codeid(self, codeid_id: int) -> str:
+        """
+        CodeID asociado a un id de la tabla codeids.
+
+        :raises ValueError: Si el id no existe.
+        """
+        found = self.resolve_ids([codeid_id])
+        if int(codeid_id) not in found:
+            raise ValueError(f"No se encontró CodeID para id {codeid_id}.")
+        return found[int(codeid_id)]
+
+    def get_id(self, codeid: str) -> int:
+        """
+        id de la tabla codeids asociado a un CodeID.
+
+        :raises ValueError: Si el CodeID no existe.
+        """
+        found = self.resolve_codeids([codeid])
+        if codeid not in found:
+            raise ValueError(f"No se encontró id para CodeID {codeid}.")
+        return found[codeid]
+
+    def register(self, codeids: Iterable[str]) -> Dict[str, Tuple[int, bool]]:
+        """
+        Inserta en bloque los CodeIDs desconocidos y devuelve el id de todos.
+
+        :param codeids: CodeIDs a registrar (se validan con pydantic).
+        :return: Diccionario CodeID -> (id, es_nuevo).
+        :rtype: dict
+        :raises ValidationError: Si algún CodeID no es válido.
+        """
+        codeids = list(dict.fromkeys(CodeID(codeid=c).codeid for c in codeids))
+        known = self.resolve_codeids(codeids)
+        result = {c: (known[c], False) for c in known}
+        pending = [c for c in codeids if c not in known]
+        if pending:
+            METRICS.count("codeid.registered", len(pending))
+            with METRICS.span("pg.codeid_register"), self.data_manager.pg_conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO codeids (codeid) SELECT unnest(%s::text[]) "
+                    "ON CONFLICT (codeid) DO NOTHING RETURNING id, codeid;",
+                    (pending,)
+                )
+                inserted = cursor.fetchall()
+            self.data_manager.pg_conn.commit()
+            self._remember(inserted)
+            result.update({c: (i, True) for i, c in inserted})
+            # Insertados en paralelo por otro proceso entre la consulta y el INSERT
+            lost = [c for c in pending if c not in result]
+            if lost:
+                result.update({c: (i, False) for c, i in self.resolve_codeids(lost).items()})
+        return result
@@ -65,3 +65,31 @@ CREATE TABLE IF NOT EXISTS effective_gait (
     duration   NUMERIC NOT NULL
 );
 CREATE INDEX IF NOT EXISTS idx_effective_gait_codeid ON effective_gait(codeid_id);
+
+-- Marcas de agua de la ingesta incremental (find_mscodeids --incremental)
+CREATE TABLE IF NOT EXISTS ingest_watermark (
+    codeid_id INT REFERENCES codeids(id),
+    foot TEXT NOT NULL,                            -- "Left" o "Right"
+    last_time TIMESTAMP WITH TIME ZONE NOT NULL,   -- Último _time ingerido de la pierna
+    codeleg_id INT REFERENCES activity_leg(id),    -- Último segmento de la pierna (puede extenderse)
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    PRIMARY KEY (codeid_id, foot)
+);
+
+-- Búsqueda de activity_all por pareja de segmentos (upsert incremental)
+CREATE INDEX IF NOT EXISTS idx_activity_all_codeleg_ids ON activity_all(codeleg_ids);
+-- Búsqueda de activity_all por rango de tiempo (iter_segments, find_gait -f/-u)
+CREATE INDEX IF NOT EXISTS idx_activity_all_time ON activity_all(start_time, end_time);
+
+-- Cola de trabajos de find_gait (ms_monitoring.gait_jobs): un trabajo por segmento de activity_all
+CREATE TABLE IF NOT EXISTS gait_jobs (
+    act_all_id INT PRIMARY KEY REFERENCES activity_all(id),
+    status TEXT NOT NULL DEFAULT 'pending',     -- pending | running | done | failed
+    attempts INT NOT NULL DEFAULT 0,            -- Veces que se ha reclamado
+    worker TEXT,                                -- Worker que lo tiene reclamado (host:pid)
+    lease_until TIMESTAMP WITH TIME ZONE,       -- Vencimiento del plazo del worker
+    last_error TEXT,
+    enqueued_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_gait_jobs_claim ON gait_jobs(status, act_all_id);
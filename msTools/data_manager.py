@@ -1,42 +1,67 @@
 import pandas as pd
 from influxdb_client import InfluxDBClient
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 import yaml
 from msTools.models import CodeID, ActivityLeg, ActivityAll
+from msTools.codeid_registry import CodeIDRegistry
+from msTools.flux_csv import DIALECT, parse_flux_csv
 from msTools import i18n
+from msTools.metrics import METRICS
+from msTools.timeutils import db_times, ensure_utc, ensure_utc_array, naive_utc_columns
 from msGait.models import EffectiveMovement, ActivitySegment
 from pydantic import ValidationError
-from typing import List, Dict, Optional, Tuple
+from typing import Iterator, List, Dict, Optional, Tuple
+from contextlib import contextmanager
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 import datetime
+import numpy as np
+import threading
+import time
+import uuid
+from itertools import islice
+
+# Columnas de activity_all que devuelven segments_retrieval e iter_segments
+SEGMENT_COLUMNS = ["id", "start_time", "end_time", "duration",
+                   "codeid_ids", "codeleg_ids", "active_legs"]
 
 
 class DataManager:
     def __init__(self, config_path: str)->None:
         """
-        Inicializa el DataManager con las conexiones a InfluxDB y PostgreSQL.
+        Inicializa el DataManager. Las conexiones a InfluxDB y PostgreSQL se
+        crean de forma perezosa, la primera vez que se usan.
         
         :param config_path: Ruta del archivo YAML con la configuración.
         :type config_path: str
         """
         self.config = self.load_config(config_path)
 
-        # Configurar PostgreSQL
-        self.pg_conn = self._connect_postgresql()
+        # PostgreSQL: pool de conexiones, una conexión por hilo
+        self._pg_pool: Optional[ThreadedConnectionPool] = None
+        self._local = threading.local()
 
-        # Configurar InfluxDB
-        self.influxdb_client = InfluxDBClient(
-            url=self.config["influxdb"]["url"],
-            token=self.config["influxdb"]["token"],
-            org=self.config["influxdb"]["org"],
-            timeout=self.config["influxdb"]["timeout"]
-        )
+        # InfluxDB
+        self._influxdb_client: Optional[InfluxDBClient] = None
+        self._lock = threading.Lock()
         self.bucket: str = self.config["influxdb"]["bucket"]
         self.measurement: str = self.config['influxdb']['measurement']
 
+        # Registro en memoria CodeID <-> id de la tabla codeids
+        self.codeids = CodeIDRegistry(self)
+
+    def __enter__(self) -> "DataManager":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close_all()
+
     def __del__(self)-> None:
-        self.close_influxdb()
-        self.close_pg()
+        try:
+            self.close_all()
+        except Exception:
+            pass
 
     def load_config(self, config_path: str) -> Dict:
         """
@@ -64,33 +89,115 @@ class DataManager:
         else:
             return None
 
-    def _connect_postgresql(self) -> psycopg2.extensions.connection:
+    def _create_pg_pool(self) -> ThreadedConnectionPool:
         """
-        Establece una conexión con PostgreSQL.
+        Crea el pool de conexiones con PostgreSQL. El tamaño se toma de las
+        claves opcionales `pool_min` y `pool_max` de la sección postgresql.
 
-        :return: Objeto de conexión de PostgreSQL.
-        :rtype: object
+        :return: Pool de conexiones de PostgreSQL.
+        :rtype: ThreadedConnectionPool
         """
+        pg = self.config["postgresql"]
         try:
-            return psycopg2.connect(
-                host=self.config["postgresql"]["host"],
-                database=self.config["postgresql"]["database"],
-                user=self.config["postgresql"]["user"],
-                password=self.config["postgresql"]["password"]
+            return ThreadedConnectionPool(
+                pg.get("pool_min", 1), pg.get("pool_max", 10),
+                host=pg["host"],
+                database=pg["database"],
+                user=pg["user"],
+                password=pg["password"]
             )
         except psycopg2.OperationalError as e:
             print(i18n._("PGSQL-CONN-ERR").format(e=e))
             raise
 
+    @property
+    def pg_pool(self) -> ThreadedConnectionPool:
+        """Pool de conexiones de PostgreSQL, creado en el primer uso."""
+        if self._pg_pool is None:
+            with self._lock:
+                if self._pg_pool is None:
+                    self._pg_pool = self._create_pg_pool()
+        return self._pg_pool
+
+    @property
+    def pg_conn(self) -> psycopg2.extensions.connection:
+        """
+        Conexión de PostgreSQL del hilo actual. Se toma del pool en el primer
+        uso y se mantiene hasta llamar a release_pg() desde el mismo hilo.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            conn = self.pg_pool.getconn()
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[psycopg2.extensions.connection]:
+        """
+        Presta una conexión del pool al hilo actual mientras dura el bloque
+        `with`. Si el hilo ya tenía una conexión, se reutiliza y no se libera.
+        """
+        pinned = getattr(self._local, "conn", None) is not None
+        try:
+            yield self.pg_conn
+        finally:
+            if not pinned:
+                self.release_pg()
+
+    def release_pg(self) -> None:
+        """Devuelve al pool la conexión del hilo actual."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            if self._pg_pool is not None and not self._pg_pool.closed:
+                self._pg_pool.putconn(conn)
+
+    @property
+    def influxdb_client(self) -> InfluxDBClient:
+        """Cliente de InfluxDB, creado en el primer uso."""
+        if self._influxdb_client is None:
+            with self._lock:
+                if self._influxdb_client is None:
+                    self._influxdb_client = InfluxDBClient(
+                        url=self.config["influxdb"]["url"],
+                        token=self.config["influxdb"]["token"],
+                        org=self.config["influxdb"]["org"],
+                        timeout=self.config["influxdb"]["timeout"]
+                    )
+        return self._influxdb_client
+
+    def create_influx_async_client(self):
+        """
+        Crea un cliente asíncrono de InfluxDB (InfluxDBClientAsync). Debe crearse,
+        usarse y cerrarse (``await client.close()``) dentro del mismo bucle de
+        eventos.
+
+        :return: Cliente asíncrono de InfluxDB.
+        :rtype: InfluxDBClientAsync
+        :raises ImportError: Si aiohttp no está instalado.
+        """
+        from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+        return InfluxDBClientAsync(
+            url=self.config["influxdb"]["url"],
+            token=self.config["influxdb"]["token"],
+            org=self.config["influxdb"]["org"],
+            timeout=self.config["influxdb"]["timeout"]
+        )
+
     def close_pg(self) -> None:
-        self.pg_conn.close()
+        if self._pg_pool is not None:
+            self._pg_pool.closeall()
+            self._pg_pool = None
+        self._local = threading.local()
 
     def close_influxdb(self) -> None:
-        self.influxdb_client.close()
+        if self._influxdb_client is not None:
+            self._influxdb_client.close()
+            self._influxdb_client = None
 
     def close_all(self) -> None:
-        self.pg_conn.close()
-        self.influxdb_client.close()
+        self.close_pg()
+        self.close_influxdb()
 
     def get_influx_client(self) -> InfluxDBClient:
         """
@@ -110,7 +217,8 @@ class DataManager:
         """
         try:
             required_tables = [
-                "codeids", "effective_movement", "activity_leg", "activity_all"
+                "codeids", "effective_movement", "activity_leg", "activity_all",
+                "ingest_watermark", "gait_jobs"
             ]  # Tablas actualizadas
 
             with self.pg_conn.cursor() as cursor:
@@ -165,24 +273,96 @@ class DataManager:
             '''
             
             query_api = self.influxdb_client.query_api()
-            result = query_api.query(query, org=self.config['influxdb']['org'])
+            with METRICS.span("influx.query"):
+                result = query_api.query(query, org=self.config['influxdb']['org'])
+            METRICS.count("influx.queries")
             return [record['CodeID'] for table in result for record in table.records]
         except Exception as e:
             print(i18n._("INFL-QRY-COD-ERR").format(e=e))
             return []
         
 
-    def fetch_data(self, query: str) -> pd.DataFrame:
+    def stream_query(self, query: str, chunk_rows: int = 100_000,
+                     columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """
+        Ejecuta una consulta Flux en modo streaming y devuelve el resultado en
+        bloques de `chunk_rows` filas. Los registros se vuelcan por columnas y
+        se descartan al momento, de modo que la memoria depende del tamaño del
+        bloque y no de la longitud del resultado.
+
+        :param query: Consulta Flux.
+        :param chunk_rows: Número máximo de filas por bloque.
+        :param columns: Columnas a conservar (por defecto, las del primer registro).
+        :return: Iterador de DataFrames en el orden devuelto por InfluxDB.
+        :rtype: Iterator[pd.DataFrame]
+        """
+        # Sólo se cronometra el tiempo dentro del generador, no el de quien consume
+        t0 = time.perf_counter()
+        records = self.influxdb_client.query_api().query_stream(
+            query, org=self.config['influxdb']['org'])
+        METRICS.count("influx.queries")
+        block = None
+        n = 0
+        for record in records:
+            values = record.values
+            if block is None:
+                block = {c: [] for c in (columns or list(values.keys()))}
+            for c, col in block.items():
+                col.append(values.get(c))
+            n += 1
+            if n >= chunk_rows:
+                METRICS.observe("influx.query", time.perf_counter() - t0)
+                METRICS.count("influx.rows", n)
+                yield pd.DataFrame(block)
+                t0 = time.perf_counter()
+                block = {c: [] for c in block}
+                n = 0
+        METRICS.observe("influx.query", time.perf_counter() - t0)
+        if n:
+            METRICS.count("influx.rows", n)
+            yield pd.DataFrame(block)
+
+    def query_columns(self, query: str, columns: Optional[List[str]] = None,
+                      dtypes: Optional[Dict[str, str]] = None) -> Dict[str, np.ndarray]:
+        """
+        Ejecuta una consulta Flux y decodifica la respuesta CSV directamente
+        en arrays de numpy (ver msTools.flux_csv), sin pasar por FluxRecord.
+
+        :param query: Consulta Flux.
+        :param columns: Columnas a devolver (por defecto todas salvo result y table).
+        :param dtypes: Tipo numpy por columna numérica (p. ej. ``{"Ax": "float32"}``).
+        :return: Diccionario columna -> array; las fechas en int64 ns (UTC).
+        :rtype: Dict[str, np.ndarray]
+        """
+        with METRICS.span("influx.query"):
+            response = self.influxdb_client.query_api().query_raw(
+                query, org=self.config['influxdb']['org'], dialect=DIALECT)
+            try:
+                data = response.data if hasattr(response, "data") else response
+            finally:
+                if hasattr(response, "release_conn"):
+                    response.release_conn()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with METRICS.span("influx.decode"):
+            result = parse_flux_csv(data, columns=columns, dtypes=dtypes)
+        METRICS.count("influx.queries")
+        METRICS.count("influx.bytes", len(data))
+        METRICS.count("influx.rows", len(next(iter(result.values()))) if result else 0)
+        return result
+
+    def fetch_data(self, query: str, params: Optional[tuple] = None) -> pd.DataFrame:
         """
         Ejecuta una consulta SQL en PostgreSQL y devuelve los resultados como un DataFrame.
 
-        :param query: Consulta SQL a ejecutar.
+        :param query: Consulta SQL a ejecutar (con marcadores %s).
+        :param params: Parámetros de la consulta.
         :return: DataFrame con los resultados de la consulta.
         :rtype: pd.DataFrame
         """
         try:
-            with self.pg_conn.cursor() as cursor:
-                cursor.execute(query)
+            with METRICS.span("pg.query"), self.pg_conn.cursor() as cursor:
+                cursor.execute(query, params)
                 columns = [desc[0] for desc in cursor.description]  # Obtener nombres de columnas
                 data = cursor.fetchall()  # Obtener datos
                 return pd.DataFrame(data, columns=columns)
@@ -190,58 +370,117 @@ class DataManager:
             print(i18n._("PGSQL-QRY-GEN-ERR").format(e=e))
             raise
 
-    def segments_retrieval(
+    def fetch_pages(self, query: str, params: Optional[tuple] = None,
+                    itersize: int = 1000) -> Iterator[pd.DataFrame]:
+        """
+        Ejecuta una consulta SQL con un cursor con nombre (del lado del
+        servidor) y devuelve el resultado en páginas de `itersize` filas, de
+        modo que la memoria depende del tamaño de la página y no del número de
+        filas.
+
+        El cursor vive en una conexión propia tomada del pool (no en pg_conn),
+        así que los commit y rollback que haga quien consume las páginas (p.
+        ej. store_data entre una página y la siguiente) no lo cierran. La
+        conexión vuelve al pool al agotar o abandonar el iterador. Las
+        columnas TIMESTAMPTZ se devuelven en UTC sin zona.
+
+        :param query: Consulta SQL (con marcadores %s).
+        :param params: Parámetros de la consulta.
+        :param itersize: Filas por página (y por viaje al servidor).
+        :return: Iterador de DataFrames (ninguno si no hay filas).
+        :rtype: Iterator[pd.DataFrame]
+        """
+        conn = self.pg_pool.getconn()
+        try:
+            # Sólo se cronometra el tiempo dentro del generador, no el de quien consume
+            t0 = time.perf_counter()
+            with conn.cursor(name=f"pages_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = itersize
+                cursor.execute(query, params)
+                while True:
+                    rows = list(islice(cursor, itersize))
+                    METRICS.observe("pg.query", time.perf_counter() - t0)
+                    if not rows:
+                        break
+                    METRICS.count("pg.pages")
+                    METRICS.count("pg.rows", len(rows))
+                    columns = [desc[0] for desc in cursor.description]
+                    yield naive_utc_columns(pd.DataFrame(rows, columns=columns))
+                    t0 = time.perf_counter()
+        except psycopg2.Error as e:
+            print(i18n._("PGSQL-QRY-GEN-ERR").format(e=e))
+            raise
+        finally:
+            # Sólo lectura: se cierra la transacción del cursor antes de devolverla
+            if not conn.closed:
+                conn.rollback()
+            self.pg_pool.putconn(conn)
+
+    def iter_segments(
         self,
         fstart: Optional[str] = None,
         fend: Optional[str] = None,
         ids: Optional[List[int]] = None,
+        itersize: int = 1000,
         verbose: int = 0
-    ) -> pd.DataFrame:
+    ) -> Iterator[pd.DataFrame]:
         """
-        Recupera los registros de `activity_all`:
+        Recupera por páginas los registros de `activity_all` (ver fetch_pages),
+        con consultas parametrizadas:
         - Si se pasa `ids`, devuelve solo esos IDs.
-        - Si no, usa el rango de tiempo [fstart, fend].
-        :param fstart: fecha/hora inicio (si no se pasan ids)
-        :param fend:  fecha/hora fin   (si no se pasan ids)
+        - Si no, los que solapan con [fstart, fend] (índice idx_activity_all_time).
+        Los argumentos se comprueban al llamar, no al empezar a iterar.
+
+        :param fstart: fecha/hora inicio (si no se pasan ids; sin zona: Europe/Madrid)
+        :param fend:  fecha/hora fin   (si no se pasan ids; sin zona: Europe/Madrid)
         :param ids:   lista de IDs de activity_all
+        :param itersize: registros por página
         :param verbose: nivel de verbosidad
-        :return: DataFrame con las columnas
-                 ['id','start_time','end_time','duration',
-                  'codeid_ids','codeleg_ids','active_legs']
+        :return: Iterador de DataFrames con las columnas SEGMENT_COLUMNS,
+                 ordenados por codeid_ids
+        :rtype: Iterator[pd.DataFrame]
         """
+        select = f"SELECT {', '.join(SEGMENT_COLUMNS)} FROM activity_all "
         if ids is not None:
             if verbose >= 1:
                 print(f"[DataManager] Recuperando segmentos por IDs: {ids}")
-            ids_str = ", ".join(map(str, ids))
-            query = (
-                "SELECT id, start_time, end_time, duration, "
-                "codeid_ids, codeleg_ids, active_legs "
-                f"FROM activity_all WHERE id IN ({ids_str}) "
-                "ORDER BY codeid_ids;"
-            )
+            query = select + "WHERE id = ANY(%s::int[]) ORDER BY codeid_ids, id;"
+            params = ([int(i) for i in ids],)
         else:
             if not fstart or not fend:
                 raise ValueError("Debe especificar `ids` o la ventana `fstart`/`fend`.")
             if verbose >= 1:
                 print(f"[DataManager] Recuperando segmentos entre {fstart} y {fend}")
-            query = (
-                "SELECT id, start_time, end_time, duration, "
-                "codeid_ids, codeleg_ids, active_legs "
-                f"FROM activity_all "
-                f"WHERE start_time <= '{fend}' "
-                f"  AND end_time   >= '{fstart}' "
-                "ORDER BY codeid_ids;"
-            )
+            query = select + "WHERE start_time <= %s AND end_time >= %s ORDER BY codeid_ids, id;"
+            params = (ensure_utc(fend), ensure_utc(fstart))
+        return self.fetch_pages(query, params, itersize)
 
-        df = self.fetch_data(query)
-        if df.empty and verbose >= 1:
-            print("[DataManager] No se encontraron segmentos.")
-        else:
-            # Due to the lack of TZ info we must change 
-            for col in df.columns:
-                if pd.api.types.is_datetime64tz_dtype(df[col]):
-                    df[col] = df[col].dt.tz_localize(None)
-        return df
+    def segments_retrieval(
+        self,
+        fstart: Optional[str] = None,
+        fend: Optional[str] = None,
+        ids: Optional[List[int]] = None,
+        verbose: int = 0
+    ) -> pd.DataFrame:
+        """
+        Recupera los registros de `activity_all` en un único DataFrame (todas
+        las páginas de iter_segments); para rangos largos, mejor iter_segments.
+        - Si se pasa `ids`, devuelve solo esos IDs.
+        - Si no, usa el rango de tiempo [fstart, fend].
+        :param fstart: fecha/hora inicio (si no se pasan ids)
+        :param fend:  fecha/hora fin   (si no se pasan ids)
+        :param ids:   lista de IDs de activity_all
+        :param verbose: nivel de verbosidad
+        :return: DataFrame con las columnas
+                 ['id','start_time','end_time','duration',
+                  'codeid_ids','codeleg_ids','active_legs']
+        """
+        pages = list(self.iter_segments(fstart, fend, ids, verbose=verbose))
+        if not pages:
+            if verbose >= 1:
+                print("[DataManager] No se encontraron segmentos.")
+            return pd.DataFrame(columns=SEGMENT_COLUMNS)
+        return pd.concat(pages, ignore_index=True)
 
 
     def recover_activity_all(self, act: pd.DataFrame, vb: int = 0) -> pd.DataFrame:
@@ -252,26 +491,27 @@ class DataManager:
         :return: DataFrame with the same data plus the CodeID.
         :rtype: pd.DataFrame
         """
+        # Resolve every CodeID of the batch with a single query
+        codeids = {}
+        if not act.empty:
+            codeids = self.codeids.resolve_ids(
+                i for ids in act["codeid_ids"] for i in ids)
         # Cover rows with preparation for 
         activity_leg_like = []
         for _, row in act.iterrows():
             if vb > 1:
                 print(i18n._("VB_REG_ACT_ALL").format(row=row))
             for i, foot in enumerate(row["active_legs"]):
-                sql = "SELECT codeid from codeids where id='" + \
-                    str(row["codeid_ids"][i]) + "'"
-                cid = self.fetch_data(sql)
                 activity_leg_like.append({
                     "start_time": row["start_time"], "end_time": row["end_time"],
-                    "codeid_id": row["codeid_ids"][i], "CodeID": cid['codeid'][0],
+                    "codeid_id": row["codeid_ids"][i],
+                    "CodeID": codeids[int(row["codeid_ids"][i])],
                     "foot": foot})
         df_legs = pd.DataFrame(activity_leg_like)
         if vb > 0:
             print(i18n._("VB-ACT-ALL-LEGS").format(ns=df_legs.shape[0]))
         if df_legs.shape[0] > 0:
-            for col in df_legs.columns:
-                if pd.api.types.is_datetime64tz_dtype(df_legs[col]):
-                    df_legs[col] = df_legs[col].dt.tz_localize(None)
+            naive_utc_columns(df_legs)
         return df_legs
 
 
@@ -280,32 +520,27 @@ class DataManager:
         Almacena un CodeID único en la tabla codeids y devuelve su ID.
 
         :param codeid: El CodeID a almacenar.
-        :return: ID del CodeID en la tabla.
-        :rtype: int
+        :return: ID del CodeID en la tabla y si es nuevo.
+        :rtype: tuple[int, bool]
         """
-        try:
-            # Validar el CodeID usando Pydantic
-            validated_codeid = CodeID(codeid=codeid)
+        return self.store_codeids([codeid], verbose)[codeid]
 
-            with self.pg_conn.cursor() as cursor:
-                # Intentar insertar el codeid
-                cursor.execute(
-                    "INSERT INTO codeids (codeid) VALUES (%s) ON CONFLICT (codeid) DO NOTHING RETURNING id;",
-                    (validated_codeid.codeid,)
-                )
-                result = cursor.fetchone()
-                if result:
-                    new_id = result[0]
-                    self.pg_conn.commit()
-                    if verbose >= 2:
-                        print(f"CodeID {codeid} ➞ nuevo, id = {new_id}")
-                    return new_id, True
-                # Si ya existe, buscar el ID
-                cursor.execute("SELECT id FROM codeids WHERE codeid = %s;", (validated_codeid.codeid,))
-                if verbose >= 2:
-                    print(f"CodeID {codeid} ➞ existente, id = {existing_id}")
-                existing_id = cursor.fetchone()[0]
-                return existing_id, False
+    def store_codeids(self, codeids: List[str], verbose: int = 0) -> Dict[str, Tuple[int, bool]]:
+        """
+        Almacena en bloque los CodeIDs en la tabla codeids (una sola sentencia
+        para los nuevos) y devuelve el ID de cada uno.
+
+        :param codeids: Lista de CodeIDs a almacenar.
+        :return: Diccionario CodeID -> (ID en la tabla, es nuevo).
+        :rtype: dict
+        """
+        try:
+            stored = self.codeids.register(codeids)
+            if verbose >= 2:
+                for codeid, (codeid_id, is_new) in stored.items():
+                    estado = "nuevo" if is_new else "existente"
+                    print(f"CodeID {codeid} ➞ {estado}, id = {codeid_id}")
+            return stored
         except ValidationError as e:
             # print()
             print(i18n._("PGSQL-VAL-COD-ERR").format(e=e))
@@ -317,31 +552,18 @@ class DataManager:
 
     def transform_activityleg(self, data:pd.DataFrame) -> pd.DataFrame:
         """
-        Transforms a pandas DataFrame moving time columns to ISO string,
-        and CodeID to codeid_id by quering the codeids table.
+        Transforms a pandas DataFrame renaming the time columns (kept as UTC
+        datetimes) and CodeID to codeid_id by quering the codeids table.
 
         :param data:  Activity_Leg pandas.
         :type data: pd.DataFrame
         :return: Updated Activity Leg pandas
         :rtype: pd.DataFrame
         """
-        def get_codeid_id_from_db(codeid:str) -> int:
-            """
-            find the codeid_id by quering the codeids table matching CodeID.
-
-            :param codeid:  CodeID string
-            :type data: str
-            :return: Id in table codeids
-            :rtype: int
-            """        
-            with self.pg_conn.cursor() as cursor:
-                # Si ya existe, buscar el ID
-                cursor.execute("SELECT id FROM codeids WHERE codeid = %s;", (codeid,))
-                return cursor.fetchone()[0]  # Devuelve el ID existente
-        #
-        data['start_time'] = data['time_from'].apply(lambda x: x.isoformat())
-        data['end_time'] = data['time_until'].apply(lambda x: x.isoformat())
-        data['codeid_id'] = data['CodeID'].apply(get_codeid_id_from_db)
+        data['start_time'] = data['time_from']
+        data['end_time'] = data['time_until']
+        data['codeid_id'] = data['CodeID'].map(
+            self.codeids.resolve_codeids(data['CodeID'].unique()))
         data['duration'] = (data['time_until']-data['time_from']).dt.total_seconds()
         lnom = ['codeid_id','foot','start_time','end_time','duration','mac',\
                 'device_name','total_value']
@@ -349,13 +571,88 @@ class DataManager:
         ddat = data.drop(columns=['time_from','time_until','CodeID'])
         return ddat[lnom]
         
-    def store_data(self, table_name: str, data: pd.DataFrame, verbose: int = 1) -> None:
+    # Modelo pydantic de cada tabla (effective_gait se inserta sin validar)
+    _TABLE_MODELS = {
+        "activity_leg": ActivityLeg,
+        "effective_movement": EffectiveMovement,
+        "activity_all": ActivityAll,
+        "fullref_sensor_codeid": ActivitySegment,
+        "codeids": CodeID,
+    }
+
+    def _unvalidated_rows(self, table_name: str, data: pd.DataFrame) -> Tuple[List[str], List[tuple]]:
+        """
+        Construye las filas a insertar por columnas, sin pasar por pydantic.
+        Se usan los campos del modelo de la tabla (con su valor por defecto si
+        la columna no está en `data`) y codeleg_ids se normaliza como en la
+        ruta validada (None -> -1).
+        """
+        model = self._TABLE_MODELS.get(table_name)
+        if model is None and table_name != "effective_gait":
+            raise ValueError(f"Tabla no reconocida: {table_name}")
+        columns = list(model.model_fields) if model is not None else list(data.columns)
+        values = []
+        for c in columns:
+            if c in data.columns:
+                col = data[c].tolist()
+            else:
+                col = [model.model_fields[c].get_default(call_default_factory=True)] * len(data)
+            if c == "codeleg_ids":
+                col = [[-1 if v is None else int(v) for v in ids] for ids in col]
+            values.append(col)
+        return columns, list(zip(*values))
+
+    def _insert_rows(self, table_name: str, columns: List[str], rows: List[tuple],
+                     batch_size: int = 1000, commit: bool = True) -> List[int]:
+        """
+        Inserta filas ya construidas con un INSERT multi-fila por lote.
+
+        :param table_name: Nombre de la tabla.
+        :param columns: Columnas, en el orden de cada tupla de `rows`.
+        :param rows: Filas a insertar.
+        :param batch_size: Número de filas por sentencia INSERT.
+        :param commit: Si se confirma la transacción tras cada lote.
+        :return: IDs insertados, en el mismo orden que `rows`.
+        :rtype: list[int]
+        """
+        query = sql.SQL("INSERT INTO {} ({}) VALUES %s RETURNING id").format(
+            sql.Identifier(table_name),
+            sql.SQL(', ').join(map(sql.Identifier, columns)))
+        inserted_ids = []
+        with self.pg_conn.cursor() as cursor:
+            for i in range(0, len(rows), batch_size):
+                batch = rows[i:i + batch_size]
+                result = execute_values(cursor, query, batch,
+                                        page_size=len(batch), fetch=True)
+                # Los ids salen de un SERIAL asignado en el orden de VALUES,
+                # por lo que ordenarlos devuelve el orden de entrada
+                inserted_ids.extend(sorted(r[0] for r in result))
+                if commit:
+                    self.pg_conn.commit()
+        return inserted_ids
+
+    def store_data(self, table_name: str, data: pd.DataFrame, verbose: int = 1,
+                   batch_size: int = 1000, validate: bool = True,
+                   commit: bool = True) -> List[int]:
         """
         Almacena datos en una tabla específica en PostgreSQL, validando 
                 los datos con pydantic.
 
+        Cada lote de `batch_size` filas se envía como una única sentencia
+        INSERT multi-fila (execute_values) y se confirma por lote.
+
         :param table_name: Nombre de la tabla.
         :param data: DataFrame con los datos a almacenar.
+        :param verbose: Nivel de verbosidad.
+        :param batch_size: Número de filas por sentencia INSERT.
+        :param validate: Si es False, las filas se toman directamente de las
+                         columnas de `data` sin crear un modelo pydantic por
+                         fila (para DataFrames ya generados con los tipos correctos).
+        :param commit: Si es False no se confirma la transacción: la confirma
+                       (o deshace) quien llama, p. ej. para agrupar varias tablas.
+                       Ante un error se deshace igualmente y se devuelve None.
+        :return: IDs insertados, en el mismo orden que las filas de `data`.
+        :rtype: list[int]
         """
         if data.empty and verbose > 0:
             print(i18n._("PGSQL-INS-TAB-NOD-ERR").format(table_name=table_name))
@@ -365,22 +662,18 @@ class DataManager:
             if verbose > 0:
                 print(i18n._("PGSQL-INS-TAB-INFO"))
 
-            # Convertir columnas a cadenas si es necesario
-            if "start_time" in data.columns:
-                data["start_time"] = data["start_time"].astype(str)
-            if "end_time" in data.columns:
-                data["end_time"] = data["end_time"].astype(str)
+            # Fechas con zona UTC: psycopg2 las envía como TIMESTAMPTZ
+            data = db_times(data)
 
             # Validar los datos
+            t_validate = time.perf_counter()
             validated_rows = []
-            for _, row in data.iterrows():
+            for row_dict in (data.to_dict("records") if validate else []):
                 if table_name == "activity_leg":
-                    validated_rows.append(ActivityLeg(**row.to_dict()).dict())
+                    validated_rows.append(ActivityLeg(**row_dict).dict())
                 elif table_name == "effective_movement":
-                    validated_rows.append(EffectiveMovement(**row.to_dict()).dict())
+                    validated_rows.append(EffectiveMovement(**row_dict).dict())
                 elif table_name == "activity_all":
-                    row_dict = row.to_dict()
-                    
                     # Normalizamos los codeleg_ids: reemplazamos None por -1
                     if "codeleg_ids" in row_dict:
                         row_dict["codeleg_ids"] = [
@@ -390,33 +683,43 @@ class DataManager:
                     validated_rows.append(ActivityAll(**row_dict).dict())
 
                 elif table_name == "fullref_sensor_codeid":
-                    validated_rows.append(ActivitySegment(**row.to_dict()).dict())
+                    validated_rows.append(ActivitySegment(**row_dict).dict())
                     
                 elif table_name == "effective_gait":
                     # No validamos con pydantic; insertamos tal cual
-                    validated_rows.append(row.to_dict())
+                    validated_rows.append(row_dict)
                 elif table_name == "codeids":
-                    validated_rows.append(CodeID(**row.to_dict()).dict())
+                    validated_rows.append(CodeID(**row_dict).dict())
                 else:
                     raise ValueError(f"Tabla no reconocida: {table_name}")
 
+            if validate:
+                METRICS.observe("pydantic.validate", time.perf_counter() - t_validate)
+
             # Guardar en PostgreSQL
-            inserted_ids = [] # List of inserted activity_leg IDs
-            with self.pg_conn.cursor() as cursor:
-                for row in validated_rows:
-                    columns = ', '.join(row.keys())
-                    placeholders = ', '.join(['%s'] * len(row))
-                    sql = f"INSERT INTO {table_name} ({columns}) VALUES " + \
-                          f"({placeholders}) RETURNING id"
-                    cursor.execute(sql, tuple(row.values()))
-                    inserted_id = cursor.fetchone()[0]  # Obtaining the inserted ID
-                    inserted_ids.append(inserted_id)
-                self.pg_conn.commit()
-                if verbose > 0:
-                    print(i18n._("PGSQL-INS-TAB-OK").format(table_name=table_name))
-                if verbose > 1:
-                    print(i18n._("PGSQL-LST-INS").format(ids=inserted_ids))
-                return inserted_ids
+            inserted_ids = [] # List of inserted IDs
+            if validate:
+                if not validated_rows:
+                    return inserted_ids
+                columns = list(validated_rows[0].keys())
+                rows = [tuple(row[c] for c in columns) for row in validated_rows]
+            else:
+                columns, rows = self._unvalidated_rows(table_name, data)
+                if not rows:
+                    return inserted_ids
+            t0 = time.perf_counter()
+            inserted_ids = self._insert_rows(table_name, columns, rows, batch_size, commit)
+            elapsed = time.perf_counter() - t0
+            METRICS.observe("pg.write", elapsed)
+            METRICS.count(f"pg.rows.{table_name}", len(inserted_ids))
+            if verbose > 0:
+                print(i18n._("PGSQL-INS-TAB-OK").format(table_name=table_name))
+                print(i18n._("PGSQL-INS-TAB-RATE").format(
+                    n=len(inserted_ids), table_name=table_name,
+                    rate=len(inserted_ids) / elapsed if elapsed > 0 else float("inf")))
+            if verbose > 1:
+                print(i18n._("PGSQL-LST-INS").format(ids=inserted_ids))
+            return inserted_ids
         except ValidationError as e:
             print(i18n._("PGSQL-VAL-TAB-ERR").format(e=e))
         except Exception as e:
@@ -424,6 +727,127 @@ class DataManager:
             print(i18n._("PGSQL-INS-TAB-ERR").format(e=e))
 
 
+    # ------------------------------------------------------------------
+    # Ingesta incremental: las operaciones no confirman la transacción
+    # ------------------------------------------------------------------
+    def get_watermarks(self, codeid_id: int) -> Dict[str, Dict]:
+        """
+        Marcas de agua de la ingesta incremental de un CodeID, por pierna,
+        junto con el último segmento de activity_leg de cada una.
+
+        :param codeid_id: ID del CodeID en la tabla codeids.
+        :return: foot -> {'last_time', 'codeleg_id', 'start_time', 'end_time',
+                 'device_name', 'mac', 'total_value'} (campos del segmento a None
+                 si no hay).
+        :rtype: dict
+        """
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT w.foot, w.last_time, w.codeleg_id, l.start_time, l.end_time,
+                       l.device_name, l.mac, l.total_value
+                FROM ingest_watermark w
+                LEFT JOIN activity_leg l ON l.id = w.codeleg_id
+                WHERE w.codeid_id = %s;
+            """, (int(codeid_id),))
+            rows = cursor.fetchall()
+        keys = ['last_time', 'codeleg_id', 'start_time', 'end_time',
+                'device_name', 'mac', 'total_value']
+        return {r[0]: dict(zip(keys, r[1:])) for r in rows}
+
+    def min_watermark(self, since=None) -> Optional[datetime.datetime]:
+        """
+        Marca de agua más antigua de todos los CodeIDs (None si no hay ninguna).
+
+        :param since: Si se indica, se ignoran las marcas anteriores (p. ej. de
+                      CodeIDs retirados, que si no fijarían el inicio de cada
+                      ejecución en su fecha).
+        """
+        with self.pg_conn.cursor() as cursor:
+            if since is None:
+                cursor.execute("SELECT min(last_time) FROM ingest_watermark;")
+            else:
+                cursor.execute("SELECT min(last_time) FROM ingest_watermark WHERE last_time >= %s;",
+                               (ensure_utc_array([since], naive_tz="UTC")[0],))
+            return cursor.fetchone()[0]
+
+    def set_watermark(self, codeid_id: int, foot: str, last_time,
+                      codeleg_id: Optional[int]) -> None:
+        """
+        Guarda (upsert) la marca de agua de un CodeID y pierna. Si `codeleg_id`
+        es None se conserva el segmento anterior.
+        """
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO ingest_watermark (codeid_id, foot, last_time, codeleg_id)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (codeid_id, foot) DO UPDATE
+                SET last_time = EXCLUDED.last_time,
+                    codeleg_id = COALESCE(EXCLUDED.codeleg_id, ingest_watermark.codeleg_id),
+                    updated_at = now();
+            """, (int(codeid_id), foot, ensure_utc_array([last_time], naive_tz="UTC")[0],
+                  None if codeleg_id is None else int(codeleg_id)))
+
+    def extend_activity_leg(self, codeleg_id: int, end_time, duration: float,
+                            total_value: float) -> None:
+        """Prolonga un segmento de activity_leg ya guardado."""
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE activity_leg SET end_time = %s, duration = %s, total_value = %s
+                WHERE id = %s;
+            """, (ensure_utc_array([end_time], naive_tz="UTC")[0], float(duration),
+                  float(total_value), int(codeleg_id)))
+
+    # Tipos de activity_all para las columnas de VALUES (listas vacías y NULL no tienen tipo)
+    _ACTIVITY_ALL_TYPES = {
+        "codeid_ids": "int[]", "codeleg_ids": "int[]", "start_time": "timestamptz",
+        "end_time": "timestamptz", "duration": "numeric", "macs": "text[]",
+        "active_legs": "text[]", "device_names": "text[]", "is_effective": "boolean",
+    }
+
+    def upsert_activity_all(self, data: pd.DataFrame, batch_size: int = 1000) -> List[int]:
+        """
+        Guarda filas de activity_all de forma idempotente: la fila con la misma
+        pareja codeleg_ids se actualiza y, si no existe, se inserta. Cada lote
+        es una única sentencia (UPDATE ... FROM VALUES más INSERT de las
+        parejas que no se actualizaron), sin confirmar la transacción.
+
+        :param data: DataFrame como el de merge_activity_legs_to_all.
+        :param batch_size: Número de filas por sentencia.
+        :return: IDs de las filas actualizadas o insertadas, en orden.
+        :rtype: list[int]
+        """
+        data = db_times(data)
+        columns, rows = self._unvalidated_rows("activity_all", data)
+        key = columns.index("codeleg_ids")
+        cols = sql.SQL(', ').join(map(sql.Identifier, columns))
+        query = sql.SQL("""
+            WITH v ({cols}) AS (VALUES %s),
+            upd AS (
+                UPDATE activity_all a SET {sets} FROM v
+                WHERE a.codeleg_ids = v.codeleg_ids
+                RETURNING a.id, a.codeleg_ids),
+            ins AS (
+                INSERT INTO activity_all ({cols})
+                SELECT {cols} FROM v
+                WHERE NOT EXISTS (SELECT 1 FROM upd WHERE upd.codeleg_ids = v.codeleg_ids)
+                RETURNING id, codeleg_ids)
+            SELECT id, codeleg_ids FROM upd UNION ALL SELECT id, codeleg_ids FROM ins
+        """).format(
+            cols=cols,
+            sets=sql.SQL(', ').join(sql.SQL("{0} = v.{0}").format(sql.Identifier(c))
+                                    for c in columns if c != "codeleg_ids"))
+        template = "(" + ", ".join(f"%s::{self._ACTIVITY_ALL_TYPES[c]}" for c in columns) + ")"
+        ids = []
+        with self.pg_conn.cursor() as cursor:
+            for i in range(0, len(rows), batch_size):
+                # Una fila por pareja (la última, como si se guardaran en orden)
+                batch = list({tuple(r[key]): r for r in rows[i:i + batch_size]}.values())
+                result = execute_values(cursor, query, batch, template=template,
+                                        page_size=len(batch), fetch=True)
+                by_pair = {tuple(pair): row_id for row_id, pair in result}
+                ids.extend(by_pair[tuple(r[key])] for r in rows[i:i + batch_size])
+        return ids
+
     def get_real_codeid(self, codeid_id: int) -> str:
         """
         Obtiene el verdadero CodeID desde PostgreSQL dado un ID de la tabla codeids.
@@ -433,14 +857,7 @@ class DataManager:
         :rtype: str
         """
         try:
-            query = "SELECT codeid FROM codeids WHERE id = %s;"
-            with self.pg_conn.cursor() as cursor:
-                cursor.execute(query, (codeid_id,))
-                result = cursor.fetchone()
-                if result:
-                    return result[0]  # Devuelve el CodeID
-                else:
-                    raise ValueError(f"No se encontró CodeID para id {codeid_id}.")
+            return self.codeids.get_codeid(codeid_id)
         except Exception as e:
             print(i18n._("PGSQL-QRY-COD-ERR").format(e=e))
             raise
@@ -472,10 +889,8 @@ class DataManager:
                 if result:
                     columns = [desc[0] for desc in cursor.description]
                     df = pd.DataFrame(result, columns=columns)
-                    # Due to the lack of TZ info we must change 
-                    for col in df.columns:
-                        if pd.api.types.is_datetime64tz_dtype(df[col]):
-                            df[col] = df[col].dt.tz_localize(None)
+                    # TIMESTAMPTZ llega con el huso de la sesión: se pasa a UTC sin zona
+                    naive_utc_columns(df)
                     return df
                 else:
                     raise ValueError(i18n._("PGSQL-QRY-CLNAME-NONE").format(clname=clname,clegs=clegs))
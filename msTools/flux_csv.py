@@ -0,0 +1,281 @@
+"""
+Decodificador por columnas del CSV anotado de InfluxDB (``query_raw``).
+
+Convierte la respuesta directamente en arrays de numpy tipados, sin crear un
+objeto Python por registro: ``dateTime`` como int64 (ns desde epoch),
+``double`` como float64 (o el tipo pedido, p. ej. float32), ``long`` como
+int64, etc. Las columnas del group key (tags) son constantes dentro de cada
+tabla y se expanden a partir de la primera fila de cada una.
+
+Con pyarrow instalado el CSV se analiza íntegramente en C++; sin él se usa
+el parser C de pandas (las fechas pasan entonces por texto).
+
+Microbenchmark frente a la ruta FluxRecord::
+
+    python -m msTools.flux_csv --rows 500000
+"""
+import csv
+import io
+import re
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from influxdb_client import Dialect
+from influxdb_client.client.flux_csv_parser import FluxQueryException
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow es opcional
+    pa = None
+
+# Dialecto con el que se pide el CSV (mismo que usa influxdb_client por defecto)
+DIALECT = Dialect(header=True, delimiter=",", comment_prefix="#",
+                  annotations=["datatype", "group", "default"],
+                  date_time_format="RFC3339Nano")
+
+_NUMPY_TYPES = {
+    "double": "float64",
+    "long": "int64",
+    "unsignedLong": "uint64",
+    "boolean": "bool",
+    "duration": "int64",
+}
+_BLOCK_SEP = re.compile(rb"(?:\r?\n){2,}")
+
+
+def _is_time(datatype: str) -> bool:
+    return datatype.startswith("dateTime")
+
+
+def _split_line(line: bytes) -> List[str]:
+    return next(csv.reader([line.rstrip(b"\r").decode("utf-8")]))
+
+
+def _scalar(value: str, datatype: str, dtype: Optional[str]):
+    """Convierte un único valor de texto según su tipo Flux."""
+    if value == "":
+        return None
+    if _is_time(datatype):
+        return pd.Timestamp(value).value
+    if datatype == "boolean":
+        return value == "true"
+    if datatype in _NUMPY_TYPES:
+        return np.array(value).astype(dtype or _NUMPY_TYPES[datatype])[()]
+    return value
+
+
+def _dense_columns(body: bytes, names: List[str], types: Dict[str, str],
+                   dtypes: Dict[str, str]) -> Dict[str, np.ndarray]:
+    """Analiza las columnas que varían fila a fila (cabecera + datos en `body`)."""
+    if not names:
+        return {}
+    out = {}
+    if pa is not None:
+        arrow_types = {}
+        for c in names:
+            t = types.get(c, "string")
+            if _is_time(t):
+                arrow_types[c] = pa.timestamp("ns", tz="UTC")
+            elif t == "string":
+                arrow_types[c] = pa.string()
+            elif t in _NUMPY_TYPES:
+                arrow_types[c] = pa.from_numpy_dtype(np.dtype(dtypes.get(c, _NUMPY_TYPES[t])))
+        table = pa_csv.read_csv(
+            io.BytesIO(body),
+            convert_options=pa_csv.ConvertOptions(include_columns=names,
+                                                  column_types=arrow_types))
+        for c in names:
+            col = table.column(c)
+            if _is_time(types.get(c, "")):
+                col = col.cast(pa.int64())
+            out[c] = col.to_numpy()
+        return out
+
+    np_types = {c: dtypes.get(c, _NUMPY_TYPES[types[c]]) for c in names
+                if types.get(c) in ("double", "unsignedLong", "boolean")}
+    df = pd.read_csv(io.BytesIO(body), usecols=names, dtype=np_types, engine="c")
+    for c in names:
+        if _is_time(types.get(c, "")):
+            out[c] = pd.DatetimeIndex(pd.to_datetime(df[c], utc=True, format="ISO8601")) \
+                .as_unit("ns").asi8
+        else:
+            out[c] = df[c].to_numpy()
+    return out
+
+
+def _parse_block(block: bytes, columns: Optional[List[str]],
+                 dtypes: Dict[str, str]) -> Dict[str, np.ndarray]:
+    """Analiza un bloque del CSV (anotaciones + cabecera + filas de una o varias tablas)."""
+    annotations = {}
+    pos = 0
+    while block.startswith(b"#", pos):
+        end = block.index(b"\n", pos)
+        row = _split_line(block[pos:end])
+        annotations[row[0][1:]] = row
+        pos = end + 1
+    body = block[pos:]
+    if not body.endswith(b"\n"):
+        body += b"\n"
+
+    # Posición de los saltos de línea: cabecera en la primera, una fila por cada una de las demás
+    newlines = np.flatnonzero(np.frombuffer(body, dtype=np.uint8) == 10)
+    header = _split_line(body[:newlines[0]])
+    n = len(newlines) - 1
+
+    if "error" in header and "reference" in header and n:
+        row = dict(zip(header, _split_line(body[newlines[0] + 1:newlines[1]])))
+        raise FluxQueryException(message=row["error"], reference=row["reference"])
+
+    types = dict(zip(header, annotations.get("datatype", [])))
+    group = dict(zip(header, annotations.get("group", [])))
+    wanted = [c for c in header if c not in ("", "result", "table")] \
+        if columns is None else [c for c in columns if c in header]
+    constant = [c for c in wanted if group.get(c) == "true"]
+    dense = [c for c in wanted if c not in constant]
+
+    out = _dense_columns(body, dense + (["table"] if constant else []), types, dtypes)
+
+    if constant and n:
+        # Filas donde empieza cada tabla: sus tags se repiten hasta la siguiente
+        tables = out.pop("table")
+        starts = np.concatenate(([0], np.flatnonzero(tables[1:] != tables[:-1]) + 1))
+        lengths = np.diff(np.append(starts, n))
+        firsts = [dict(zip(header, _split_line(body[newlines[s] + 1:newlines[s + 1]])))
+                  for s in starts]
+        for c in constant:
+            values = [_scalar(f[c], types.get(c, "string"), dtypes.get(c)) for f in firsts]
+            if types.get(c, "string") == "string" or any(v is None for v in values):
+                arr = np.empty(len(values), dtype=object)
+                arr[:] = values
+            else:
+                arr = np.array(values)
+            out[c] = np.repeat(arr, lengths)
+    elif constant:
+        out.pop("table", None)
+        for c in constant:
+            out[c] = np.empty(0, dtype=object)
+    return {c: out[c] for c in wanted}
+
+
+def parse_flux_csv(data: bytes, columns: Optional[List[str]] = None,
+                   dtypes: Optional[Dict[str, str]] = None) -> Dict[str, np.ndarray]:
+    """
+    Convierte una respuesta CSV anotada de InfluxDB en columnas de numpy.
+
+    :param data: Contenido de la respuesta de ``query_raw``.
+    :type data: bytes
+    :param columns: Columnas a devolver (por defecto todas salvo result y table).
+    :type columns: list, optional
+    :param dtypes: Tipo numpy por columna numérica (p. ej. ``{"Ax": "float32"}``).
+    :type dtypes: dict, optional
+    :return: Diccionario columna -> array. Las fechas son int64 en ns (UTC).
+             Vacío si la respuesta no contiene filas.
+    :rtype: Dict[str, np.ndarray]
+    :raises FluxQueryException: Si la respuesta contiene una tabla de error.
+    """
+    dtypes = dtypes or {}
+    parts: List[Dict[str, np.ndarray]] = []
+    for block in _BLOCK_SEP.split(data):
+        if block.strip():
+            part = _parse_block(block.strip(b"\r\n"), columns, dtypes)
+            if part and len(next(iter(part.values()))):
+                parts.append(part)
+    if not parts:
+        return {}
+
+    names = list(dict.fromkeys(c for p in parts for c in p))
+    out = {}
+    for c in names:
+        pieces = []
+        for p in parts:
+            if c in p:
+                pieces.append(p[c])
+            else:  # columna ausente en esta tabla
+                pieces.append(np.full(len(next(iter(p.values()))), None, dtype=object))
+        out[c] = pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+    return out
+
+
+# ----------------------------------------------------------------------
+# Microbenchmark
+# ----------------------------------------------------------------------
+def _synthetic_csv(rows: int, tables: int = 2) -> bytes:
+    """CSV anotado como el de la consulta pivotada de MovementDetector."""
+    rng = np.random.default_rng(0)
+    t0 = pd.Timestamp("2024-01-01", tz="UTC").value
+    blocks = []
+    per_table = rows // tables
+    for k in range(tables):
+        times = pd.to_datetime(t0 + (np.arange(per_table) + k * per_table) * 10_000_000, utc=True)
+        stamps = times.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        values = rng.standard_normal((per_table, 6))
+        lines = [
+            "#datatype,string,long,dateTime:RFC3339,dateTime:RFC3339,dateTime:RFC3339,"
+            "string,string,string,double,double,double,double,double,double",
+            "#group,false,false,true,true,false,true,true,true,false,false,false,false,false,false",
+            "#default,_result,,,,,,,,,,,,,",
+            ",result,table,_start,_stop,_time,CodeID,Foot,_measurement,Ax,Ay,Az,Gx,Gy,Gz",
+        ]
+        start, stop = "2024-01-01T00:00:00Z", "2024-01-02T00:00:00Z"
+        lines += [f",,{k},{start},{stop},{s},ABC123,Left,sensor," + ",".join(f"{v:.6f}" for v in row)
+                  for s, row in zip(stamps, values)]
+        blocks.append("\r\n".join(lines))
+    return ("\r\n\r\n".join(blocks) + "\r\n").encode("utf-8")
+
+
+def _records_frame(data: bytes) -> pd.DataFrame:
+    """Ruta actual: FluxCsvParser -> FluxRecord.values -> DataFrame."""
+    from influxdb_client.client.flux_csv_parser import FluxCsvParser, FluxSerializationMode
+
+    class _Response:
+        closed = True
+
+        def __init__(self, content):
+            self.data = content
+
+        def close(self):
+            pass
+
+    parser = FluxCsvParser(response=_Response(data),
+                           serialization_mode=FluxSerializationMode.tables)
+    list(parser.generator())
+    tables = parser.table_list()
+    return pd.DataFrame([record.values for table in tables for record in table.records])
+
+
+def _columns_frame(data: bytes) -> pd.DataFrame:
+    cols = parse_flux_csv(data)
+    df = pd.DataFrame(cols)
+    df["_time"] = pd.to_datetime(df["_time"], utc=True)
+    return df
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="FluxRecord vs decodificador por columnas")
+    parser.add_argument("--rows", type=int, default=200_000, help="Filas sintéticas")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    args = parser.parse_args(argv)
+
+    data = _synthetic_csv(args.rows)
+    print(f"{args.rows} filas, {len(data) / 1e6:.1f} MB de CSV, "
+          f"motor: {'pyarrow' if pa is not None else 'pandas'}")
+    results = {}
+    for name, fn in (("FluxRecord", _records_frame), ("columnas", _columns_frame)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            df = fn(data)
+            best = min(best, time.perf_counter() - t)
+        results[name] = best
+        print(f"{name:>12}: {best:8.3f} s  ({args.rows / best:,.0f} filas/s, "
+              f"{df.memory_usage(deep=True).sum() / 1e6:.1f} MB)")
+    print(f"speedup: x{results['FluxRecord'] / results['columnas']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
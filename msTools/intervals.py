@@ -0,0 +1,83 @@
+"""
+Álgebra de intervalos sobre arrays int64 (p. ej. fechas en ns).
+
+Calcula los pares de intervalos solapados entre dos conjuntos sin producto
+cartesiano: con los inicios ordenados, los candidatos de cada intervalo son
+un rango contiguo que se localiza con ``searchsorted``. El coste es
+O((L + R) log(L + R) + K), con K el número de pares solapados.
+"""
+from typing import Tuple
+
+import numpy as np
+
+from msTools.timeutils import to_epoch_ns
+
+
+def to_ns(values) -> np.ndarray:
+    """
+    Convierte fechas (Series, DatetimeIndex, array o lista) en int64 ns.
+    Las fechas con zona horaria se expresan en UTC (ver timeutils.to_epoch_ns).
+
+    :param values: Fechas a convertir.
+    :return: Array int64 con los ns desde epoch.
+    :rtype: np.ndarray
+    """
+    return to_epoch_ns(values)
+
+
+def _expand(lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Para cada rango [lo_i, hi_i) devuelve (i, posición) de todos sus elementos."""
+    counts = np.maximum(hi - lo, 0)
+    owner = np.repeat(np.arange(len(lo)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, np.repeat(lo, counts) + (np.arange(counts.sum()) - first)
+
+
+def overlap_pairs(a_start, a_end, b_start, b_end,
+                  closed: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Índices (ia, ib) de los pares de intervalos A[ia], B[ib] que se solapan.
+
+    Con ``closed=True`` los intervalos son cerrados y basta con que se toquen
+    (``max(inicios) <= min(fines)``); con ``closed=False`` el solape debe
+    tener duración (``max(inicios) < min(fines)``). Los intervalos vacíos
+    para ese criterio no producen pares.
+
+    :param a_start: Inicios del conjunto A (int64).
+    :param a_end: Fines del conjunto A (int64).
+    :param b_start: Inicios del conjunto B (int64).
+    :param b_end: Fines del conjunto B (int64).
+    :param closed: Si los extremos cuentan como solape.
+    :type closed: bool
+    :return: Posiciones (no etiquetas) en A y en B, ordenadas por (ia, ib),
+             el mismo orden que un producto cartesiano filtrado.
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    a_start, a_end = np.asarray(a_start, dtype=np.int64), np.asarray(a_end, dtype=np.int64)
+    b_start, b_end = np.asarray(b_start, dtype=np.int64), np.asarray(b_end, dtype=np.int64)
+    side = "right" if closed else "left"
+
+    ai = np.flatnonzero(a_start <= a_end if closed else a_start < a_end)
+    bi = np.flatnonzero(b_start <= b_end if closed else b_start < b_end)
+    a_s, a_e = a_start[ai], a_end[ai]
+    b_s, b_e = b_start[bi], b_end[bi]
+
+    # Caso 1: B empieza dentro de A (a_s <= b_s <= a_e)
+    ob = np.argsort(b_s, kind="stable")
+    sorted_b = b_s[ob]
+    own, pos = _expand(np.searchsorted(sorted_b, a_s, side="left"),
+                       np.searchsorted(sorted_b, a_e, side=side))
+    ia1, ib1 = ai[own], bi[ob[pos]]
+
+    # Caso 2: A empieza dentro de B, estrictamente después (b_s < a_s <= b_e)
+    oa = np.argsort(a_s, kind="stable")
+    sorted_a = a_s[oa]
+    own, pos = _expand(np.searchsorted(sorted_a, b_s, side="right"),
+                       np.searchsorted(sorted_a, b_e, side=side))
+    ia2, ib2 = ai[oa[pos]], bi[own]
+
+    ia = np.concatenate((ia1, ia2))
+    ib = np.concatenate((ib1, ib2))
+    order = np.lexsort((ib, ia))
+    return ia[order], ib[order]
+
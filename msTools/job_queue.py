@@ -0,0 +1,251 @@
+"""
+Cola de trabajos de find_gait en PostgreSQL (tabla ``gait_jobs``).
+
+Cada trabajo es un id de ``activity_all``. Cualquier número de procesos, en
+cualquier número de máquinas, reclama lotes con ``FOR UPDATE SKIP LOCKED``,
+de modo que dos workers nunca reciben el mismo trabajo ni se esperan entre
+sí. Un trabajo reclamado queda en ``running`` con un plazo (lease); si el
+worker muere sin terminarlo, al vencer el plazo otro worker lo vuelve a
+reclamar, hasta ``max_attempts`` intentos::
+
+    queue = GaitJobQueue(data_manager)
+    queue.enqueue([12, 34, 56])
+    ids = queue.claim("host-1:4242", batch_size=2)
+    ...  # detección y guardado sin confirmar
+    queue.complete("host-1:4242", ids)
+"""
+from typing import Dict, List, Optional
+
+from msTools.metrics import METRICS
+from msTools.timeutils import ensure_utc
+
+# Estados de un trabajo
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+class LeaseLostError(RuntimeError):
+    """El plazo de un trabajo venció y otro worker lo ha reclamado."""
+
+
+class GaitJobQueue:
+    """Cola de ids de activity_all pendientes de analizar con find_gait."""
+
+    def __init__(self, data_manager, lease_seconds: int = 600, max_attempts: int = 3) -> None:
+        """
+        :param data_manager: DataManager que aporta la conexión a PostgreSQL
+                             (una por hilo).
+        :type data_manager: DataManager
+        :param lease_seconds: Plazo de un trabajo reclamado; el worker debe
+                              terminarlo o renovarlo (renew) antes de que venza.
+        :param max_attempts: Intentos de un trabajo antes de darlo por fallido.
+        """
+        self.data_manager = data_manager
+        self.lease_seconds = int(lease_seconds)
+        self.max_attempts = int(max_attempts)
+
+    def _execute(self, query: str, params: tuple = (), commit: bool = True) -> List[tuple]:
+        conn = self.data_manager.pg_conn
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                rows = cursor.fetchall() if cursor.description else []
+            if commit:
+                conn.commit()
+            return rows
+        except Exception:
+            conn.rollback()
+            raise
+
+    def enqueue(self, ids: List[int], requeue: bool = False) -> int:
+        """
+        Registra como pendientes los ids de activity_all (los inexistentes se ignoran).
+
+        :param ids: ids de activity_all.
+        :param requeue: Si es True, los trabajos ya registrados (terminados o
+                        fallidos) vuelven a quedar pendientes con los intentos
+                        a cero; si no, se dejan como están.
+        :return: Número de trabajos registrados o reiniciados.
+        :rtype: int
+        """
+        rows = self._execute(f"""
+            INSERT INTO gait_jobs (act_all_id)
+            SELECT id FROM activity_all WHERE id = ANY(%s::int[])
+            {self._on_conflict(requeue)}
+            RETURNING act_all_id;
+        """, ([int(i) for i in ids],))
+        METRICS.count("jobs.enqueued", len(rows))
+        return len(rows)
+
+    def enqueue_range(self, fstart, fend, requeue: bool = False) -> int:
+        """
+        Registra como pendientes los segmentos de activity_all que solapan
+        con [fstart, fend] (mismo criterio que segments_retrieval).
+
+        :param fstart: Inicio del rango (sin zona horaria: Europe/Madrid).
+        :param fend: Fin del rango (sin zona horaria: Europe/Madrid).
+        :param requeue: Como en enqueue.
+        :return: Número de trabajos registrados o reiniciados.
+        :rtype: int
+        """
+        rows = self._execute(f"""
+            INSERT INTO gait_jobs (act_all_id)
+            SELECT id FROM activity_all WHERE start_time <= %s AND end_time >= %s
+            {self._on_conflict(requeue)}
+            RETURNING act_all_id;
+        """, (ensure_utc(fend), ensure_utc(fstart)))
+        METRICS.count("jobs.enqueued", len(rows))
+        return len(rows)
+
+    @staticmethod
+    def _on_conflict(requeue: bool) -> str:
+        if not requeue:
+            return "ON CONFLICT (act_all_id) DO NOTHING"
+        # Los trabajos en curso no se tocan: los terminará su worker
+        return f"""ON CONFLICT (act_all_id) DO UPDATE
+            SET status = '{PENDING}', attempts = 0, worker = NULL, lease_until = NULL,
+                last_error = NULL, updated_at = now()
+            WHERE gait_jobs.status <> '{RUNNING}'"""
+
+    def claim(self, worker: str, batch_size: int = 1) -> List[int]:
+        """
+        Reclama hasta `batch_size` trabajos pendientes o con el plazo vencido.
+
+        Los trabajos vencidos que ya agotaron sus intentos se marcan antes
+        como fallidos.
+
+        :param worker: Identificador del worker (p. ej. ``host:pid``).
+        :param batch_size: Número máximo de trabajos.
+        :return: ids de activity_all reclamados, en orden (lista vacía si no hay).
+        :rtype: list[int]
+        """
+        with METRICS.span("jobs.claim"):
+            self.reap()
+            rows = self._execute(f"""
+                UPDATE gait_jobs
+                SET status = '{RUNNING}', worker = %s, attempts = attempts + 1,
+                    lease_until = now() + make_interval(secs => %s), updated_at = now()
+                WHERE act_all_id IN (
+                    SELECT act_all_id FROM gait_jobs
+                    WHERE (status = '{PENDING}'
+                           OR (status = '{RUNNING}' AND lease_until < now()))
+                      AND attempts < %s
+                    ORDER BY act_all_id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED)
+                RETURNING act_all_id;
+            """, (worker, self.lease_seconds, self.max_attempts, int(batch_size)))
+        ids = sorted(r[0] for r in rows)
+        METRICS.count("jobs.claimed", len(ids))
+        return ids
+
+    def renew(self, worker: str, ids: List[int]) -> int:
+        """
+        Prolonga el plazo de los trabajos que el worker tiene en curso.
+
+        :param worker: Identificador del worker.
+        :param ids: ids de activity_all.
+        :return: Número de trabajos renovados (menos que len(ids) si alguno
+                 ya no pertenece al worker).
+        :rtype: int
+        """
+        rows = self._execute(f"""
+            UPDATE gait_jobs SET lease_until = now() + make_interval(secs => %s), updated_at = now()
+            WHERE act_all_id = ANY(%s::int[]) AND worker = %s AND status = '{RUNNING}'
+            RETURNING act_all_id;
+        """, (self.lease_seconds, [int(i) for i in ids], worker))
+        return len(rows)
+
+    def complete(self, worker: str, ids: List[int], commit: bool = True) -> None:
+        """
+        Marca como terminados los trabajos del worker.
+
+        Con ``commit=False`` se marca en la transacción abierta, de modo que
+        los resultados guardados antes (store_data con ``commit=False``) y el
+        cambio de estado se confirman juntos: un trabajo nunca queda terminado
+        sin resultados, ni con resultados duplicados si se reintenta.
+
+        :param worker: Identificador del worker.
+        :param ids: ids de activity_all.
+        :param commit: Si se confirma la transacción.
+        :raises LeaseLostError: Si algún trabajo ya no pertenece al worker
+                                (se deshace la transacción completa).
+        """
+        ids = [int(i) for i in ids]
+        rows = self._execute(f"""
+            UPDATE gait_jobs
+            SET status = '{DONE}', lease_until = NULL, last_error = NULL, updated_at = now()
+            WHERE act_all_id = ANY(%s::int[]) AND worker = %s AND status = '{RUNNING}'
+            RETURNING act_all_id;
+        """, (ids, worker), commit=False)
+        lost = set(ids) - {r[0] for r in rows}
+        if lost:
+            self.data_manager.pg_conn.rollback()
+            raise LeaseLostError(f"Trabajos reclamados por otro worker: {sorted(lost)}")
+        if commit:
+            self.data_manager.pg_conn.commit()
+        METRICS.count("jobs.done", len(ids))
+
+    def fail(self, worker: str, ids: List[int], error: str) -> None:
+        """
+        Devuelve a la cola los trabajos del worker que han fallado, o los
+        marca como fallidos si han agotado sus intentos.
+
+        :param worker: Identificador del worker.
+        :param ids: ids de activity_all.
+        :param error: Descripción del error (se guarda en last_error).
+        """
+        rows = self._execute(f"""
+            UPDATE gait_jobs
+            SET status = CASE WHEN attempts >= %s THEN '{FAILED}' ELSE '{PENDING}' END,
+                worker = NULL, lease_until = NULL, last_error = %s, updated_at = now()
+            WHERE act_all_id = ANY(%s::int[]) AND worker = %s AND status = '{RUNNING}'
+            RETURNING act_all_id;
+        """, (self.max_attempts, str(error)[:2000], [int(i) for i in ids], worker))
+        METRICS.count("jobs.failed", len(rows))
+
+    def reap(self) -> int:
+        """
+        Marca como fallidos los trabajos con el plazo vencido que ya agotaron
+        sus intentos (su último worker murió sin terminarlos).
+
+        :return: Número de trabajos marcados.
+        :rtype: int
+        """
+        rows = self._execute(f"""
+            UPDATE gait_jobs
+            SET status = '{FAILED}', lease_until = NULL,
+                last_error = COALESCE(last_error, 'lease expired'), updated_at = now()
+            WHERE status = '{RUNNING}' AND lease_until < now() AND attempts >= %s
+            RETURNING act_all_id;
+        """, (self.max_attempts,))
+        return len(rows)
+
+    def retry_failed(self, ids: Optional[List[int]] = None) -> int:
+        """
+        Vuelve a poner en cola los trabajos fallidos, con los intentos a cero.
+
+        :param ids: ids de activity_all (None = todos los fallidos).
+        :return: Número de trabajos reiniciados.
+        :rtype: int
+        """
+        ids = None if ids is None else [int(i) for i in ids]
+        rows = self._execute(f"""
+            UPDATE gait_jobs
+            SET status = '{PENDING}', attempts = 0, worker = NULL, last_error = NULL,
+                updated_at = now()
+            WHERE status = '{FAILED}' AND (%s::int[] IS NULL OR act_all_id = ANY(%s::int[]))
+            RETURNING act_all_id;
+        """, (ids, ids))
+        return len(rows)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Número de trabajos por estado.
+
+        :return: Diccionario estado -> número (incluye los estados sin trabajos).
+        :rtype: dict
+        """
+        rows = self._execute("SELECT status, count(*) FROM gait_jobs GROUP BY status;")
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        counts.update({status: int(n) for status, n in rows})
+        return counts
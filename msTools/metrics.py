@@ -0,0 +1,203 @@
+"""
+Instrumentación ligera del pipeline: tramos (spans) cronometrados y contadores.
+
+Las métricas se acumulan en un registro de proceso (``METRICS``) seguro entre
+hilos. Cada tramo guarda el número de llamadas, el tiempo total y el máximo;
+los contadores suman valores (filas, bytes, consultas...). Al final de una
+ejecución el resumen se exporta en JSON o en el formato de texto de
+Prometheus (apto para el textfile collector de node_exporter)::
+
+    from msTools.metrics import METRICS
+
+    with METRICS.span("influx.query"):
+        data = ...
+    METRICS.count("influx.rows", len(data))
+    print(METRICS.to_prometheus())
+
+Los procesos hijos (``find_gait -j``) tienen su propio registro: envían al
+padre lo acumulado con ``drain()`` y el padre lo incorpora con ``merge()``.
+"""
+import atexit
+import functools
+import json
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+
+class Metrics:
+    """Registro de tramos cronometrados y contadores."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._spans: Dict[str, Dict[str, float]] = {}
+        self._counters: Dict[str, float] = {}
+        self._started = time.time()
+
+    def reset(self) -> None:
+        """Vacía el registro."""
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._started = time.time()
+
+    def observe(self, name: str, seconds: float, calls: int = 1) -> None:
+        """
+        Añade una duración al tramo `name`.
+
+        :param name: Nombre del tramo (p. ej. ``"influx.query"``).
+        :param seconds: Duración en segundos.
+        :param calls: Número de llamadas que representa.
+        """
+        with self._lock:
+            span = self._spans.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+            span["count"] += calls
+            span["total_s"] += seconds
+            span["max_s"] = max(span["max_s"], seconds)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """Cronometra el bloque ``with`` (también si lanza una excepción)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def timed(self, name: str) -> Callable:
+        """Decorador que cronometra cada llamada a la función como el tramo `name`."""
+        def decorator(fn: Callable) -> Callable:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name: str, value: float = 1) -> None:
+        """
+        Suma `value` al contador `name`.
+
+        :param name: Nombre del contador (p. ej. ``"influx.rows"``).
+        :param value: Cantidad a sumar.
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> Dict:
+        """
+        Copia del estado actual.
+
+        :return: ``{"started": epoch, "spans": {...}, "counters": {...}}``.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "started": self._started,
+                "spans": {k: dict(v) for k, v in self._spans.items()},
+                "counters": dict(self._counters),
+            }
+
+    def merge(self, snapshot: Dict) -> None:
+        """
+        Incorpora el snapshot de otro registro (p. ej. de un proceso hijo).
+
+        :param snapshot: Resultado de ``snapshot()``.
+        """
+        with self._lock:
+            for name, other in snapshot.get("spans", {}).items():
+                span = self._spans.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+                span["count"] += other["count"]
+                span["total_s"] += other["total_s"]
+                span["max_s"] = max(span["max_s"], other["max_s"])
+            for name, value in snapshot.get("counters", {}).items():
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def drain(self) -> Dict:
+        """Devuelve el snapshot y vacía el registro (para enviarlo a otro proceso)."""
+        with self._lock:
+            snap = {
+                "started": self._started,
+                "spans": self._spans,
+                "counters": self._counters,
+            }
+            self._spans, self._counters = {}, {}
+            return snap
+
+    def summary(self) -> Dict:
+        """Snapshot con la duración total de la ejecución y la media de cada tramo."""
+        snap = self.snapshot()
+        snap["elapsed_s"] = time.time() - snap["started"]
+        for span in snap["spans"].values():
+            span["mean_s"] = span["total_s"] / span["count"] if span["count"] else 0.0
+        return snap
+
+    def to_json(self) -> str:
+        """Resumen en JSON."""
+        return json.dumps(self.summary(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix: str = "ms_monitoring") -> str:
+        """
+        Resumen en el formato de texto de exposición de Prometheus.
+
+        :param prefix: Prefijo de los nombres de las métricas.
+        :return: Texto con una línea por serie.
+        :rtype: str
+        """
+        snap = self.summary()
+        lines = [
+            f"# HELP {prefix}_run_seconds Duration of the run.",
+            f"# TYPE {prefix}_run_seconds gauge",
+            f"{prefix}_run_seconds {snap['elapsed_s']:.6f}",
+        ]
+        series = (("span_seconds_total", "total_s", "Time spent in each stage."),
+                  ("span_calls_total", "count", "Calls to each stage."),
+                  ("span_max_seconds", "max_s", "Longest call of each stage."))
+        for metric, key, text in series:
+            lines.append(f"# HELP {prefix}_{metric} {text}")
+            lines.append(f"# TYPE {prefix}_{metric} {'gauge' if key == 'max_s' else 'counter'}")
+            for name, span in sorted(snap["spans"].items()):
+                lines.append(f'{prefix}_{metric}{{span="{name}"}} {span[key]:g}')
+        for name, value in sorted(snap["counters"].items()):
+            metric = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, fmt: str = "json", path: Optional[str] = None) -> None:
+        """
+        Escribe el resumen en `path` (o en stderr si es None o ``-``).
+
+        :param fmt: ``"json"`` o ``"prometheus"``.
+        :param path: Fichero de salida.
+        """
+        text = self.to_prometheus() if fmt == "prometheus" else self.to_json() + "\n"
+        if path in (None, "-"):
+            sys.stderr.write(text)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+
+
+    def write_at_exit(self, fmt: str = "json", path: Optional[str] = None) -> None:
+        """
+        Cronometra el resto de la ejecución como el tramo ``run`` y escribe el
+        resumen al terminar el proceso (también tras ``return`` o ``sys.exit``
+        tempranos en un main).
+
+        :param fmt: ``"json"`` o ``"prometheus"``.
+        :param path: Fichero de salida (stderr si es None o ``-``).
+        """
+        t0 = time.perf_counter()
+
+        def _finish() -> None:
+            self.observe("run", time.perf_counter() - t0)
+            self.write(fmt, path)
+        atexit.register(_finish)
+
+
+# Registro del proceso
+METRICS = Metrics()
@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
 from typing import Optional, List
 
@@ -10,8 +11,8 @@ class CodeID(BaseModel):
 class ActivityLeg(BaseModel):
     codeid_id: int        # Relación con la tabla codeids
     foot: str             # "Left" o "Right"
-    start_time: str       # ISO 8601 timestamp
-    end_time: str         # ISO 8601 timestamp
+    start_time: datetime  # UTC (también acepta ISO 8601)
+    end_time: datetime    # UTC (también acepta ISO 8601)
     duration: float       # Duración en segundos
     total_value: float    # Sample number collected
     mac: Optional[str] = None
@@ -21,8 +22,8 @@ class ActivityLeg(BaseModel):
 class ActivityAll(BaseModel):
     codeid_ids: List[int] = []       # Relación con la tabla codeids Right and Left
     codeleg_ids: List[int] = []      # Pair of pointers to the activity_leg ID
-    start_time: str                  # ISO 8601 timestamp
-    end_time: str                    # ISO 8601 timestamp
+    start_time: datetime             # UTC (también acepta ISO 8601)
+    end_time: datetime               # UTC (también acepta ISO 8601)
     duration: float                  # Duración del período sincronizado
     macs: List[str] = []             # list of Right and Left macs
     active_legs: List[str] = []      # Almacena las piernas activas, e.g., ["Right", "Left"]
@@ -0,0 +1,253 @@
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+from msTools.timeutils import ensure_utc
+
+
+class SensorCache:
+    """
+    Caché local en disco (Parquet) de los datos brutos de InfluxDB.
+
+    Cada pieza guarda los datos de un (CodeID, Foot) en un rango semiabierto
+    [start, stop). Una petición se sirve con las piezas que la cubren y sólo
+    se consultan a InfluxDB los huecos que falten. Los datos más recientes que
+    `settle` no se guardan. Al escribir un hueco se fusiona con las piezas
+    contiguas y, si se supera `max_bytes`, se eliminan las menos usadas (LRU).
+    """
+
+    INDEX = "index.json"
+    LOCK = "index.lock"
+
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024**3,
+                 settle="10min") -> None:
+        """
+        Inicializa la caché en el directorio indicado.
+
+        :param directory: Directorio donde se guardan las piezas y el índice.
+        :type directory: str
+        :param max_bytes: Tamaño máximo de la caché en bytes.
+        :type max_bytes: int
+        :param settle: Margen respecto a ahora dentro del cual los datos no se
+                       guardan, porque aún pueden llegar muestras con retraso.
+        :type settle: str | pd.Timedelta
+        :raises ImportError: Si pyarrow no está instalado.
+        """
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("SensorCache necesita pyarrow (pip install pyarrow).") from e
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.settle = pd.Timedelta(settle)
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional["SensorCache"]:
+        """
+        Crea la caché a partir de la sección `cache` del YAML (claves `dir`,
+        `max_mb` y `settle`). Devuelve None si la sección no existe.
+        """
+        if not config or not config.get("dir"):
+            return None
+        return cls(config["dir"], int(config.get("max_mb", 2048)) * 1024**2,
+                   config.get("settle", "10min"))
+
+    # ------------------------------------------------------------------
+    # Índice
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _locked_index(self) -> Iterator[List[Dict]]:
+        """Bloquea el índice (entre procesos si es posible) y lo guarda al salir."""
+        with open(os.path.join(self.directory, self.LOCK), "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                path = os.path.join(self.directory, self.INDEX)
+                entries = []
+                if os.path.exists(path):
+                    with open(path, "r", encoding="utf-8") as f:
+                        entries = json.load(f)
+                yield entries
+                tmp = path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(entries, f)
+                os.replace(tmp, path)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _remove_files(self, entries: List[Dict]) -> None:
+        for e in entries:
+            if e["file"]:
+                try:
+                    os.remove(os.path.join(self.directory, e["file"]))
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self, entries: List[Dict]) -> None:
+        """Elimina las piezas menos usadas hasta respetar max_bytes."""
+        total = sum(e["size"] for e in entries)
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for e in sorted(entries, key=lambda e: e["last_access"]):
+            if total <= self.max_bytes:
+                break
+            victims.append(e)
+            total -= e["size"]
+        for e in victims:
+            entries.remove(e)
+        self._remove_files(victims)
+
+    def size(self) -> int:
+        """Tamaño actual de la caché en bytes."""
+        with self._locked_index() as entries:
+            return sum(e["size"] for e in entries)
+
+    def clear(self) -> None:
+        """Vacía la caché."""
+        with self._locked_index() as entries:
+            self._remove_files(entries)
+            entries.clear()
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _gaps(start: int, stop: int, covered: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Subrangos de [start, stop) no cubiertos por los rangos `covered`."""
+        gaps = []
+        cursor = start
+        for s, e in sorted(covered):
+            if s > cursor:
+                gaps.append((cursor, min(s, stop)))
+            cursor = max(cursor, e)
+            if cursor >= stop:
+                break
+        if cursor < stop:
+            gaps.append((cursor, stop))
+        return [g for g in gaps if g[0] < g[1]]
+
+    def _write_piece(self, key: List[str], start: int, stop: int, df: pd.DataFrame) -> Dict:
+        entry = {"key": key, "start": start, "stop": stop, "file": None,
+                 "size": 0, "last_access": time.time()}
+        if not df.empty:
+            entry["file"] = f"{uuid.uuid4().hex}.parquet"
+            path = os.path.join(self.directory, entry["file"])
+            df.to_parquet(path, index=False)
+            entry["size"] = os.path.getsize(path)
+        return entry
+
+    def _read_piece(self, entry: Dict) -> pd.DataFrame:
+        if not entry["file"]:
+            return pd.DataFrame()
+        return pd.read_parquet(os.path.join(self.directory, entry["file"]))
+
+    def get(self, codeid: str, foot: str, start, stop,
+            fetch: Callable[[pd.Timestamp, pd.Timestamp], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Devuelve los datos de [start, stop) sirviendo desde disco lo que esté
+        en caché y consultando con `fetch` sólo los huecos.
+
+        Lo posterior a ahora - `settle` se consulta siempre y no se guarda,
+        porque aún pueden llegar muestras con retraso. Las piezas leídas no se
+        reescriben: sólo al guardar un hueco nuevo se fusiona con las piezas
+        contiguas que ya están en memoria.
+
+        :param codeid: CodeID real del sensor.
+        :param foot: 'Left' o 'Right'.
+        :param start: Inicio del rango (incluido).
+        :param stop: Fin del rango (excluido).
+        :param fetch: Función (start, stop) -> DataFrame con columna `_time`.
+                      Debe lanzar una excepción si la consulta falla, para no
+                      guardar un error como un rango vacío.
+        :return: DataFrame ordenado por `_time`.
+        :rtype: pd.DataFrame
+        """
+        key = [codeid, foot]
+        start_ts, stop_ts = ensure_utc(start), ensure_utc(stop)
+        start_ns, stop_ns = start_ts.value, stop_ts.value
+        # Sólo se cachea hasta el horizonte de asentamiento
+        cache_stop = max(start_ns, min(stop_ns, (pd.Timestamp.now(tz="UTC") - self.settle).value))
+
+        with self._locked_index() as entries:
+            pieces = [dict(e) for e in entries if e["key"] == key
+                      and e["start"] < cache_stop and e["stop"] > start_ns]
+
+        # Datos en caché; si otra instancia eliminó una pieza, se vuelve a pedir
+        for p in list(pieces):
+            try:
+                p["data"] = self._read_piece(p)
+            except (FileNotFoundError, OSError):
+                pieces.remove(p)
+        gaps = self._gaps(start_ns, cache_stop, [(p["start"], p["stop"]) for p in pieces])
+        fetched = [{"start": s, "stop": e,
+                    "data": fetch(pd.Timestamp(s, tz="UTC"), pd.Timestamp(e, tz="UTC"))}
+                   for s, e in gaps]
+        live = fetch(pd.Timestamp(cache_stop, tz="UTC"), stop_ts) if cache_stop < stop_ns else None
+
+        frames = [p["data"] for p in pieces + fetched]
+        if live is not None:
+            frames.append(live)
+        frames = [f for f in frames if not f.empty]
+        data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+        with self._locked_index() as entries:
+            now = time.time()
+            used = {(p["start"], p["file"]) for p in pieces}
+            for e in entries:
+                if e["key"] == key and (e["start"], e["file"]) in used:
+                    e["last_access"] = now
+            if fetched:
+                new, old = self._merge_on_write(key, fetched, pieces)
+                stale = [e for e in entries if e["key"] == key
+                         and (e["start"], e["file"]) in old]
+                for e in stale:
+                    entries.remove(e)
+                self._remove_files(stale)
+                entries.extend(new)
+            self._evict(entries)
+
+        if data.empty:
+            return data
+        times = data["_time"]
+        mask = (times >= start_ts) & (times < stop_ts)
+        return data[mask].sort_values("_time", ignore_index=True)
+
+    def _merge_on_write(self, key: List[str], fetched: List[Dict],
+                        pieces: List[Dict]) -> Tuple[List[Dict], set]:
+        """
+        Agrupa cada hueco consultado con las piezas contiguas y escribe una
+        pieza por grupo. Devuelve las entradas nuevas y las (start, file) de
+        las piezas que sustituyen.
+        """
+        parts = sorted(fetched + pieces, key=lambda p: p["start"])
+        groups = [[parts[0]]]
+        for p in parts[1:]:
+            if p["start"] <= max(q["stop"] for q in groups[-1]):
+                groups[-1].append(p)
+            else:
+                groups.append([p])
+
+        new, old = [], set()
+        for group in groups:
+            if not any("file" not in p for p in group):
+                continue  # sólo piezas existentes: no se reescriben
+            frames = [p["data"] for p in group if not p["data"].empty]
+            df = (pd.concat(frames, ignore_index=True).sort_values("_time", ignore_index=True)
+                  if frames else pd.DataFrame())
+            new.append(self._write_piece(key, min(p["start"] for p in group),
+                                         max(p["stop"] for p in group), df))
+            old.update((p["start"], p["file"]) for p in group if "file" in p)
+        return new, old
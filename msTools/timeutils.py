@@ -1,5 +1,20 @@
+"""
+Conversión de fechas a la representación canónica del pipeline.
+
+Dentro del pipeline las fechas viajan como datetime64[ns] en UTC (con zona
+``UTC`` o, en msGait, sin zona pero expresadas en UTC) o como int64 en ns
+desde epoch. Las cadenas sólo aparecen en la entrada del usuario y en las
+consultas Flux; hacia PostgreSQL se pasan fechas con zona (``db_times``).
+"""
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
 import pandas as pd
 
+Times = Union[pd.Series, pd.Index, np.ndarray, Iterable]
+
+
 def ensure_utc(ts):
     """
     Toma un datetime/string/Timestamp y devuelve un pd.Timestamp con tz=UTC.
@@ -14,3 +29,123 @@ def ensure_utc(ts):
     if ts.tzinfo is None:
         ts = ts.tz_localize("Europe/Madrid")
     return ts.tz_convert("UTC")
+
+
+def ensure_utc_array(values: Times, naive_tz: Optional[str] = "Europe/Madrid"):
+    """
+    Versión vectorizada de ensure_utc para columnas y arrays de fechas.
+
+    Acepta fechas (con o sin zona), cadenas ISO 8601 (también con zonas
+    distintas entre sí) y enteros en ns desde epoch (UTC).
+
+    :param values: Series, Index, array o lista de fechas.
+    :param naive_tz: Zona que se asume para las fechas sin zona horaria
+                     (por defecto Europe/Madrid, como ensure_utc; None = UTC).
+    :return: Fechas datetime64[ns, UTC]: una Series con el mismo índice si
+             `values` lo es y, si no, un DatetimeIndex.
+    :rtype: pd.Series | pd.DatetimeIndex
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    dtype = getattr(values, "dtype", None)
+    if dtype is not None and dtype.kind in "iu":
+        times = pd.DatetimeIndex(np.asarray(values, dtype=np.int64).view("datetime64[ns]"),
+                                 tz="UTC")
+    else:
+        try:
+            times = pd.DatetimeIndex(pd.to_datetime(values, format="ISO8601"))
+        except ValueError:
+            # Zonas horarias mezcladas: cada valor se convierte con la suya
+            times = pd.DatetimeIndex(pd.to_datetime(values, format="ISO8601", utc=True))
+        if times.tz is None:
+            times = times.tz_localize(naive_tz or "UTC")
+        times = times.tz_convert("UTC")
+    times = times.as_unit("ns")
+    return pd.Series(times, index=index) if index is not None else times
+
+
+def to_naive_utc(values: Times):
+    """
+    Fechas en UTC sin zona horaria (datetime64[ns]); las fechas sin zona se
+    toman como UTC.
+
+    :param values: Series, Index, array o lista de fechas.
+    :return: Series (mismo índice) o DatetimeIndex datetime64[ns].
+    """
+    times = ensure_utc_array(values, naive_tz="UTC")
+    if isinstance(times, pd.Series):
+        return times.dt.tz_localize(None)
+    return times.tz_localize(None)
+
+
+def to_epoch_ns(values: Times) -> np.ndarray:
+    """
+    Fechas como int64 en ns desde epoch (UTC); las fechas sin zona se toman como UTC.
+
+    :param values: Series, Index, array o lista de fechas (o ya en int64 ns).
+    :return: Array int64.
+    :rtype: np.ndarray
+    """
+    dtype = getattr(values, "dtype", None)
+    if dtype is not None and dtype.kind in "iu":
+        return np.asarray(values, dtype=np.int64)
+    return pd.DatetimeIndex(ensure_utc_array(values, naive_tz="UTC")).asi8
+
+
+def naive_utc_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convierte a UTC sin zona todas las columnas de fechas con zona de un
+    DataFrame (p. ej. las TIMESTAMPTZ que devuelve psycopg2 con el huso de la
+    sesión), sin alterar las demás.
+
+    :param df: DataFrame a convertir (se modifica y se devuelve).
+    :return: El mismo DataFrame.
+    :rtype: pd.DataFrame
+    """
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+            df[col] = df[col].dt.tz_convert("UTC").dt.tz_localize(None).dt.as_unit("ns")
+        elif df[col].dtype == object and len(df) and \
+                isinstance(df[col].iloc[0], datetime) and df[col].iloc[0].tzinfo is not None:
+            # Varios husos en la misma columna (p. ej. cambio de horario)
+            df[col] = to_naive_utc(df[col])
+    return df
+
+
+def db_times(data: pd.DataFrame, columns: Iterable[str] = ("start_time", "end_time")) -> pd.DataFrame:
+    """
+    Prepara las columnas de fechas para PostgreSQL (TIMESTAMPTZ): fechas con
+    zona UTC, de modo que psycopg2 las envía con su desfase y no dependen del
+    huso de la sesión. Las fechas sin zona se toman como UTC.
+
+    :param data: DataFrame a insertar.
+    :param columns: Columnas de fechas (se ignoran las que no existen).
+    :return: Copia superficial de `data` con las columnas convertidas.
+    :rtype: pd.DataFrame
+    """
+    present = [c for c in columns if c in data.columns]
+    if not present:
+        return data
+    return data.assign(**{c: ensure_utc_array(data[c], naive_tz="UTC") for c in present})
+
+
+def time_slices(start, end, step) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Divide el rango semiabierto [start, end) en tramos consecutivos
+    [s, e) de duración `step` (el último puede ser más corto), sin huecos
+    ni solapes.
+
+    :param start: Inicio del rango (incluido).
+    :param end: Fin del rango (excluido).
+    :param step: Duración de cada tramo (Timedelta o cadena como ``"30min"``);
+                 None devuelve el rango completo.
+    :return: Lista de pares (inicio, fin) en orden.
+    :rtype: list[tuple[pd.Timestamp, pd.Timestamp]]
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if step is None or end <= start:
+        return [(start, end)]
+    step = pd.Timedelta(step)
+    if step <= pd.Timedelta(0):
+        raise ValueError(f"step must be positive, got {step}")
+    bounds = [start + k * step for k in range(int(np.ceil((end - start) / step)))] + [end]
+    return list(zip(bounds[:-1], bounds[1:]))
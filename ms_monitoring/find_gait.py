@@ -4,6 +4,8 @@ from typing import Optional, List
 
 from msTools import i18n
 from msTools.data_manager import DataManager
+from msTools.metrics import METRICS
+from msGait.export_sink import open_export_sink
 from msGait.movement_detector import MovementDetector
 
 
@@ -23,87 +25,113 @@ i18n.init_translation('es')  # Inicializa por defecto
 
 def main():
     parser = argparse.ArgumentParser(description=i18n._("ARG_TIT_FIND_GAIT"))
-    parser.add_argument("-i", "--ids", dest="act_all_ids", type=json.loads, required=True,
+    parser.add_argument("-i", "--ids", dest="act_all_ids", type=json.loads, default=None,
                         help=i18n._("ARG_LIST_ACT_ALL_IDS"))
-    # parser.add_argument("-f", "--from", dest="fstart", type=str, default=None,
-    #                     help=i18n._("ARG_STR_TIME_FROM"))
-    # parser.add_argument("-u", "--until", dest="fend", type=str, default=None,
-    #                     help=i18n._("ARG_STR_TIME_UNTIL"))
+    parser.add_argument("-f", "--from", dest="fstart", type=str, default=None,
+                        help=i18n._("ARG_STR_TIME_FROM"))
+    parser.add_argument("-u", "--until", dest="fend", type=str, default=None,
+                        help=i18n._("ARG_STR_TIME_UNTIL"))
+    parser.add_argument("-b", "--batch-size", dest="batch_size", type=int, default=None,
+                        help=i18n._("ARG_SEG_BATCH"))
     parser.add_argument("-c", "--config", dest="config_file", type=str, required=True,
                         help=i18n._("ARG_STR_PATH_YAML"))
     parser.add_argument("-l", "--lang", dest="lng", type=str, default="es",
                         help=i18n._("ARG_STR_LNG"))
     parser.add_argument("-o", "--output", dest="fout", type=str, default=None,
                         help=i18n._("ARG_STR_FOUT"))
+    parser.add_argument("--export-format", dest="export_format", choices=["parquet", "xlsx"],
+                        default=None, help=i18n._("ARG_EXPORT_FORMAT"))
     parser.add_argument("-v", "--verbose", action=VAction, nargs="?", default=0, const=1,
                         help=i18n._("ARG_VB_LEVEL"))
     parser.add_argument("--head-rows", dest="head_rows", type=int, default=8,
                         help=i18n._("ARG_HEAD_ROWS"))
     parser.add_argument("--save", dest="save", action="store_true", default=False,
                         help="Guardar resultados en PostgreSQL")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=1,
+                        help=i18n._("ARG_JOBS"))
+    parser.add_argument("--metrics", dest="metrics", choices=["json", "prometheus"], default=None,
+                        help=i18n._("ARG_METRICS"))
+    parser.add_argument("--metrics-out", dest="metrics_out", type=str, default=None,
+                        help=i18n._("ARG_METRICS_OUT"))
     args = parser.parse_args()
     i18n.init_translation(args.lng)
-    
-    # Inicializar detector (gestiona internamente DataManager y recuperación de segmentos)
-    # Constructor flexible que puede funcionar por ids o por fechas
+    # Por ids (-i) o por rango (-f y -u), no ambos
+    by_range = bool(args.fstart and args.fend)
+    if (args.act_all_ids is None) != by_range or (by_range is False and (args.fstart or args.fend)):
+        parser.error(i18n._("FGAIT_ARGS"))
+    if args.metrics:
+        METRICS.write_at_exit(args.metrics, args.metrics_out)
+
+    # Inicializar detector: la selección (por ids o por fechas) se lee por páginas
     detector = MovementDetector(
         config_file   = args.config_file,
         sampling_rate = 50,
-        fstart        = None,
-        fend          = None,
+        fstart        = args.fstart,
+        fend          = args.fend,
         ids           = args.act_all_ids,
         verbose       = args.verbose
     )
-
-    # Si no hay piernas, salimos
-    if detector.df_legs.empty:
-        return
-
+    sink = open_export_sink(args.fout, args.export_format, args.verbose) if args.fout else None
     if args.verbose >= 1:
         print(i18n._("FGAIT_1ST"))
 
-    # Detectar marchas efectivas por pierna
-    df_effective = detector.detect_effective_movement(detector.df_legs,args.fout,args.verbose)
-    if df_effective.empty:
-        print(i18n._("FGAIT_NO_WALK"))
-        return
-
-    if args.verbose >= 2:
-        print(i18n._("FGAIT_WKLS_FND"))
-        print(df_effective.head(args.head_rows))
-
-    # Guardado o impresión de effective_movement
-    if args.save:
-        detector.save_to_postgresql("effective_movement", df_effective,args.verbose)
-        if args.verbose >= 1:
-            print(i18n._("FGAIT_NUM_WALKS").format(ns=len(df_effective)))
-
-    # Detectar periodos de marcha efectiva simultánea (ambos pies)
-    df_gait = detector.detect_effective_gait(df_effective,args.verbose)
-    if df_gait.empty:
-        if args.verbose >= 1:
-            print("No se encontraron periodos de marcha efectiva simultánea.")
-    else:
-        if args.verbose >= 1:
-            print("Periodos de marcha efectiva simultánea (ambos pies):")
+    # Cada página de segmentos se analiza, se guarda y se descarta: la memoria
+    # no depende de la longitud del rango
+    pages = n_effective = n_gait = 0
+    try:
+        for legs in detector.iter_legs(args.batch_size):
+            pages += 1
+            # Detectar marchas efectivas por pierna
+            df_effective = detector.detect_effective_movement(legs, vb=args.verbose,
+                                                              workers=args.jobs, sink=sink)
+            if df_effective.empty:
+                continue
+
+            if args.verbose >= 2 and n_effective == 0:
+                print(i18n._("FGAIT_WKLS_FND"))
+                print(df_effective.head(args.head_rows))
+            n_effective += len(df_effective)
+
+            # Guardado de effective_movement
+            if args.save:
+                detector.save_to_postgresql("effective_movement", df_effective, args.verbose)
+
+            # Detectar periodos de marcha efectiva simultánea (ambos pies); los
+            # dos pies de un segmento están siempre en la misma página
+            df_gait = detector.detect_effective_gait(df_effective, args.verbose)
+            if df_gait.empty:
+                continue
+            n_gait += len(df_gait)
             if args.verbose >= 2:
+                print("Periodos de marcha efectiva simultánea (ambos pies):")
                 df_string = df_gait.to_string(index=False)
                 indentation = "     "  # 5 spaces
                 # Divide la cadena en líneas, sangra cada línea y únelas de nuevo
-                indented_df_string = "\n".join([indentation + line for line in 
+                indented_df_string = "\n".join([indentation + line for line in
                                                 df_string.splitlines()])
                 print(indented_df_string)
 
-        if args.save:
-            detector.save_to_postgresql("effective_gait", df_gait,args.verbose)
-            if args.verbose >= 1:
-                print(f"{len(df_gait)} registros de effective_gait guardados")
+            if args.save:
+                detector.save_to_postgresql("effective_gait", df_gait, args.verbose)
+    finally:
+        if sink:
+            sink.close()
+        detector.close()
 
+    # Si no hay piernas, salimos
+    if pages == 0:
+        return
+    if n_effective == 0:
+        print(i18n._("FGAIT_NO_WALK"))
+        return
+    if args.save and args.verbose >= 1:
+        print(i18n._("FGAIT_NUM_WALKS").format(ns=n_effective))
     if args.verbose >= 1:
+        if n_gait == 0:
+            print("No se encontraron periodos de marcha efectiva simultánea.")
+        elif args.save:
+            print(f"{n_gait} registros de effective_gait guardados")
         print(i18n._("FGAIT_END"))
-    
-    detector.close()
-
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
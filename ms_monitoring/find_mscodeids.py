@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import pandas as pd
 from msTools.data_manager import DataManager
 from msCodeID.codeid_processor import CodeIDProcessor
@@ -6,7 +7,10 @@ from datetime import datetime, timedelta
 import gettext
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from msTools.timeutils import ensure_utc
+from msTools.metrics import METRICS
 
 class VAction(argparse.Action):
     """
@@ -18,6 +22,202 @@ class VAction(argparse.Action):
         else:
             setattr(namespace, self.dest, int(values))
 
+def process_codeid(codeid: str, data_manager: DataManager, codeid_processor: CodeIDProcessor,
+                   start_datetime, end_datetime, args,
+                   sensor_data: Optional[pd.DataFrame] = None) -> bool:
+    """
+    Procesa un CodeID completo: lo registra, obtiene sus datos (si no se
+    pasan en `sensor_data`), segmenta ambas piernas y guarda activity_leg y
+    activity_all. Los errores de un CodeID se informan y no afectan al resto.
+
+    :return: True si el CodeID se procesó sin errores.
+    :rtype: bool
+    """
+    if args.verbose >= 1:
+        print(_("Processing data for CodeID: {codeid}...").format(codeid=codeid))
+
+    # Guardar el CodeID en la base de datos y obtener su ID
+    try:
+        codeid_id, is_new = data_manager.store_codeid(codeid, args.verbose)
+    except Exception as e:
+        print(_("Error storing CodeID {codeid}: {error}").format(codeid=codeid, error=str(e)))
+        return False
+
+    # Modo incremental: sólo los datos posteriores a las marcas de agua
+    if args.incremental:
+        try:
+            summary = codeid_processor.ingest_incremental(
+                codeid, codeid_id, start_datetime, end_datetime,
+                sensor_data=sensor_data, verbose=args.verbose)
+        except Exception as e:
+            print(_("Error processing activity segments for CodeID {codeid}: {error}").format(
+                codeid=codeid, error=str(e)))
+            return False
+        if args.verbose >= 1:
+            print(_("Incremental ingestion for CodeID {codeid}: {new_legs} new segments, "
+                    "{extended} extended, {activity_all} merged rows.").format(codeid=codeid, **summary))
+        return True
+
+    # Obtener datos del CodeID desde InfluxDB
+    if sensor_data is None:
+        try:
+            sensor_data = codeid_processor.fetch_codeid_data(
+                codeid, start_datetime, end_datetime
+                )
+        except Exception as e:
+            print(_("Error fetching data for CodeID {codeid}: {error}").format(codeid=codeid, error=str(e)))
+            return False
+
+    if sensor_data.empty:
+        if args.verbose >= 1:
+            print(_("No data found for CodeID: {codeid}.").format(codeid=codeid))
+        return False
+
+    # Robust foot‐column check: fail if it's missing
+    if 'Foot' not in sensor_data.columns:
+        sys.stderr.write(_(f"Critical error: 'Foot' field missing in sensor data for CodeID: {codeid}.").format(codeid=codeid))
+        return False
+    # Identificar segmentos de actividad distancia 80seg 
+    try:
+        activity_segL = codeid_processor.identify_activity_segments(\
+                            sensor_data,80,'Left')
+        activity_segR = codeid_processor.identify_activity_segments(\
+                            sensor_data,80,'Right')
+        # ———————— ELIMINAR SEGMENTOS DE DURACIÓN CERO ————————
+        if not activity_segL.empty:
+            activity_segL = activity_segL.loc[
+                (activity_segL['time_until'] - activity_segL['time_from']).dt.total_seconds() > 0
+            ]
+
+        if not activity_segR.empty:
+            activity_segR = activity_segR.loc[
+                (activity_segR['time_until'] - activity_segR['time_from']).dt.total_seconds() > 0
+            ]
+        # ————————————————————————————————————————————————
+        # Preparing and accomodating data for postgresql table
+        if activity_segL.empty:
+            if args.verbose >= 1:
+                print(_("No activity segments identified for CodeID: {codeid}, foot: Left.").format(codeid=codeid))
+        else:
+            activity_refL = data_manager.transform_activityleg(activity_segL)
+
+        if activity_segR.empty:
+            if args.verbose >= 1:
+                print(_("No activity segments identified for CodeID: {codeid}, foot: Right.").format(codeid=codeid))
+        else:
+            activity_refR = data_manager.transform_activityleg(activity_segR)
+        # Storing data
+        if not activity_segL.empty:
+            ids = data_manager.store_data("activity_leg", activity_refL)
+            activity_segL['codeleg_id'] = ids
+            if args.verbose >= 2:
+                print(_("Activity segments processed and stored ({n} rows):").format(n=len(activity_refL)))
+                print(activity_segL.head(args.head_rows))
+
+        if not activity_segR.empty:
+            ids = data_manager.store_data("activity_leg", activity_refR)
+            activity_segR['codeleg_id'] = ids
+            if args.verbose >= 2:
+                print(_("Activity segments processed and stored ({n} rows):").format(n=len(activity_refR)))
+                print(activity_segR.head(args.head_rows))
+
+        # Generamos la intersección de las dos piernas
+        # Key aspect in hierarchical information structure
+        res = codeid_processor.inter_segs(activity_segR,activity_segL)
+        if not res.empty:
+            dbrg= codeid_processor.merge_activity_legs_to_all(activity_segR,\
+                    activity_segL,res)
+            data_manager.store_data("activity_all", dbrg, validate=False)
+            if args.verbose >= 2:
+                print(_("Final merged segments stored ({n} rows):").format(n=len(dbrg)))
+                print(dbrg.head(args.head_rows))
+    except Exception as e:
+        print(_("Error processing activity segments for CodeID {codeid}: {error}").format(
+            codeid=codeid, error=str(e)))
+        return False
+    return True
+
+
+def incremental_start(codeid: str, data_manager: DataManager, codeid_processor: CodeIDProcessor,
+                      start_datetime):
+    """
+    Inicio de la consulta de un CodeID en modo --incremental: su marca de
+    agua más antigua (`start_datetime` para las piernas sin marca).
+    """
+    codeid_id, _ = data_manager.store_codeid(codeid)
+    return codeid_processor.incremental_start(codeid_id, start_datetime)
+
+
+def incremental_scan_start(data_manager: DataManager, start_datetime, end_datetime,
+                           lookback) -> pd.Timestamp:
+    """
+    Inicio de la búsqueda de CodeIDs (y de la consulta única de --batch) en
+    modo --incremental: la marca de agua más antigua, sin retroceder más allá
+    de `start_datetime` (-f, para los CodeIDs sin marca) salvo por marcas
+    posteriores a `end_datetime - lookback`. Las marcas más antiguas (CodeIDs
+    inactivos o retirados) no amplían la ventana: esos CodeIDs se consultan
+    desde su propia marca si vuelven a tener datos.
+    """
+    oldest = data_manager.min_watermark(since=end_datetime - pd.Timedelta(lookback))
+    if oldest is None:
+        return start_datetime
+    return min(start_datetime, ensure_utc(oldest))
+
+
+async def run_pipeline(codeids: List[str], data_manager: DataManager,
+                       codeid_processor: CodeIDProcessor, start_datetime, end_datetime,
+                       args, batch_data: Optional[Dict[str, pd.DataFrame]] = None) -> None:
+    """
+    Procesa los CodeIDs de forma concurrente, con un máximo de
+    `args.concurrency` a la vez. Las consultas a InfluxDB usan el cliente
+    asíncrono si aiohttp está instalado (si no, un hilo) y el procesado y las
+    escrituras en PostgreSQL se ejecutan en un pool de hilos, cada uno con su
+    conexión del pool de DataManager. Así la espera de red de un CodeID se
+    solapa con el cálculo y las escrituras de otros.
+    """
+    loop = asyncio.get_running_loop()
+    # Cada hilo retiene una conexión: no más hilos que conexiones en el pool
+    pool_max = data_manager.config["postgresql"].get("pool_max", 10)
+    executor = ThreadPoolExecutor(max_workers=max(1, min(args.concurrency, pool_max)))
+    loop.set_default_executor(executor)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    influx = None
+    if batch_data is None:
+        try:
+            influx = data_manager.create_influx_async_client()
+        except ImportError:
+            if args.verbose >= 2:
+                print(_("aiohttp not installed: InfluxDB queries run in threads."))
+
+    async def worker(codeid: str) -> None:
+        async with semaphore:
+            try:
+                sensor_data = batch_data.pop(codeid, None) if batch_data is not None else None
+                if sensor_data is None:
+                    fetch_start = start_datetime
+                    if args.incremental:
+                        # Cada CodeID se lee desde su propia marca de agua
+                        fetch_start = await loop.run_in_executor(
+                            None, incremental_start, codeid, data_manager, codeid_processor,
+                            start_datetime)
+                    sensor_data = await codeid_processor.fetch_codeid_data_async(
+                        codeid, fetch_start, end_datetime, influx)
+                await loop.run_in_executor(
+                    None, process_codeid, codeid, data_manager, codeid_processor,
+                    start_datetime, end_datetime, args, sensor_data)
+            except Exception as e:
+                print(_("Error processing activity segments for CodeID {codeid}: {error}").format(
+                    codeid=codeid, error=str(e)))
+
+    try:
+        await asyncio.gather(*(worker(codeid) for codeid in codeids))
+    finally:
+        if influx is not None:
+            await influx.close()
+        executor.shutdown(wait=True)
+
+
 def main():
     # 1) Pre-parse para capturar sólo -l/--lang (sin generar help aún)
     pre = argparse.ArgumentParser(add_help=False)
@@ -47,10 +247,24 @@ def main():
                         help=_("Path to the configuration file (config.yaml)."))
     parser.add_argument("-v", "--verbose", action=VAction, nargs="?", default=0, const=1,
                         help=_("Verbosity level (0=Silent, 1=Basic, 2=Detailed)."))
+    parser.add_argument("--batch", dest="batch", action="store_true",
+                        help=_("Fetch the per-minute counts of all CodeIDs with a single InfluxDB query."))
+    parser.add_argument("--incremental", dest="incremental", action="store_true",
+                        help=_("Only ingest data newer than the stored watermark of each CodeID and foot."))
+    parser.add_argument("--lookback", dest="lookback", type=str, default="7D",
+                        help=_("With --incremental, watermarks older than this (e.g. 7D, 12h) do not widen the CodeID scan."))
+    parser.add_argument("--concurrency", dest="concurrency", type=int, default=1,
+                        help=_("Number of CodeIDs processed concurrently (1 = sequential)."))
     parser.add_argument("--head-rows", dest="head_rows", type=int, default=5,
                         help=_("ARG_HEAD_ROWS"))
+    parser.add_argument("--metrics", dest="metrics", choices=["json", "prometheus"], default=None,
+                        help=_("Write per-stage timings and counters at the end of the run."))
+    parser.add_argument("--metrics-out", dest="metrics_out", type=str, default=None,
+                        help=_("File for --metrics (default: stderr). Use a .prom file for the node_exporter textfile collector."))
 
     args = parser.parse_args(remaining)
+    if args.metrics:
+        METRICS.write_at_exit(args.metrics, args.metrics_out)
 
     # Si el usuario cambia -l en la 2ª fase, re-iniciar traducción:
     if args.lng != pre_args.lng:
@@ -96,20 +310,32 @@ def main():
         )
         sys.exit(1)
 
+    # En modo incremental la búsqueda empieza en la marca de agua más antigua
+    # reciente (o en -f, para los CodeIDs sin marca); cada CodeID se lee desde las suyas
+    scan_start = start_datetime
+    if args.incremental:
+        scan_start = incremental_scan_start(data_manager, start_datetime, end_datetime,
+                                            args.lookback)
+
     if args.verbose >= 1:
         print(
             _("Getting msCodeIDs from {start} to {end}...")
             .format(
-                start=start_datetime.strftime('%Y-%m-%d %H:%M:%S'),
+                start=scan_start.strftime('%Y-%m-%d %H:%M:%S'),
                 end=end_datetime.strftime('%Y-%m-%d %H:%M:%S')
             )
         )
     
-    # Obtener CodeIDs en el rango de fechas
-    codeids = data_manager.get_codeids_in_range(
-        start_datetime.strftime("%Y-%m-%d %H:%M:%S"),
-        end_datetime.strftime("%Y-%m-%d %H:%M:%S")
-    )
+    # Obtener CodeIDs en el rango de fechas. En modo --batch una sola consulta
+    # devuelve los datos de todos los CodeIDs, ya separados por CodeID
+    if args.batch:
+        batch_data = codeid_processor.fetch_all_codeid_data(scan_start, end_datetime)
+        codeids = list(batch_data)
+    else:
+        codeids = data_manager.get_codeids_in_range(
+            scan_start.strftime("%Y-%m-%d %H:%M:%S"),
+            end_datetime.strftime("%Y-%m-%d %H:%M:%S")
+        )
     if not codeids:
         print(_("No CodeIDs found."))
         return None
@@ -124,93 +350,36 @@ def main():
         for cid in codeids:
             print(f"  - {cid}")
 
-    # Procesar CodeIDs
-    for codeid in codeids:
-        if args.verbose >= 1:
-            print(_("Processing data for CodeID: {codeid}...").format(codeid=codeid))
-
-        # Guardar el CodeID en la base de datos y obtener su ID
-        try:
-            codeid_id, is_new = data_manager.store_codeid(codeid, args.verbose)
-        except Exception as e:
-            print(_("Error storing CodeID {codeid}: {error}").format(codeid=codeid, error=str(e)))
-            continue
+    # Registrar todos los CodeIDs en bloque; si falla, cada CodeID se
+    # vuelve a intentar (y se aísla su error) dentro del bucle
+    try:
+        data_manager.store_codeids(codeids, args.verbose)
+    except Exception:
+        pass
 
-        # Obtener datos del CodeID desde InfluxDB
-        try:
-            sensor_data = codeid_processor.fetch_codeid_data(
-                codeid, start_datetime, end_datetime
-                )
-        except Exception as e:
-            print(_("Error fetching data for CodeID {codeid}: {error}").format(codeid=codeid, error=str(e)))
-            continue
+    # --batch sólo cubre desde scan_start: los CodeIDs con una marca anterior
+    # se consultan por separado desde la suya
+    if args.batch and args.incremental:
+        for codeid in codeids:
+            try:
+                if incremental_start(codeid, data_manager, codeid_processor,
+                                     start_datetime) < scan_start:
+                    batch_data.pop(codeid, None)
+            except Exception:
+                pass  # El error se informa al procesar el CodeID
 
-        if sensor_data.empty:
-            if args.verbose >= 1:
-                print(_("No data found for CodeID: {codeid}.").format(codeid=codeid))
-            continue
-
-        # Robust foot‐column check: fail if it's missing
-        if 'Foot' not in sensor_data.columns:
-            sys.stderr.write(_(f"Critical error: 'Foot' field missing in sensor data for CodeID: {codeid}.").format(codeid=codeid))
-            continue
-        # Identificar segmentos de actividad distancia 80seg 
-        try:
-            activity_segL = codeid_processor.identify_activity_segments(\
-                                sensor_data,80,'Left')
-            activity_segR = codeid_processor.identify_activity_segments(\
-                                sensor_data,80,'Right')
-            # ———————— ELIMINAR SEGMENTOS DE DURACIÓN CERO ————————
-            if not activity_segL.empty:
-                activity_segL = activity_segL.loc[
-                    (activity_segL['time_until'] - activity_segL['time_from']).dt.total_seconds() > 0
-                ]
-
-            if not activity_segR.empty:
-                activity_segR = activity_segR.loc[
-                    (activity_segR['time_until'] - activity_segR['time_from']).dt.total_seconds() > 0
-                ]
-            # ————————————————————————————————————————————————
-            # Preparing and accomodating data for postgresql table
-            if activity_segL.empty:
-                if args.verbose >= 1:
-                    print(_("No activity segments identified for CodeID: {codeid}, foot: Left.").format(codeid=codeid))
-            else:
-                activity_refL = data_manager.transform_activityleg(activity_segL)
-            
-            if activity_segR.empty:
-                if args.verbose >= 1:
-                    print(_("No activity segments identified for CodeID: {codeid}, foot: Right.").format(codeid=codeid))
-            else:
-                activity_refR = data_manager.transform_activityleg(activity_segR)
-            # Storing data
-            if not activity_segL.empty:
-                ids = data_manager.store_data("activity_leg", activity_refL)
-                activity_segL['codeleg_id'] = ids
-                if args.verbose >= 2:
-                    print(_("Activity segments processed and stored ({n} rows):").format(n=len(activity_refL)))
-                    print(activity_segL.head(args.head_rows))
-
-            if not activity_segR.empty:
-                ids = data_manager.store_data("activity_leg", activity_refR)
-                activity_segR['codeleg_id'] = ids
-                if args.verbose >= 2:
-                    print(_("Activity segments processed and stored ({n} rows):").format(n=len(activity_refR)))
-                    print(activity_segR.head(args.head_rows))
-
-            # Generamos la intersección de las dos piernas
-            # Key aspect in hierarchical information structure
-            res = codeid_processor.inter_segs(activity_segR,activity_segL)
-            if not res.empty:
-                dbrg= codeid_processor.merge_activity_legs_to_all(activity_segR,\
-                        activity_segL,res)
-                data_manager.store_data("activity_all",dbrg)
-                if args.verbose >= 2:
-                    print(_("Final merged segments stored ({n} rows):").format(n=len(dbrg)))
-                    print(dbrg.head(args.head_rows))
-        except Exception as e:
-            print(_("Error processing activity segments for CodeID {codeid}: {error}").format(
-                codeid=codeid, error=str(e)))
+    # Procesar CodeIDs
+    if args.concurrency > 1:
+        # La conexión del hilo principal vuelve al pool para los hilos del pipeline
+        data_manager.release_pg()
+        asyncio.run(run_pipeline(codeids, data_manager, codeid_processor,
+                                 start_datetime, end_datetime, args,
+                                 batch_data if args.batch else None))
+    else:
+        for codeid in codeids:
+            process_codeid(codeid, data_manager, codeid_processor,
+                           start_datetime, end_datetime, args,
+                           batch_data.pop(codeid, None) if args.batch else None)
     #
     if args.verbose >= 1:
         print(_("All CodeIDs processed successfully."))
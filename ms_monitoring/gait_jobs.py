@@ -0,0 +1,108 @@
+import argparse
+import json
+
+from msTools import i18n
+from msTools.data_manager import DataManager
+from msTools.job_queue import GaitJobQueue
+from msTools.metrics import METRICS
+from msGait.gait_worker import GaitWorker
+
+
+class VAction(argparse.Action):
+    """
+    Clase para manejar el nivel de verbose (-v).
+    """
+    def __call__(self, parser, namespace, values, option_string=None):
+        if values is None:
+            setattr(namespace, self.dest, getattr(namespace, self.dest) + 1)
+        else:
+            setattr(namespace, self.dest, int(values))
+
+
+i18n.init_translation('es')  # Inicializa por defecto
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=i18n._("ARG_TIT_GAIT_JOBS"))
+    parser.add_argument("-c", "--config", dest="config_file", type=str, required=True,
+                        help=i18n._("ARG_STR_PATH_YAML"))
+    parser.add_argument("-l", "--lang", dest="lng", type=str, default="es",
+                        help=i18n._("ARG_STR_LNG"))
+    parser.add_argument("-v", "--verbose", action=VAction, nargs="?", default=0, const=1,
+                        help=i18n._("ARG_VB_LEVEL"))
+    parser.add_argument("--lease", dest="lease", type=int, default=600,
+                        help=i18n._("ARG_JOBS_LEASE"))
+    parser.add_argument("--max-attempts", dest="max_attempts", type=int, default=3,
+                        help=i18n._("ARG_JOBS_MAX_ATTEMPTS"))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = sub.add_parser("enqueue", help=i18n._("ARG_JOBS_ENQUEUE"))
+    enqueue.add_argument("-i", "--ids", dest="act_all_ids", type=json.loads, default=None,
+                         help=i18n._("ARG_LIST_ACT_ALL_IDS"))
+    enqueue.add_argument("-f", "--from", dest="fstart", type=str, default=None,
+                         help=i18n._("ARG_STR_TIME_FROM"))
+    enqueue.add_argument("-u", "--until", dest="fend", type=str, default=None,
+                         help=i18n._("ARG_STR_TIME_UNTIL"))
+    enqueue.add_argument("--requeue", dest="requeue", action="store_true", default=False,
+                         help=i18n._("ARG_JOBS_REQUEUE"))
+
+    work = sub.add_parser("work", help=i18n._("ARG_JOBS_WORK"))
+    work.add_argument("-b", "--batch-size", dest="batch_size", type=int, default=1,
+                      help=i18n._("ARG_JOBS_BATCH"))
+    work.add_argument("-j", "--jobs", dest="jobs", type=int, default=1,
+                      help=i18n._("ARG_JOBS"))
+    work.add_argument("--max-jobs", dest="max_jobs", type=int, default=None,
+                      help=i18n._("ARG_JOBS_MAX_JOBS"))
+    work.add_argument("--poll", dest="poll", type=float, default=0,
+                      help=i18n._("ARG_JOBS_POLL"))
+    work.add_argument("--worker-id", dest="worker_id", type=str, default=None,
+                      help=i18n._("ARG_JOBS_WORKER_ID"))
+    work.add_argument("--metrics", dest="metrics", choices=["json", "prometheus"], default=None,
+                      help=i18n._("ARG_METRICS"))
+    work.add_argument("--metrics-out", dest="metrics_out", type=str, default=None,
+                      help=i18n._("ARG_METRICS_OUT"))
+
+    sub.add_parser("status", help=i18n._("ARG_JOBS_STATUS"))
+
+    retry = sub.add_parser("retry-failed", help=i18n._("ARG_JOBS_RETRY"))
+    retry.add_argument("-i", "--ids", dest="act_all_ids", type=json.loads, default=None,
+                       help=i18n._("ARG_LIST_ACT_ALL_IDS"))
+    return parser
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    i18n.init_translation(args.lng)
+
+    if args.command == "work":
+        if args.metrics:
+            METRICS.write_at_exit(args.metrics, args.metrics_out)
+        worker = GaitWorker(args.config_file, sampling_rate=50, batch_size=args.batch_size,
+                            lease_seconds=args.lease, max_attempts=args.max_attempts,
+                            workers=args.jobs, worker_id=args.worker_id, verbose=args.verbose)
+        try:
+            done = worker.run(max_jobs=args.max_jobs, poll_seconds=args.poll)
+        finally:
+            worker.close()
+        print(i18n._("JOBS-WORKER-END").format(worker=worker.worker_id, n=done))
+        return
+
+    with DataManager(config_path=args.config_file) as dm:
+        queue = GaitJobQueue(dm, args.lease, args.max_attempts)
+        if args.command == "enqueue":
+            if args.act_all_ids is not None:
+                n = queue.enqueue(args.act_all_ids, requeue=args.requeue)
+            elif args.fstart and args.fend:
+                n = queue.enqueue_range(args.fstart, args.fend, requeue=args.requeue)
+            else:
+                parser.error(i18n._("JOBS-ENQ-ARGS"))
+            print(i18n._("JOBS-ENQ").format(n=n))
+        elif args.command == "retry-failed":
+            print(i18n._("JOBS-RETRY").format(n=queue.retry_failed(args.act_all_ids)))
+        if args.command in ("status", "enqueue", "retry-failed"):
+            print(json.dumps(queue.stats()))
+
+
+if __name__ == "__main__":
+    main()
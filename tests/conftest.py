@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from benchmarks.backends import DEFAULT_CONFIG, InMemoryDataManager
+from benchmarks.synthetic import SyntheticDataset
+from fake_pg import FakePostgres, SqlDataManager, execute_values
+
+SAMPLING_RATE = 50
+
+
+@pytest.fixture
+def movement():
+    """Detection parameters (the `movement` section of config.yaml)."""
+    return dict(DEFAULT_CONFIG["movement"])
+
+
+@pytest.fixture(scope="session")
+def dataset():
+    """Half an hour of synthetic walking, rest, noise and gaps for one CodeID."""
+    return SyntheticDataset(hours=0.5, sampling_rate=SAMPLING_RATE, seed=1)
+
+
+@pytest.fixture(scope="session")
+def leg(dataset):
+    """Left leg of the dataset with its |a| and |g| magnitudes."""
+    df = dataset.leg(dataset.codeids[0], "Left")
+    df["|a|"] = np.sqrt(df["Ax"] ** 2 + df["Ay"] ** 2 + df["Az"] ** 2)
+    df["|g|"] = np.sqrt(df["Gx"] ** 2 + df["Gy"] ** 2 + df["Gz"] ** 2)
+    return df
+
+
+@pytest.fixture(scope="session")
+def data_manager(dataset):
+    """In-memory DataManager serving the dataset, with its CodeIDs registered."""
+    dm = InMemoryDataManager(dataset)
+    dm.store_codeids(dataset.codeids)
+    return dm
+
+
+@pytest.fixture
+def postgres(monkeypatch):
+    """Empty FakePostgres; DataManager's execute_values goes to its cursor."""
+    monkeypatch.setattr("msTools.data_manager.execute_values", execute_values)
+    return FakePostgres()
+
+
+@pytest.fixture
+def sql_data_manager(dataset, postgres):
+    """DataManager on a FakePostgres serving the dataset, with its CodeIDs registered."""
+    dm = SqlDataManager(dataset, postgres)
+    dm.store_codeids(dataset.codeids)
+    return dm
@@ -0,0 +1,392 @@
+"""In-memory stand-in for the PostgreSQL statements of the job queue and the
+incremental ingestion.
+
+``FakePostgres`` keeps the committed tables (lists of dicts, as in
+``InMemoryDataManager.tables``) and the clock used by ``now()``. Each
+``FakeConnection`` keeps the rows written by its open transaction apart
+until it commits, so two connections see each other's changes only after a
+commit, as with separate PostgreSQL sessions. The cursor recognises the
+statements issued by GaitJobQueue and DataManager and applies them to the
+tables; any other statement raises, so a query nobody emulates never passes
+silently.
+
+``SqlDataManager`` runs the production DataManager methods (``_insert_rows``,
+``upsert_activity_all``, watermarks) on top of it; InfluxDB is still served
+by the SyntheticDataset of InMemoryDataManager.
+"""
+import copy
+import re
+import threading
+from typing import Dict, List, Optional
+
+import pandas as pd
+from psycopg2 import sql
+
+from benchmarks.backends import InMemoryDataManager
+from msTools.data_manager import DataManager
+
+
+def _ts(value) -> Optional[pd.Timestamp]:
+    """TIMESTAMPTZ value (naive values are taken as UTC)."""
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def render(query) -> str:
+    """Text of a psycopg2.sql composition, without a connection."""
+    if isinstance(query, sql.Composed):
+        return "".join(render(part) for part in query.seq)
+    if isinstance(query, sql.Identifier):
+        return ".".join(f'"{s}"' for s in query.strings)
+    if isinstance(query, sql.SQL):
+        return query.string
+    return query
+
+
+def execute_values(cur, query, argslist, template=None, page_size=100, fetch=False):
+    """Replacement of psycopg2.extras.execute_values for FakeCursor."""
+    result = [] if fetch else None
+    argslist = list(argslist)
+    for i in range(0, len(argslist), page_size):
+        cur.execute_values(render(query), argslist[i:i + page_size])
+        if fetch:
+            result.extend(cur.fetchall())
+    return result
+
+
+class FakePostgres:
+    """Committed tables, id sequences and clock shared by all the connections."""
+
+    def __init__(self, tables: Optional[Dict[str, List[Dict]]] = None) -> None:
+        self.tables = {} if tables is None else tables
+        self.now = pd.Timestamp("2024-01-01", tz="UTC")
+        self.lock = threading.Lock()
+        self._sequences: Dict[str, int] = {}
+
+    def advance(self, seconds: float) -> None:
+        """Moves the clock of ``now()`` forward."""
+        self.now += pd.Timedelta(seconds=seconds)
+
+    def next_id(self, table_name: str) -> int:
+        """Next value of the SERIAL id of a table (not rolled back, as in PostgreSQL)."""
+        with self.lock:
+            last = max((r["id"] for r in self.tables.get(table_name, [])), default=0)
+            self._sequences[table_name] = max(self._sequences.get(table_name, 0), last) + 1
+            return self._sequences[table_name]
+
+    def connect(self) -> "FakeConnection":
+        return FakeConnection(self)
+
+
+def _key(table_name: str, row: Dict):
+    """Primary key of a row."""
+    if table_name == "gait_jobs":
+        return row["act_all_id"]
+    if table_name == "ingest_watermark":
+        return row["codeid_id"], row["foot"]
+    return row["id"]
+
+
+class FakeConnection:
+    """
+    Connection with its own transaction over a FakePostgres. As in READ
+    COMMITTED, every statement sees the rows committed so far plus the rows
+    written by its own transaction, which the rest see after commit().
+    ``now()`` is the time the transaction started, as in PostgreSQL.
+    """
+    closed = 0
+
+    def __init__(self, db: FakePostgres) -> None:
+        self.db = db
+        self.own: Dict[str, Dict] = {}
+        self.started: Optional[pd.Timestamp] = None
+
+    def view(self) -> Dict[str, List[Dict]]:
+        """Tables seen by the next statement (a copy)."""
+        with self.db.lock:
+            if self.started is None:
+                self.started = self.db.now
+            tables = copy.deepcopy(self.db.tables)
+        for table_name, rows in self.own.items():
+            table = tables.setdefault(table_name, [])
+            index = {_key(table_name, r): i for i, r in enumerate(table)}
+            for key, row in rows.items():
+                if key in index:
+                    table[index[key]] = copy.deepcopy(row)
+                else:
+                    table.append(copy.deepcopy(row))
+        return tables
+
+    def record(self, tables: Dict[str, List[Dict]]) -> None:
+        """Keeps the rows a statement inserted or changed in `tables` (from view())."""
+        with self.db.lock:
+            for table_name, table in tables.items():
+                committed = {_key(table_name, r): r for r in self.db.tables.get(table_name, [])}
+                for row in table:
+                    key = _key(table_name, row)
+                    if committed.get(key) != row:
+                        self.own.setdefault(table_name, {})[key] = copy.deepcopy(row)
+
+    def commit(self) -> None:
+        with self.db.lock:
+            for table_name, rows in self.own.items():
+                table = self.db.tables.setdefault(table_name, [])
+                index = {_key(table_name, r): i for i, r in enumerate(table)}
+                for key, row in rows.items():
+                    if key in index:
+                        table[index[key]] = row
+                    else:
+                        table.append(row)
+        self.own = {}
+        self.started = None
+
+    def rollback(self) -> None:
+        self.own = {}
+        self.started = None
+
+    def cursor(self) -> "FakeCursor":
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    """Cursor that applies the known statements to the transaction's tables."""
+
+    _INSERT = re.compile(r'^INSERT INTO "(\w+)" \((.*)\) VALUES %s RETURNING id$')
+
+    def __init__(self, conn: FakeConnection) -> None:
+        self.connection = conn
+        self.description = None
+        self._rows: List[tuple] = []
+
+    def __enter__(self) -> "FakeCursor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def fetchall(self) -> List[tuple]:
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self) -> Optional[tuple]:
+        return self._rows.pop(0) if self._rows else None
+
+    def _result(self, rows: Optional[List[tuple]]) -> None:
+        self.description = None if rows is None else [("column",)]
+        self._rows = list(rows or [])
+
+    @property
+    def now(self) -> pd.Timestamp:
+        return self.connection.started
+
+    def execute(self, query, params=()) -> None:
+        q = " ".join(render(query).split())
+        tables = self.connection.view()
+        for key, handler in self._STATEMENTS:
+            if key(q):
+                self._result(handler(self, tables, q, params))
+                self.connection.record(tables)
+                return
+        raise NotImplementedError(f"FakeCursor does not emulate: {q}")
+
+    def execute_values(self, query: str, rows: List[tuple]) -> None:
+        q = " ".join(query.split())
+        tables = self.connection.view()
+        insert = self._INSERT.match(q)
+        if insert:
+            columns = [c.strip().strip('"') for c in insert.group(2).split(",")]
+            self._result([(self._insert(tables, insert.group(1), dict(zip(columns, row))),)
+                          for row in rows])
+        elif q.startswith("WITH v (") and "UPDATE activity_all" in q:
+            columns = [c.strip().strip('"') for c in q[len("WITH v ("):q.index(")")].split(",")]
+            self._result(self._upsert_activity_all(tables, columns, rows))
+        else:
+            raise NotImplementedError(f"FakeCursor does not emulate: {q}")
+        self.connection.record(tables)
+
+    def _insert(self, tables: Dict, table_name: str, row: Dict) -> int:
+        row_id = self.connection.db.next_id(table_name)
+        tables.setdefault(table_name, []).append(dict(row, id=row_id))
+        return row_id
+
+    # -- activity_all, activity_leg and ingest_watermark --------------------
+    def _upsert_activity_all(self, tables, columns, rows):
+        # One statement: upd and ins both see the table as it was before it
+        table = tables.setdefault("activity_all", [])
+        values = [dict(zip(columns, row)) for row in rows]
+        updated, inserted = [], []
+        for r in list(table):
+            match = [v for v in values if list(v["codeleg_ids"]) == list(r["codeleg_ids"])]
+            if match:
+                # With several VALUES rows for a pair PostgreSQL applies just one
+                r.update(match[0])
+                updated.append((r["id"], list(r["codeleg_ids"])))
+        done = {tuple(pair) for _, pair in updated}
+        for v in values:
+            if tuple(v["codeleg_ids"]) not in done:
+                inserted.append((self._insert(tables, "activity_all", v), list(v["codeleg_ids"])))
+        return updated + inserted
+
+    def _get_watermarks(self, tables, q, params):
+        legs = {r["id"]: r for r in tables.get("activity_leg", [])}
+        rows = []
+        for w in tables.get("ingest_watermark", []):
+            if w["codeid_id"] == params[0]:
+                leg = legs.get(w["codeleg_id"], {})
+                rows.append((w["foot"], w["last_time"], w["codeleg_id"],
+                              *(leg.get(c) for c in ("start_time", "end_time", "device_name",
+                                                     "mac", "total_value"))))
+        return rows
+
+    def _min_watermark(self, tables, q, params):
+        times = [w["last_time"] for w in tables.get("ingest_watermark", [])]
+        if params:
+            times = [t for t in times if t >= _ts(params[0])]
+        return [(min(times, default=None),)]
+
+    def _set_watermark(self, tables, q, params):
+        codeid_id, foot, last_time, codeleg_id = params
+        marks = tables.setdefault("ingest_watermark", [])
+        mark = next((w for w in marks if (w["codeid_id"], w["foot"]) == (codeid_id, foot)), None)
+        if mark is None:
+            marks.append({"codeid_id": codeid_id, "foot": foot, "last_time": _ts(last_time),
+                          "codeleg_id": codeleg_id})
+        else:
+            mark["last_time"] = _ts(last_time)
+            if codeleg_id is not None:
+                mark["codeleg_id"] = codeleg_id
+
+    def _extend_activity_leg(self, tables, q, params):
+        end_time, duration, total_value, codeleg_id = params
+        for leg in tables.get("activity_leg", []):
+            if leg["id"] == codeleg_id:
+                leg.update(end_time=_ts(end_time), duration=duration, total_value=total_value)
+
+    # -- gait_jobs ----------------------------------------------------------
+    def _enqueue(self, tables, q, params):
+        candidates = tables.get("activity_all", [])
+        if "id = ANY" in q:
+            candidates = [r for r in candidates if r["id"] in set(params[0])]
+        else:
+            fend, fstart = map(_ts, params)
+            candidates = [r for r in candidates
+                          if _ts(r["start_time"]) <= fend and _ts(r["end_time"]) >= fstart]
+        jobs = {j["act_all_id"]: j for j in tables.setdefault("gait_jobs", [])}
+        returned = []
+        for r in candidates:
+            job = jobs.get(r["id"])
+            if job is None:
+                job = {"act_all_id": r["id"], "attempts": 0}
+                tables["gait_jobs"].append(job)
+                jobs[r["id"]] = job
+            elif "DO UPDATE" not in q or job["status"] == "running":
+                continue
+            job.update(status="pending", attempts=0, worker=None, lease_until=None,
+                       last_error=None, updated_at=self.now)
+            returned.append((r["id"],))
+        return returned
+
+    def _jobs(self, tables, ids=None, worker=None, status=None):
+        return [j for j in tables.get("gait_jobs", [])
+                if (ids is None or j["act_all_id"] in ids)
+                and (worker is None or j["worker"] == worker)
+                and (status is None or j["status"] == status)]
+
+    def _claim(self, tables, q, params):
+        worker, secs, max_attempts, limit = params
+        free = sorted((j for j in tables.get("gait_jobs", [])
+                       if (j["status"] == "pending"
+                           or (j["status"] == "running" and j["lease_until"] < self.now))
+                       and j["attempts"] < max_attempts), key=lambda j: j["act_all_id"])
+        for j in free[:limit]:
+            j.update(status="running", worker=worker, attempts=j["attempts"] + 1,
+                     lease_until=self.now + pd.Timedelta(seconds=secs), updated_at=self.now)
+        return [(j["act_all_id"],) for j in free[:limit]]
+
+    def _renew(self, tables, q, params):
+        secs, ids, worker = params
+        jobs = self._jobs(tables, set(ids), worker, "running")
+        for j in jobs:
+            j.update(lease_until=self.now + pd.Timedelta(seconds=secs), updated_at=self.now)
+        return [(j["act_all_id"],) for j in jobs]
+
+    def _complete(self, tables, q, params):
+        ids, worker = params
+        jobs = self._jobs(tables, set(ids), worker, "running")
+        for j in jobs:
+            j.update(status="done", lease_until=None, last_error=None, updated_at=self.now)
+        return [(j["act_all_id"],) for j in jobs]
+
+    def _fail(self, tables, q, params):
+        max_attempts, error, ids, worker = params
+        jobs = self._jobs(tables, set(ids), worker, "running")
+        for j in jobs:
+            j.update(status="failed" if j["attempts"] >= max_attempts else "pending",
+                     worker=None, lease_until=None, last_error=error, updated_at=self.now)
+        return [(j["act_all_id"],) for j in jobs]
+
+    def _reap(self, tables, q, params):
+        jobs = [j for j in self._jobs(tables, status="running")
+                if j["lease_until"] < self.now and j["attempts"] >= params[0]]
+        for j in jobs:
+            j.update(status="failed", lease_until=None,
+                     last_error=j["last_error"] or "lease expired", updated_at=self.now)
+        return [(j["act_all_id"],) for j in jobs]
+
+    def _retry_failed(self, tables, q, params):
+        ids = None if params[0] is None else set(params[0])
+        jobs = self._jobs(tables, ids, status="failed")
+        for j in jobs:
+            j.update(status="pending", attempts=0, worker=None, last_error=None,
+                     updated_at=self.now)
+        return [(j["act_all_id"],) for j in jobs]
+
+    def _stats(self, tables, q, params):
+        counts: Dict[str, int] = {}
+        for j in tables.get("gait_jobs", []):
+            counts[j["status"]] = counts.get(j["status"], 0) + 1
+        return list(counts.items())
+
+    _STATEMENTS = [
+        (lambda q: q.startswith("INSERT INTO gait_jobs"), _enqueue),
+        (lambda q: "SET status = 'running'" in q, _claim),
+        (lambda q: q.startswith("UPDATE gait_jobs SET lease_until"), _renew),
+        (lambda q: "SET status = 'done'" in q, _complete),
+        (lambda q: "SET status = CASE" in q, _fail),
+        (lambda q: "SET status = 'failed'" in q, _reap),
+        (lambda q: "WHERE status = 'failed'" in q, _retry_failed),
+        (lambda q: q.startswith("SELECT status, count(*) FROM gait_jobs"), _stats),
+        (lambda q: "FROM ingest_watermark w LEFT JOIN activity_leg" in q, _get_watermarks),
+        (lambda q: q.startswith("SELECT min(last_time) FROM ingest_watermark"), _min_watermark),
+        (lambda q: q.startswith("INSERT INTO ingest_watermark"), _set_watermark),
+        (lambda q: q.startswith("UPDATE activity_leg SET end_time"), _extend_activity_leg),
+    ]
+
+
+class SqlDataManager(InMemoryDataManager):
+    """InMemoryDataManager whose PostgreSQL is a FakePostgres (one connection per thread)."""
+
+    # The production INSERT, not the list append of InMemoryDataManager
+    _insert_rows = DataManager._insert_rows
+
+    def __init__(self, dataset, db: FakePostgres) -> None:
+        super().__init__(dataset)
+        self.db = db
+        # Committed tables: what InMemoryDataManager reads (iter_segments, codeids)
+        self.tables = db.tables
+        self._connections = threading.local()
+
+    @property
+    def pg_conn(self) -> FakeConnection:
+        conn = getattr(self._connections, "conn", None)
+        if conn is None:
+            conn = self._connections.conn = self.db.connect()
+        return conn
+
+    def release_pg(self) -> None:
+        conn = getattr(self._connections, "conn", None)
+        if conn is not None:
+            conn.rollback()
+            self._connections.conn = None
@@ -0,0 +1,33 @@
+import json
+
+from benchmarks.run import main, run_size
+
+STAGES = {
+    "identify_activity_segments",
+    "store_data[activity_leg]",
+    "inter_segs",
+    "merge_activity_legs_to_all",
+    "store_data[activity_all,validate=True]",
+    "store_data[activity_all,validate=False]",
+    "detect_effective_movement",
+    "detect_effective_gait",
+}
+
+
+def test_run_size_smoke():
+    results = run_size(hours=0.1, n_codeids=2, repeat=1)
+
+    by_stage = {r["stage"]: r for r in results}
+    assert set(by_stage) == STAGES
+    assert by_stage["merge_activity_legs_to_all"]["rows"] > 0
+    # activity_all segments are selected and analysed
+    assert by_stage["detect_effective_gait"]["rows"] > 0
+
+
+def test_main_writes_report(tmp_path):
+    out = tmp_path / "results.json"
+    main(["--hours", "0.05", "--codeids", "1", "--repeat", "1", "-o", str(out)])
+
+    report = json.loads(out.read_text(encoding="utf-8"))
+    assert report["meta"]["repeat"] == 1
+    assert {r["stage"] for r in report["results"]} == STAGES
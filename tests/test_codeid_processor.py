@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fake_pg import FakePostgres, SqlDataManager
+from msCodeID.codeid_processor import CodeIDProcessor
+from ms_monitoring.find_mscodeids import incremental_scan_start
+
+
+def _legs(rng, n, foot, codeid_id, mac):
+    start = pd.Timestamp("2024-01-01 08:00", tz="UTC") \
+        + pd.to_timedelta(np.sort(rng.integers(0, 600, n)), unit="min")
+    return pd.DataFrame({
+        "time_from": start,
+        "time_until": start + pd.to_timedelta(rng.integers(1, 60, n), unit="min"),
+        "CodeID": "ABC123",
+        "codeid_id": codeid_id,
+        "device_name": f"ABC123-{foot[0]}",
+        "foot": foot,
+        "mac": mac,
+        "codeleg_id": rng.integers(1, 10_000, n),
+    }, index=rng.permutation(np.arange(100, 100 + n)))
+
+
+def _merge_reference(act_segR, act_segL, inter):
+    """Row-by-row version of merge_activity_legs_to_all (two merges and lambdas)."""
+    def format_mac(address):
+        hex_part = address.split("-")[-1]
+        return ":".join(hex_part[i:i + 2] for i in range(0, len(hex_part), 2))
+
+    cols = ["CodeID", "device_name", "foot", "mac", "codeleg_id"]
+    res = inter.merge(act_segR[cols], left_on="R1_id", right_index=True, suffixes=("", "_R"))
+    res = res.merge(act_segL[cols], left_on="R2_id", right_index=True, suffixes=("_R", "_L"))
+    for side in ("R", "L"):
+        if not res[f"mac_{side}"].str.contains(":", na=False).any():
+            res[f"mac_{side}"] = res[f"mac_{side}"].apply(format_mac)
+    return pd.DataFrame({
+        "start_time": res["time_from"],
+        "end_time": res["time_until"],
+        "codeid_id_1": res["codeid_id_1"],
+        "codeid_id_2": res["codeid_id_2"],
+        "is_effective": False,
+        "duration": (res["time_until"] - res["time_from"]).dt.total_seconds(),
+        "macs": res.apply(lambda r: [r["mac_L"], r["mac_R"]], axis=1),
+        "codeid_ids": res.apply(lambda r: [r["codeid_id_2"], r["codeid_id_1"]], axis=1),
+        "codeleg_ids": res.apply(lambda r: [r["codeleg_id_L"], r["codeleg_id_R"]], axis=1),
+        "device_names": res.apply(lambda r: [r["device_name_L"], r["device_name_R"]], axis=1),
+        "active_legs": res.apply(lambda r: [r["foot_L"], r["foot_R"]], axis=1),
+    }, index=res.index)
+
+
+@pytest.mark.parametrize("mac_R", ["Sensoria-A1B2C3D4E5F6", "A1:B2:C3:D4:E5:F6"])
+def test_merge_matches_reference(mac_R):
+    rng = np.random.default_rng(3)
+    right = _legs(rng, 40, "Right", 7, mac_R)
+    left = _legs(rng, 35, "Left", 8, "Sensoria-0A0B0C0D0E0F")
+    inter = CodeIDProcessor.inter_segs(None, right, left)
+    # Segments no longer present in a leg are dropped, as in an inner join
+    inter.loc[inter.index[::5], "R2_id"] = -1
+    assert len(inter) > 10
+
+    got = CodeIDProcessor.merge_activity_legs_to_all(None, right, left, inter)
+
+    expected = _merge_reference(right, left, inter)
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+    assert got["macs"].iloc[0][1] == "A1:B2:C3:D4:E5:F6"
+    assert got["codeleg_ids"].map(lambda p: [type(v) for v in p]).equals(
+        expected["codeleg_ids"].map(lambda p: [type(v) for v in p]))
+
+
+def _ingest(dm, dataset, *ends):
+    """Runs ingest_incremental of the first CodeID up to each end in turn."""
+    codeid = dataset.codeids[0]
+    codeid_id = dm.store_codeids([codeid])[codeid][0]
+    processor = CodeIDProcessor(dm)
+    return [processor.ingest_incremental(codeid, codeid_id, dataset.start, end) for end in ends]
+
+
+def _table(postgres, table_name):
+    return pd.DataFrame(postgres.tables[table_name]).drop(columns="id")
+
+
+def test_incremental_run_extends_the_previous_segment(dataset, postgres, sql_data_manager):
+    once = FakePostgres()
+    _ingest(SqlDataManager(dataset, once), dataset, dataset.end)
+
+    mid = dataset.start + pd.Timedelta(minutes=13)
+    first, second = _ingest(sql_data_manager, dataset, mid, dataset.end)
+
+    assert first == {"new_legs": 2, "extended": 0, "activity_all": 1}
+    assert second == {"new_legs": 0, "extended": 2, "activity_all": 1}
+    # Same activity_leg and activity_all rows as a single run over the whole range
+    pd.testing.assert_frame_equal(_table(postgres, "activity_leg"), _table(once, "activity_leg"))
+    pd.testing.assert_frame_equal(_table(postgres, "activity_all"), _table(once, "activity_all"))
+
+
+def test_watermark_advances_to_the_last_ingested_time(dataset, postgres, sql_data_manager):
+    processor = CodeIDProcessor(sql_data_manager)
+    mid = dataset.start + pd.Timedelta(minutes=13)
+    _ingest(sql_data_manager, dataset, mid)
+    # The last ingested _time, not the end of the range
+    last = processor.fetch_codeid_data(dataset.codeids[0], dataset.start, mid)["_time"].max()
+    marks = sql_data_manager.get_watermarks(1)
+    assert {foot: m["last_time"] for foot, m in marks.items()} == {"Left": last, "Right": last}
+    assert marks["Left"]["end_time"] == last
+
+    end = dataset.end + pd.Timedelta(hours=1)
+    _ingest(sql_data_manager, dataset, end)
+    last = processor.fetch_codeid_data(dataset.codeids[0], mid, end)["_time"].max()
+    assert last < end
+    assert sql_data_manager.min_watermark() == last
+
+    # Nothing new: the same rows (activity_all is upserted again) and marks
+    legs, pairs = _table(postgres, "activity_leg"), _table(postgres, "activity_all")
+    [summary] = _ingest(sql_data_manager, dataset, dataset.end)
+    assert (summary["new_legs"], summary["extended"]) == (0, 0)
+    pd.testing.assert_frame_equal(_table(postgres, "activity_leg"), legs)
+    pd.testing.assert_frame_equal(_table(postgres, "activity_all"), pairs)
+    assert sql_data_manager.min_watermark() == last
+
+
+def test_failed_incremental_run_rolls_back(dataset, postgres, sql_data_manager, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(sql_data_manager, "upsert_activity_all", broken)
+    with pytest.raises(RuntimeError):
+        _ingest(sql_data_manager, dataset, dataset.end)
+    assert "activity_leg" not in postgres.tables
+    assert sql_data_manager.get_watermarks(1) == {}
+
+
+def test_upsert_activity_all_updates_each_pair_once(postgres, sql_data_manager):
+    start = pd.Timestamp("2024-01-01 08:00", tz="UTC")
+
+    def rows(pairs, minutes):
+        return pd.DataFrame({
+            "start_time": start, "end_time": start + pd.Timedelta(minutes=minutes),
+            "codeid_id_1": 1, "codeid_id_2": 1, "is_effective": False,
+            "duration": minutes * 60.0, "macs": [["L", "R"]] * len(pairs),
+            "codeid_ids": [[1, 1]] * len(pairs), "codeleg_ids": pairs,
+            "device_names": [["L", "R"]] * len(pairs),
+            "active_legs": [["Left", "Right"]] * len(pairs)})
+
+    ids = sql_data_manager.upsert_activity_all(rows([[1, 2], [3, 4], [1, 2]], 5), batch_size=2)
+    assert ids[0] == ids[2] != ids[1]
+    # Repeated pair in one batch: one row, with the values of the last
+    again = sql_data_manager.upsert_activity_all(pd.concat([
+        rows([[3, 4]], 5), rows([[5, 6]], 1), rows([[3, 4]], 9), rows([[5, 6]], 2)]))
+    assert again[0] == again[2] == ids[1]
+    assert again[1] == again[3] not in ids
+    sql_data_manager.pg_conn.commit()
+
+    table = _table(postgres, "activity_all")
+    assert table["codeleg_ids"].tolist() == [[1, 2], [3, 4], [5, 6]]
+    assert table["duration"].tolist() == [5 * 60.0, 9 * 60.0, 2 * 60.0]
+
+
+def test_incremental_scan_start_ignores_stale_watermarks(dataset, sql_data_manager):
+    start, end = dataset.start, dataset.end
+    assert incremental_scan_start(sql_data_manager, start, end, "7D") == start
+
+    sql_data_manager.set_watermark(1, "Left", start - pd.Timedelta(days=1), None)
+    sql_data_manager.set_watermark(1, "Right", start - pd.Timedelta(days=30), None)
+    sql_data_manager.pg_conn.commit()
+    assert incremental_scan_start(sql_data_manager, start, end, "7D") == start - pd.Timedelta(days=1)
+    assert incremental_scan_start(sql_data_manager, start, end, "1h") == start
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+from influxdb_client.client.flux_csv_parser import FluxQueryException
+
+from msTools import flux_csv
+from msTools.flux_csv import parse_flux_csv
+
+VALUES = ["_time", "CodeID", "Foot", "_measurement", "Ax", "Ay", "Az", "Gx", "Gy", "Gz"]
+
+
+@pytest.fixture(params=["pyarrow", "pandas"])
+def engine(request, monkeypatch):
+    if request.param == "pandas":
+        monkeypatch.setattr(flux_csv, "pa", None)
+    elif flux_csv.pa is None:
+        pytest.skip("pyarrow not installed")
+    return request.param
+
+
+def _records(data: bytes) -> pd.DataFrame:
+    df = flux_csv._records_frame(data)
+    df["_time"] = pd.to_datetime(df["_time"], utc=True).dt.as_unit("ns")
+    return df
+
+
+def test_matches_flux_records(engine):
+    data = flux_csv._synthetic_csv(1000, tables=3)
+    expected = _records(data)
+    cols = parse_flux_csv(data)
+
+    assert len(cols["_time"]) == len(expected)
+    assert cols["_time"].dtype == np.int64
+    got = pd.DataFrame(cols)
+    got["_time"] = pd.to_datetime(got["_time"], utc=True)
+    for c in ("_start", "_stop"):
+        assert (pd.to_datetime(cols[c], utc=True) == pd.to_datetime(expected[c], utc=True)).all()
+    pd.testing.assert_frame_equal(got[VALUES], expected[VALUES], check_dtype=False)
+
+
+def test_columns_and_dtypes(engine):
+    data = flux_csv._synthetic_csv(10, tables=2)
+    cols = parse_flux_csv(data, columns=["_time", "Foot", "Ax", "missing"],
+                          dtypes={"Ax": "float32"})
+
+    assert list(cols) == ["_time", "Foot", "Ax"]
+    assert cols["Ax"].dtype == np.float32
+    assert list(cols["Foot"]) == ["Left"] * 10
+
+
+def test_empty_response():
+    assert parse_flux_csv(b"") == {}
+    assert parse_flux_csv(b"\r\n\r\n") == {}
+
+
+def test_error_table():
+    data = (b"#datatype,string,string\r\n#group,true,true\r\n#default,,\r\n"
+            b",error,reference\r\n,failed to execute query,897\r\n\r\n")
+    with pytest.raises(FluxQueryException):
+        parse_flux_csv(data)
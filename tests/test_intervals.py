@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from msTools.intervals import overlap_pairs, to_ns
+
+
+def _nested_loop(a_start, a_end, b_start, b_end, closed):
+    pairs = []
+    for i in range(len(a_start)):
+        for j in range(len(b_start)):
+            lo, hi = max(a_start[i], b_start[j]), min(a_end[i], b_end[j])
+            if (lo <= hi) if closed else (lo < hi):
+                pairs.append((i, j))
+    return pairs
+
+
+def _intervals(rng, n):
+    start = rng.integers(0, 100, n)
+    # Lengths include 0 (points) and negatives (empty intervals)
+    return start, start + rng.integers(-3, 20, n)
+
+
+@pytest.mark.parametrize("closed", [True, False])
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_nested_loop(seed, closed):
+    rng = np.random.default_rng(seed)
+    a_start, a_end = _intervals(rng, 40)
+    b_start, b_end = _intervals(rng, 30)
+
+    ia, ib = overlap_pairs(a_start, a_end, b_start, b_end, closed=closed)
+
+    assert list(zip(ia.tolist(), ib.tolist())) == _nested_loop(a_start, a_end, b_start, b_end, closed)
+
+
+def test_touching_endpoints():
+    ia, ib = overlap_pairs([0, 10], [10, 20], [10], [15], closed=True)
+    assert list(zip(ia.tolist(), ib.tolist())) == [(0, 0), (1, 0)]
+    ia, ib = overlap_pairs([0, 10], [10, 20], [10], [15], closed=False)
+    assert list(zip(ia.tolist(), ib.tolist())) == [(1, 0)]
+
+
+def test_empty_inputs():
+    ia, ib = overlap_pairs([], [], [1], [2])
+    assert len(ia) == len(ib) == 0
+    ia, ib = overlap_pairs([1], [2], [], [])
+    assert len(ia) == len(ib) == 0
+
+
+def test_dates():
+    a = pd.to_datetime(["2024-01-01 10:00", "2024-01-01 12:00"])
+    b = pd.to_datetime(["2024-01-01 10:30", "2024-01-01 13:00"], utc=True)
+    ia, ib = overlap_pairs(to_ns(a), to_ns(a + pd.Timedelta("1h")),
+                           to_ns(b), to_ns(b + pd.Timedelta("30min")))
+    assert list(zip(ia.tolist(), ib.tolist())) == [(0, 0), (1, 1)]
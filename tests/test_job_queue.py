@@ -0,0 +1,214 @@
+import pandas as pd
+import pytest
+
+from fake_pg import SqlDataManager
+from msGait.gait_worker import GaitWorker
+from msTools.job_queue import GaitJobQueue, LeaseLostError
+
+LEASE = 60
+
+
+def _segments(dm, dataset, n=3, minutes=10):
+    """Stores `n` consecutive activity_all rows (both legs) and returns their ids."""
+    codeid_id = dm.store_codeids(dataset.codeids)[dataset.codeids[0]][0]
+    start = dataset.start
+    rows = pd.DataFrame([
+        {"codeid_ids": [codeid_id, codeid_id], "codeleg_ids": [2 * k + 1, 2 * k + 2],
+         "start_time": start + pd.Timedelta(minutes=k * minutes),
+         "end_time": start + pd.Timedelta(minutes=(k + 1) * minutes),
+         "duration": minutes * 60.0, "macs": ["R", "L"], "active_legs": ["Right", "Left"],
+         "device_names": ["R", "L"], "is_effective": False}
+        for k in range(n)])
+    return dm.store_data("activity_all", rows, verbose=0)
+
+
+def _job(postgres, act_all_id):
+    return next(j for j in postgres.tables["gait_jobs"] if j["act_all_id"] == act_all_id)
+
+
+@pytest.fixture
+def queue(sql_data_manager):
+    return GaitJobQueue(sql_data_manager, lease_seconds=LEASE, max_attempts=2)
+
+
+@pytest.fixture
+def ids(dataset, sql_data_manager):
+    return _segments(sql_data_manager, dataset)
+
+
+def test_enqueue_ignores_unknown_and_registered_ids(queue, ids):
+    assert queue.enqueue(ids + [999]) == 3
+    assert queue.enqueue(ids[:1]) == 0
+    assert queue.stats() == {"pending": 3, "running": 0, "done": 0, "failed": 0}
+
+
+def test_enqueue_range_uses_the_overlap_of_the_segments(dataset, queue, ids):
+    fstart = dataset.start + pd.Timedelta(minutes=12)
+    assert queue.enqueue_range(fstart, fstart + pd.Timedelta(minutes=5)) == 1
+    assert queue.claim("a", 5) == [ids[1]]
+
+
+def test_claim_hands_each_job_to_one_worker(postgres, queue, ids):
+    queue.enqueue(ids)
+    assert queue.claim("a", 2) == ids[:2]
+    assert queue.claim("b", 2) == ids[2:]
+    assert queue.claim("c", 2) == []
+
+    queue.complete("a", ids[:2])
+    assert queue.stats() == {"pending": 0, "running": 1, "done": 2, "failed": 0}
+    assert _job(postgres, ids[2])["worker"] == "b"
+
+
+def test_failed_jobs_are_retried_up_to_max_attempts(postgres, queue, ids):
+    queue.enqueue(ids[:1])
+    assert queue.claim("a") == ids[:1]
+    queue.fail("a", ids[:1], "boom")
+    assert _job(postgres, ids[0])["status"] == "pending"
+
+    assert queue.claim("b") == ids[:1]
+    queue.fail("b", ids[:1], "boom again")
+    job = _job(postgres, ids[0])
+    assert (job["status"], job["attempts"], job["last_error"]) == ("failed", 2, "boom again")
+    assert queue.claim("c") == []
+
+    assert queue.retry_failed() == 1
+    assert queue.claim("c") == ids[:1]
+
+
+def test_expired_lease_goes_to_another_worker(postgres, queue, ids):
+    queue.enqueue(ids[:1])
+    assert queue.claim("a") == ids[:1]
+    assert queue.claim("b") == []
+
+    postgres.advance(LEASE / 2)
+    assert queue.renew("a", ids[:1]) == 1
+    postgres.advance(LEASE / 2 + 1)
+    assert queue.claim("b") == []
+
+    postgres.advance(LEASE)
+    assert queue.claim("b") == ids[:1]
+    assert queue.renew("a", ids[:1]) == 0
+    with pytest.raises(LeaseLostError):
+        queue.complete("a", ids[:1])
+    job = _job(postgres, ids[0])
+    assert (job["status"], job["worker"], job["attempts"]) == ("running", "b", 2)
+
+
+def test_reap_fails_expired_jobs_without_attempts_left(postgres, queue, ids):
+    queue.enqueue(ids[:1])
+    queue.claim("a")
+    postgres.advance(LEASE + 1)
+    queue.claim("b")
+    postgres.advance(LEASE + 1)
+
+    assert queue.claim("c") == []
+    job = _job(postgres, ids[0])
+    assert (job["status"], job["last_error"]) == ("failed", "lease expired")
+
+
+def test_requeue_restarts_finished_jobs_but_not_running_ones(postgres, queue, ids):
+    queue.enqueue(ids[:2])
+    queue.claim("a", 2)
+    queue.complete("a", ids[:1])
+    assert queue.enqueue(ids[:2], requeue=True) == 1
+    assert _job(postgres, ids[0])["status"] == "pending"
+    assert _job(postgres, ids[1])["worker"] == "a"
+
+
+def test_results_and_done_mark_are_committed_together(dataset, postgres, sql_data_manager,
+                                                      queue, ids):
+    other = GaitJobQueue(SqlDataManager(dataset, postgres), LEASE)
+    result = pd.DataFrame({"codeid_id": [1], "start_time": [dataset.start],
+                           "end_time": [dataset.start + pd.Timedelta(seconds=30)],
+                           "duration": [30.0]})
+    queue.enqueue(ids[:2])
+
+    # Lease lost: the stored rows are rolled back with the job update
+    queue.claim("a")
+    sql_data_manager.store_data("effective_gait", result, verbose=0, commit=False)
+    postgres.advance(LEASE + 1)
+    assert other.claim("b") == ids[:1]
+    with pytest.raises(LeaseLostError):
+        queue.complete("a", ids[:1])
+    assert "effective_gait" not in postgres.tables
+
+    # Not committed until complete() is
+    assert queue.claim("a") == ids[1:2]
+    sql_data_manager.store_data("effective_gait", result, verbose=0, commit=False)
+    assert "effective_gait" not in postgres.tables
+    queue.complete("a", ids[1:2])
+    assert len(postgres.tables["effective_gait"]) == 1
+    assert _job(postgres, ids[1])["status"] == "done"
+
+
+def _worker(dataset, dm, name, **kwargs):
+    return GaitWorker(None, dataset.sampling_rate, lease_seconds=LEASE, worker_id=name,
+                      data_manager=dm, **kwargs)
+
+
+def test_worker_retry_after_a_crash_stores_the_results_once(dataset, postgres,
+                                                            sql_data_manager, ids):
+    sql_data_manager.store_data("activity_all", pd.DataFrame(), verbose=0)
+    dead = _worker(dataset, SqlDataManager(dataset, postgres), "dead")
+    dead.queue.enqueue(ids[:1])
+
+    # Killed after storing its results, before the done mark
+    def killed(worker, job_ids, commit=True):
+        raise KeyboardInterrupt
+
+    dead.queue.complete = killed
+    with pytest.raises(KeyboardInterrupt):
+        dead.process(dead.queue.claim("dead"))
+    dead.data_manager.release_pg()
+    assert "effective_movement" not in postgres.tables
+
+    postgres.advance(LEASE + 1)
+    worker = _worker(dataset, sql_data_manager, "live")
+    try:
+        assert worker.run() == 1
+    finally:
+        worker.close()
+    job = _job(postgres, ids[0])
+    assert (job["status"], job["attempts"]) == ("done", 2)
+    stored = pd.DataFrame(postgres.tables["effective_movement"])
+    assert len(stored) > 0
+    assert not stored.duplicated(["leg", "start_time", "end_time"]).any()
+
+
+def test_worker_fails_a_batch_until_max_attempts(dataset, postgres, sql_data_manager,
+                                                 ids, monkeypatch):
+    worker = _worker(dataset, sql_data_manager, "w", max_attempts=3)
+    worker.queue.enqueue(ids[:1])
+
+    def broken(*args, **kwargs):
+        raise ConnectionError("InfluxDB down")
+
+    monkeypatch.setattr(worker.detector, "detect_effective_movement", broken)
+    try:
+        assert worker.run() == 0
+    finally:
+        worker.close()
+    job = _job(postgres, ids[0])
+    assert (job["status"], job["attempts"]) == ("failed", 3)
+    assert "InfluxDB down" in job["last_error"]
+
+
+def test_worker_commits_nothing_when_its_lease_is_lost(dataset, postgres, sql_data_manager,
+                                                       ids, monkeypatch):
+    worker = _worker(dataset, sql_data_manager, "slow")
+    other = GaitJobQueue(SqlDataManager(dataset, postgres), LEASE)
+    worker.queue.enqueue(ids[:1])
+    detect_gait = worker.detector.detect_effective_gait
+
+    def slow(df_effective, vb=0):
+        postgres.advance(LEASE + 1)
+        assert other.claim("fast") == ids[:1]
+        return detect_gait(df_effective, vb)
+
+    monkeypatch.setattr(worker.detector, "detect_effective_gait", slow)
+    try:
+        assert worker.run() == 0
+    finally:
+        worker.close()
+    assert "effective_movement" not in postgres.tables
+    assert _job(postgres, ids[0])["worker"] == "fast"
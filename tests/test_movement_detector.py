@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from msGait.movement_detector import MovementDetector  # noqa: E402
+from msTools.metrics import METRICS  # noqa: E402
+
+
+@pytest.fixture
+def detector(dataset, data_manager):
+    md = MovementDetector(None, dataset.sampling_rate, verbose=0, load_segments=False,
+                          data_manager=data_manager)
+    yield md
+    md.close()
+
+
+def _windows(dataset, data_manager, minutes=10):
+    codeid_id = data_manager.store_codeids(dataset.codeids)[dataset.codeids[0]][0]
+    start = dataset.start.tz_localize(None)
+    return pd.DataFrame([
+        {"start_time": start + pd.Timedelta(minutes=k * minutes),
+         "end_time": start + pd.Timedelta(minutes=(k + 1) * minutes),
+         "codeid_id": codeid_id, "foot": foot}
+        for k in range(2) for foot in ("Left", "Right")])
+
+
+def test_export_is_closed_when_a_leg_fails(dataset, data_manager, detector, tmp_path, monkeypatch):
+    windows = _windows(dataset, data_manager)
+    detect_leg = detector._detect_leg
+    calls = []
+
+    def failing(row, export=False, vb=0):
+        calls.append(row)
+        if len(calls) == 3:
+            raise ConnectionError("InfluxDB down")
+        return detect_leg(row, export, vb)
+
+    monkeypatch.setattr(detector, "_detect_leg", failing)
+    out = tmp_path / "raw.parquet"
+
+    with pytest.raises(ConnectionError):
+        detector.detect_effective_movement(windows, nomf=str(out))
+
+    # The writer was closed: the file has its footer and holds the first two legs
+    raw = pd.read_parquet(out)
+    assert len(raw) > 0
+    assert set(raw["foot"]) == {"Left", "Right"}
+
+
+
+@pytest.mark.parametrize("every", ["2s", "30s"])
+def test_prescreen_keeps_every_window_of_the_full_scan(dataset, data_manager, detector,
+                                                       every, monkeypatch):
+    windows = _windows(dataset, data_manager, minutes=15)
+    expected = detector.detect_effective_movement(windows)
+    assert len(expected) > 0
+
+    prescreened = MovementDetector(None, dataset.sampling_rate, verbose=0, load_segments=False,
+                                   data_manager=data_manager)
+    prescreened.prescreen_every = every
+    scan = prescreened._scan_leg_prescreened
+
+    def no_fallback(*args, **kwargs):
+        # None would mean the leg was read in full after all
+        segments = scan(*args, **kwargs)
+        assert segments is not None
+        return segments
+
+    monkeypatch.setattr(prescreened, "_scan_leg_prescreened", no_fallback)
+    skipped = METRICS.snapshot()["counters"].get("prescreen.samples_skipped", 0)
+    try:
+        got = prescreened.detect_effective_movement(windows)
+    finally:
+        prescreened.close()
+
+    pd.testing.assert_frame_equal(got, expected)
+    assert METRICS.snapshot()["counters"]["prescreen.samples_skipped"] > skipped
@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from msTools.sensor_cache import SensorCache  # noqa: E402
+
+T0 = pd.Timestamp("2024-01-01 08:00", tz="UTC")
+
+
+class Source:
+    """Fake InfluxDB: one sample per second, records every (start, stop) asked."""
+
+    def __init__(self, start, stop):
+        times = pd.date_range(start, stop, freq="1s", inclusive="left")
+        self.data = pd.DataFrame({"_time": times, "Ax": np.arange(len(times), dtype=float)})
+        self.calls = []
+
+    def __call__(self, start, stop):
+        self.calls.append((start, stop))
+        return self.expected(start, stop)
+
+    def expected(self, start, stop):
+        times = self.data["_time"]
+        return self.data[(times >= start) & (times < stop)].reset_index(drop=True)
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def cache(home):
+    return SensorCache.from_config({"dir": "~/.cache/ms_monitoring"})
+
+
+def _at(minutes):
+    return T0 + pd.Timedelta(minutes=minutes)
+
+
+def _files(cache):
+    return sorted(f for f in os.listdir(cache.directory) if f.endswith(".parquet"))
+
+
+def test_expands_home(home, cache):
+    assert cache.directory == str(home / ".cache" / "ms_monitoring")
+    assert os.path.isdir(cache.directory)
+    assert cache.size() == 0
+
+
+def test_round_trip(cache):
+    source = Source(_at(0), _at(120))
+    first = cache.get("ABC", "Left", _at(0), _at(30), source)
+    again = cache.get("ABC", "Left", _at(0), _at(30), source)
+
+    pd.testing.assert_frame_equal(first, source.expected(_at(0), _at(30)))
+    pd.testing.assert_frame_equal(again, first)
+    assert source.calls == [(_at(0), _at(30))]
+    assert cache.size() > 0
+    # Other foot: its own piece
+    cache.get("ABC", "Right", _at(0), _at(30), source)
+    assert len(source.calls) == 2
+
+
+def test_sub_range_hit_does_not_write(cache):
+    source = Source(_at(0), _at(120))
+    cache.get("ABC", "Left", _at(0), _at(60), source)
+    files = _files(cache)
+
+    got = cache.get("ABC", "Left", _at(10), _at(20), source)
+
+    pd.testing.assert_frame_equal(got, source.expected(_at(10), _at(20)))
+    assert len(source.calls) == 1
+    assert _files(cache) == files
+
+
+def test_gap_fetch_merges_on_write(cache):
+    source = Source(_at(0), _at(120))
+    cache.get("ABC", "Left", _at(0), _at(30), source)
+    cache.get("ABC", "Left", _at(60), _at(90), source)
+    source.calls.clear()
+
+    got = cache.get("ABC", "Left", _at(10), _at(80), source)
+
+    pd.testing.assert_frame_equal(got, source.expected(_at(10), _at(80)))
+    assert source.calls == [(_at(30), _at(60))]
+    assert len(_files(cache)) == 1
+    # The merged piece serves the whole range
+    source.calls.clear()
+    got = cache.get("ABC", "Left", _at(0), _at(90), source)
+    pd.testing.assert_frame_equal(got, source.expected(_at(0), _at(90)))
+    assert source.calls == []
+
+
+def test_empty_range_is_cached(cache):
+    source = Source(_at(0), _at(10))
+    assert cache.get("ABC", "Left", _at(30), _at(40), source).empty
+    assert cache.get("ABC", "Left", _at(30), _at(40), source).empty
+    assert len(source.calls) == 1
+
+
+def test_fetch_error_is_not_cached(cache):
+    source = Source(_at(0), _at(60))
+
+    def failing(start, stop):
+        raise ConnectionError("InfluxDB down")
+
+    with pytest.raises(ConnectionError):
+        cache.get("ABC", "Left", _at(0), _at(30), failing)
+    pd.testing.assert_frame_equal(cache.get("ABC", "Left", _at(0), _at(30), source),
+                                  source.expected(_at(0), _at(30)))
+    assert len(source.calls) == 1
+
+
+def test_settle_horizon(home):
+    cache = SensorCache.from_config({"dir": "~/cache", "settle": "10min"})
+    now = pd.Timestamp.now(tz="UTC").floor("s")
+    start, stop = now - pd.Timedelta("1h"), now + pd.Timedelta("1min")
+    source = Source(start, stop)
+
+    got = cache.get("ABC", "Left", start, stop, source)
+
+    pd.testing.assert_frame_equal(got, source.expected(start, stop))
+    horizon = source.calls[-1][0]
+    assert abs(now - pd.Timedelta("10min") - horizon) < pd.Timedelta("1min")
+    # Only the settled part is stored; the recent part is read again every time
+    source.calls.clear()
+    got = cache.get("ABC", "Left", start, stop, source)
+    pd.testing.assert_frame_equal(got, source.expected(start, stop))
+    assert source.calls[-1][1] == stop
+    assert all(s >= horizon for s, _ in source.calls)
+    # A range entirely within the horizon is never stored
+    source.calls.clear()
+    recent = now - pd.Timedelta("5min")
+    cache.get("ABC", "Right", recent, now, source)
+    cache.get("ABC", "Right", recent, now, source)
+    assert source.calls == [(recent, now), (recent, now)]
+
+
+def test_lru_eviction(cache):
+    source = Source(_at(0), _at(240))
+    cache.get("ABC", "Left", _at(0), _at(30), source)
+    piece = cache.size()
+    cache.max_bytes = int(piece * 2.5)
+    cache.get("ABC", "Left", _at(60), _at(90), source)
+    cache.get("ABC", "Left", _at(0), _at(30), source)  # The first piece is used again
+    source.calls.clear()
+
+    cache.get("ABC", "Left", _at(120), _at(150), source)
+
+    assert len(_files(cache)) == 2
+    assert cache.size() <= cache.max_bytes
+    cache.get("ABC", "Left", _at(0), _at(30), source)
+    assert source.calls == [(_at(120), _at(150))]
+    cache.get("ABC", "Left", _at(60), _at(90), source)
+    assert source.calls[-1] == (_at(60), _at(90))
+
+
+def test_clear(cache):
+    source = Source(_at(0), _at(60))
+    cache.get("ABC", "Left", _at(0), _at(30), source)
+    cache.clear()
+    assert cache.size() == 0 and _files(cache) == []
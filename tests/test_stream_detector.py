@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from msGait.movement_detector import MovementDetector
+from msGait.stream_detector import StreamingMovementDetector
+from msGait.window_engine import WindowEngine
+
+
+@pytest.fixture(scope="module")
+def batch(dataset, data_manager):
+    """Segments of the Left leg found by MovementDetector."""
+    detector = MovementDetector(None, dataset.sampling_rate, verbose=0, load_segments=False,
+                                data_manager=data_manager)
+    codeid_id = data_manager.store_codeids(dataset.codeids)[dataset.codeids[0]][0]
+    row = {"start_time": dataset.start.tz_localize(None), "end_time": dataset.end.tz_localize(None),
+           "codeid_id": codeid_id, "foot": "Left"}
+    records, _ = detector._detect_leg(row)
+    return codeid_id, [(r["start_time"], r["end_time"]) for r in records]
+
+
+def _blocks(leg, rng, n):
+    cuts = np.sort(rng.choice(np.arange(1, len(leg)), n, replace=False))
+    return [leg.iloc[i:j] for i, j in zip(np.r_[0, cuts], np.r_[cuts, len(leg)])]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_matches_batch_detector(dataset, movement, batch, seed):
+    codeid_id, expected = batch
+    assert len(expected) > 1
+    leg = dataset.leg(dataset.codeids[0], "Left")
+    engine = WindowEngine.from_params(movement, dataset.sampling_rate)
+    detector = StreamingMovementDetector(engine, codeid_id, "Left")
+
+    records = list(detector.run(_blocks(leg, np.random.default_rng(seed), 60)))
+
+    assert [(r["start_time"], r["end_time"]) for r in records] == expected
+    assert all(r["leg"] == "Left" and r["codeid_id"] == codeid_id for r in records)
+
+
+def test_emits_before_the_end(dataset, movement, batch):
+    codeid_id, expected = batch
+    leg = dataset.leg(dataset.codeids[0], "Left")
+    detector = StreamingMovementDetector(WindowEngine.from_params(movement, dataset.sampling_rate),
+                                         codeid_id, "Left")
+    # max_gap_sec plus the open window and the one being filled
+    max_lag = pd.Timedelta(seconds=10 + 2 * 256 / dataset.sampling_rate)
+
+    emitted = []
+    for block in _blocks(leg, np.random.default_rng(0), 600):
+        first, last = (block["_time"].iloc[k].tz_localize(None) for k in (0, -1))
+        for r in detector.feed(block):
+            assert last - r["end_time"] <= max_lag + (last - first)
+            emitted.append((r["start_time"], r["end_time"]))
+    emitted += [(r["start_time"], r["end_time"]) for r in detector.flush()]
+
+    assert emitted == expected
+    assert len(emitted) > 1
+
+
+def test_ignores_replayed_samples(dataset, movement, batch):
+    codeid_id, expected = batch
+    leg = dataset.leg(dataset.codeids[0], "Left")
+    detector = StreamingMovementDetector(WindowEngine.from_params(movement, dataset.sampling_rate),
+                                         codeid_id, "Left")
+    blocks = _blocks(leg, np.random.default_rng(1), 40)
+    # Every block is sent twice: the second copy is not newer than the first
+    records = list(detector.run(b for block in blocks for b in (block, block)))
+
+    assert [(r["start_time"], r["end_time"]) for r in records] == expected
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from msTools.timeutils import time_slices
+
+T0 = pd.Timestamp("2024-03-31 00:30", tz="UTC")
+
+
+def _check_cover(slices, start, end, step):
+    assert slices[0][0] == start and slices[-1][1] == end
+    for (s0, e0), (s1, _) in zip(slices, slices[1:]):
+        assert e0 == s1
+    assert all(s < e <= s + step for s, e in slices)
+
+
+def test_exact_multiple():
+    slices = time_slices(T0, T0 + pd.Timedelta("90min"), "30min")
+    assert slices == [(T0, T0 + pd.Timedelta("30min")),
+                      (T0 + pd.Timedelta("30min"), T0 + pd.Timedelta("60min")),
+                      (T0 + pd.Timedelta("60min"), T0 + pd.Timedelta("90min"))]
+
+
+@pytest.mark.parametrize("extra", [pd.Timedelta(1, "ns"), pd.Timedelta("1s"), pd.Timedelta("29min")])
+def test_short_last_slice(extra):
+    end = T0 + pd.Timedelta("60min") + extra
+    slices = time_slices(T0, end, "30min")
+    assert len(slices) == 3
+    assert slices[-1] == (T0 + pd.Timedelta("60min"), end)
+
+
+def test_step_longer_than_range():
+    end = T0 + pd.Timedelta("10min")
+    assert time_slices(T0, end, "30min") == [(T0, end)]
+
+
+def test_no_step_or_empty_range():
+    end = T0 + pd.Timedelta("10h")
+    assert time_slices(T0, end, None) == [(T0, end)]
+    assert time_slices(T0, T0, "30min") == [(T0, T0)]
+    assert time_slices(end, T0, "30min") == [(end, T0)]
+
+
+@pytest.mark.parametrize("step", ["0s", "-5min"])
+def test_invalid_step(step):
+    with pytest.raises(ValueError):
+        time_slices(T0, T0 + pd.Timedelta("1h"), step)
+
+
+def test_keeps_timezone_and_naive():
+    assert time_slices(T0, T0 + pd.Timedelta("1h"), "20min")[1][0].tz is not None
+    naive = time_slices("2024-01-01 00:00", "2024-01-01 01:00", "20min")
+    assert naive[1] == (pd.Timestamp("2024-01-01 00:20"), pd.Timestamp("2024-01-01 00:40"))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_ranges_are_covered(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(200):
+        start = T0 + pd.Timedelta(int(rng.integers(0, 10**15)), "ns")
+        end = start + pd.Timedelta(int(rng.integers(1, 10**14)), "ns")
+        step = pd.Timedelta(int(rng.integers(10**9, 10**13)), "ns")
+        _check_cover(time_slices(start, end, step), start, end, step)
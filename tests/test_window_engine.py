@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from msGait.movement_detector import MovementDetector
+from msGait.window_engine import WindowEngine, WindowScanner
+
+
+def _per_window(engine, acc, gyro):
+    """Evaluates each window with the per-window MovementDetector checks."""
+    detector = SimpleNamespace(sampling_rate=engine.sampling_rate, freq_band=engine.freq_band,
+                               min_continuous_hits=engine.min_continuous_hits)
+    welch_ok = MovementDetector.is_effective_by_welch
+    time_ok = MovementDetector.is_effective_by_time
+    valid = []
+    for k in range(engine.n_windows(len(acc))):
+        a = acc[k * engine.hop:k * engine.hop + engine.window_size]
+        g = gyro[k * engine.hop:k * engine.hop + engine.window_size]
+        valid.append(
+            (welch_ok(detector, a, engine.accel_power_threshold)
+             and time_ok(detector, a - 1, engine.accel_threshold))
+            or (welch_ok(detector, g, engine.gyro_power_threshold)
+                and time_ok(detector, g, engine.gyro_threshold)))
+    return np.array(valid, dtype=bool)
+
+
+@pytest.mark.parametrize("hop", [None, 128, 64])
+def test_evaluate_matches_per_window(leg, movement, dataset, hop):
+    engine = WindowEngine.from_params(dict(movement, hop=hop), dataset.sampling_rate)
+    acc, gyro = leg["|a|"].to_numpy(), leg["|g|"].to_numpy()
+
+    valid = engine.evaluate(acc, gyro)
+
+    expected = _per_window(engine, acc, gyro)
+    assert valid.shape == expected.shape
+    assert expected.any() and not expected.all()
+    np.testing.assert_array_equal(valid, expected)
+
+
+@pytest.mark.parametrize("hop", [128, 64])
+def test_sliding_band_power_matches_welch(leg, movement, dataset, hop):
+    engine = WindowEngine.from_params(dict(movement, hop=hop), dataset.sampling_rate)
+    gyro = leg["|g|"].to_numpy()
+
+    np.testing.assert_allclose(engine.sliding_band_power(gyro),
+                               engine.band_power(engine.windows(gyro)), rtol=1e-9, atol=1e-9)
+
+
+def test_short_signal(movement):
+    engine = WindowEngine.from_params(movement, 50)
+    assert engine.evaluate(np.ones(100), np.zeros(100)).shape == (0,)
+    assert engine.candidate_spans(np.array([50, 50]), np.array([True, True])) == []
+
+
+@pytest.mark.parametrize("hop", [None, 64])
+def test_candidate_spans_keep_every_valid_window(leg, movement, dataset, hop):
+    rate = int(dataset.sampling_rate)
+    engine = WindowEngine.from_params(dict(movement, hop=hop), rate)
+    acc, gyro = leg["|a|"].to_numpy(), leg["|g|"].to_numpy()
+    valid = engine.evaluate(acc, gyro)
+    # One-second buckets, hot when some sample passes an activity threshold
+    counts = np.full(len(acc) // rate, rate)
+    hot = ((np.abs(acc - 1) > engine.accel_threshold)
+           | (gyro > engine.gyro_threshold))[:counts.sum()].reshape(-1, rate).any(axis=1)
+
+    covered = np.zeros_like(valid)
+    for b0, b1, k0, k1 in engine.candidate_spans(counts, hot):
+        assert b0 * rate <= k0 * engine.hop
+        assert k1 * engine.hop + engine.window_size <= (b1 + 1) * rate
+        covered[k0:k1 + 1] = True
+    n = engine.n_windows(counts.sum())
+    assert not (valid[:n] & ~covered[:n]).any()
+
+
+@pytest.mark.parametrize("hop", [None, 64])
+@pytest.mark.parametrize("chunk", [100, 256, 1000, 7777])
+def test_scanner_matches_whole_leg(leg, movement, dataset, hop, chunk):
+    engine = WindowEngine.from_params(dict(movement, hop=hop), dataset.sampling_rate)
+    times = leg["_time"].to_numpy()
+    acc, gyro = leg["|a|"].to_numpy(), leg["|g|"].to_numpy()
+    first, last = engine.valid_window_bounds(acc, gyro)
+
+    scanner = WindowScanner(engine)
+    starts, ends = [], []
+    for i in range(0, len(times), chunk):
+        s, e = scanner.feed(times[i:i + chunk], acc[i:i + chunk], gyro[i:i + chunk])
+        starts.append(s)
+        ends.append(e)
+
+    np.testing.assert_array_equal(np.concatenate(starts), times[first])
+    np.testing.assert_array_equal(np.concatenate(ends), times[last])
+    assert scanner.pending < engine.window_size